@@ -1,3 +1,5 @@
 from django.contrib import admin
+from .models import ChatbotSession, ChatbotMessage
 
-# Register your models here.
+admin.site.register(ChatbotSession)
+admin.site.register(ChatbotMessage)
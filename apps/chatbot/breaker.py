@@ -0,0 +1,140 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import openai
+from django.conf import settings
+
+from .limiter import LLMBusy, llm_slot
+from .metrics import registry, span
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of the last BREAKER_WINDOW LLM calls decide the breaker state: it opens
+# once at least BREAKER_MIN_CALLS were seen and BREAKER_FAILURE_RATE of them failed.
+# A call slower than BREAKER_SLOW_SECONDS counts as a failure even if it answered.
+BREAKER_WINDOW = getattr(settings, 'CHATBOT_BREAKER_WINDOW', 20)
+BREAKER_MIN_CALLS = getattr(settings, 'CHATBOT_BREAKER_MIN_CALLS', 5)
+BREAKER_FAILURE_RATE = getattr(settings, 'CHATBOT_BREAKER_FAILURE_RATE', 0.5)
+BREAKER_SLOW_SECONDS = getattr(settings, 'CHATBOT_BREAKER_SLOW_SECONDS', 15.0)
+# Seconds an open breaker rejects calls before letting one trial call through
+BREAKER_COOLDOWN = getattr(settings, 'CHATBOT_BREAKER_COOLDOWN', 30.0)
+
+# Vendor-side failures (network, timeouts, rate limits, 5xx). Other errors, such as
+# a 400 for a malformed request, are our bug and do not open the breaker.
+VENDOR_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class LLMUnavailable(LLMBusy):
+    """The circuit breaker is open: the LLM is not called until the cooldown passes"""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after, status=503, reason='circuit_open')
+
+
+# Errors a chatbot turn answers with the search-only fallback instead of failing
+DEGRADE_ON = (LLMUnavailable, *VENDOR_ERRORS)
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and their outcomes are recorded.
+    Open: calls fail at once with LLMUnavailable, for `cooldown` seconds.
+    Half-open: one trial call goes through; success closes the breaker,
+    failure opens it for another cooldown.
+    """
+
+    def __init__(self, window=None, min_calls=None, failure_rate=None, slow_seconds=None, cooldown=None):
+        self.min_calls = min_calls or BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate or BREAKER_FAILURE_RATE
+        self.slow_seconds = slow_seconds or BREAKER_SLOW_SECONDS
+        self.cooldown = cooldown or BREAKER_COOLDOWN
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window or BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        registry.increment('llm.breaker.opened')
+        logger.warning(f"LLM circuit breaker opened for {self.cooldown:g}s")
+
+    def allow(self):
+        """Whether a call may go out now (claims the trial call when half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def retry_after(self):
+        remaining = self.cooldown - (time.monotonic() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    def record(self, failure):
+        """Record a call outcome: True/False, or None when it says nothing about the vendor"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_running = False
+                if failure:
+                    self._open()
+                elif failure is not None:
+                    self.state = CLOSED
+                    logger.warning("LLM circuit breaker closed")
+                return
+            if self.state != CLOSED or failure is None:
+                return
+            self._outcomes.append(failure)
+            failures = sum(self._outcomes)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+                self._open()
+
+    @contextmanager
+    def guard(self):
+        """Run one LLM call through the breaker; raises LLMUnavailable while it is open"""
+        if not self.allow():
+            registry.increment('llm.rejected.circuit_open')
+            raise LLMUnavailable(self.retry_after())
+        failure = None
+        started = time.monotonic()
+        try:
+            yield
+            failure = time.monotonic() - started > self.slow_seconds
+        except VENDOR_ERRORS:
+            failure = True
+            raise
+        finally:
+            self.record(failure)
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                'state': self.state,
+                'calls': calls,
+                'failure_rate': sum(self._outcomes) / calls if calls else 0.0,
+            }
+
+
+llm_breaker = CircuitBreaker()
+
+
+@contextmanager
+def llm_call(name):
+    """One outbound LLM call: limiter slot, circuit breaker and a timing span named `name`"""
+    with llm_slot(), llm_breaker.guard(), span(name) as timing:
+        yield timing
@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+from openai import DefaultHttpxClient, OpenAI
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or getattr(settings, "OPENAI_API_KEY", None)
+
+# Connection pool / timeout / retry tuning for the outbound OpenAI calls.
+# A chatbot request makes up to five sequential calls (Whisper, vision, completion,
+# follow-up, TTS), so keeping connections alive between them and across requests
+# saves a TLS handshake per call.
+OPENAI_BASE_URL = getattr(settings, 'OPENAI_BASE_URL', None)
+OPENAI_MAX_CONNECTIONS = getattr(settings, 'OPENAI_MAX_CONNECTIONS', 20)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = getattr(settings, 'OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10)
+OPENAI_KEEPALIVE_EXPIRY = getattr(settings, 'OPENAI_KEEPALIVE_EXPIRY', 60.0)
+OPENAI_CONNECT_TIMEOUT = getattr(settings, 'OPENAI_CONNECT_TIMEOUT', 5.0)
+OPENAI_TIMEOUT = getattr(settings, 'OPENAI_TIMEOUT', 30.0)
+OPENAI_MAX_RETRIES = getattr(settings, 'OPENAI_MAX_RETRIES', 2)
+
+# LLM backends: "openai", "mock" (offline, deterministic; see mock_llm.py) or the
+# dotted path of a factory returning an object with the same surface as the OpenAI
+# client (chat.completions.create, audio.transcriptions.create, audio.speech.create)
+LLM_BACKENDS = {
+    'openai': 'apps.chatbot.client.build_openai_client',
+    'mock': 'apps.chatbot.mock_llm.MockLLMClient',
+}
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def build_openai_client(api_key=None, base_url=None):
+    """Create an OpenAI client backed by a tuned, keep-alive httpx connection pool"""
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+    return OpenAI(
+        api_key=api_key or OPENAI_API_KEY,
+        base_url=base_url or OPENAI_BASE_URL,
+        http_client=http_client,
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        max_retries=OPENAI_MAX_RETRIES,
+    )
+
+
+def llm_backend():
+    return getattr(settings, 'CHATBOT_LLM_BACKEND', 'openai')
+
+
+def llm_configured():
+    """Whether chatbot requests can be answered (a key for OpenAI, always for other backends)"""
+    return llm_backend() != 'openai' or bool(OPENAI_API_KEY)
+
+
+def get_llm_client():
+    """
+    Return the process-wide client of the configured backend, creating it on first use.
+    The client is rebuilt after a fork (gunicorn --preload) so workers never
+    share sockets, and creation is locked so threaded workers build it once.
+    httpx clients are thread-safe, so the instance is shared by all threads.
+    """
+    global _client, _client_key
+    key = (os.getpid(), llm_backend())
+    if _client is None or _client_key != key:
+        with _client_lock:
+            if _client is None or _client_key != key:
+                backend = key[1]
+                _client = import_string(LLM_BACKENDS.get(backend, backend))()
+                _client_key = key
+                logger.debug(f"Created {backend} LLM client for process {key[0]}")
+    return _client
+
+
+def reset_llm_client():
+    """Close and forget the shared client (used by tests and after settings changes)"""
+    global _client, _client_key
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _client_key = None
@@ -0,0 +1,67 @@
+import re
+
+from .metrics import registry
+from .result_cache import reply_language
+from .search import search_products
+
+# Request phrasing dropped from a message before it is searched directly
+# ("I need a calculator" -> "calculator", "عايز آلة حاسبة" -> "آلة حاسبة").
+# Location prepositions are kept so "ruler from giza" still filters by governorate.
+FILLER_WORDS = frozenset({
+    'i', 'im', "i'm", 'need', 'want', 'wanna', 'looking', 'look', 'for', 'a', 'an', 'the', 'some', 'any',
+    'do', 'you', 'have', 'has', 'is', 'are', 'there', 'please', 'can', 'could', 'find', 'me', 'my',
+    'search', 'buy', 'to', 'get', 'show', 'sell', 'selling', 'hi', 'hello', 'hey', 'thanks',
+    'عايز', 'عاوز', 'عايزة', 'عاوزة', 'محتاج', 'محتاجة', 'اريد', 'أريد', 'ابحث', 'دور', 'دورلي',
+    'ممكن', 'هل', 'يوجد', 'فيه', 'لو', 'سمحت', 'عندكم', 'عن', 'على', 'لي', 'مرحبا', 'شكرا',
+})
+WORD_PATTERN = re.compile(r"[\w']+")
+
+# Replies for searches answered without the LLM: the intent fast path (SEARCH_REPLIES)
+# and the degraded mode while the LLM is unavailable (FALLBACK_REPLIES)
+SEARCH_REPLIES = {
+    'en': {
+        'found': "Here is what I found for \"{query}\": {titles}.",
+        'empty': "I couldn't find products matching \"{query}\" right now. "
+                 "Try different words, or ask me for recommendations.",
+    },
+    'ar': {
+        'found': "هذه نتائج البحث عن \"{query}\": {titles}.",
+        'empty': "لم أجد منتجات تطابق \"{query}\" حالياً. جرّب كلمات أخرى أو اطلب مني ترشيحات.",
+    },
+}
+FALLBACK_REPLIES = {
+    'en': {
+        'found': "Our assistant is temporarily unavailable, but here is what I found for \"{query}\": {titles}.",
+        'empty': "Our assistant is temporarily unavailable and I couldn't find products matching \"{query}\". "
+                 "Please try again in a few minutes.",
+    },
+    'ar': {
+        'found': "المساعد غير متاح مؤقتاً، لكن هذه نتائج البحث عن \"{query}\": {titles}.",
+        'empty': "المساعد غير متاح مؤقتاً ولم أجد منتجات تطابق \"{query}\". حاول مرة أخرى بعد قليل.",
+    },
+}
+
+
+def search_query_from_message(message):
+    """The product words of a chat message (the message itself if nothing is left)"""
+    words = [word for word in WORD_PATTERN.findall(message.lower()) if word not in FILLER_WORDS]
+    return ' '.join(words) or message.strip()
+
+
+def local_search_turn(query, user_message, user, replies=SEARCH_REPLIES):
+    """
+    Search `query` directly and phrase the result with a fixed template in the
+    language of `user_message`. Returns (reply, products).
+    """
+    products = search_products(query, user)
+    templates = replies[reply_language(user_message)]
+    if not products:
+        return templates['empty'].format(query=query), products
+    titles = ', '.join(f"{product['title']} ({product['price']:g} EGP)" for product in products)
+    return templates['found'].format(query=query, titles=titles), products
+
+
+def fallback_turn(user_message, user):
+    """Answer without the LLM while it is unavailable: a direct search on the message"""
+    registry.increment('chatbot.degraded')
+    return local_search_turn(search_query_from_message(user_message), user_message, user, FALLBACK_REPLIES)
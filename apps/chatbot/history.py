@@ -0,0 +1,281 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from .breaker import llm_call
+from .limiter import LLMBusy, llm_slot
+from .models import ChatbotMessage, ChatbotSession
+from .pipeline import CHAT_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens the replayed conversation (summary + recent turns) may take
+HISTORY_TOKEN_BUDGET = getattr(settings, 'CHATBOT_HISTORY_TOKEN_BUDGET', 1500)
+# Upper bound for the running summary itself
+SUMMARY_MAX_TOKENS = getattr(settings, 'CHATBOT_SUMMARY_MAX_TOKENS', 300)
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Threads that summarize history after the response has gone out
+COMPACTION_WORKERS = getattr(settings, 'CHATBOT_COMPACTION_WORKERS', 2)
+# Seconds the first turn of a new conversation waits (in the cache) for the client
+# to continue it; the session row is only written once it does
+FIRST_TURN_TTL = getattr(settings, 'CHATBOT_FIRST_TURN_TTL', 60 * 60)
+# Seconds an idle session is kept before it is deleted
+SESSION_RETENTION = getattr(settings, 'CHATBOT_SESSION_RETENTION', 30 * 24 * 60 * 60)
+# Seconds between expired-session cleanups in one process
+PRUNE_EVERY = 10 * 60
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a student and the "
+    "Eagerly marketplace assistant. Merge the previous summary and the new messages "
+    "into one short summary (at most a few sentences) that keeps what the student is "
+    "looking for, their constraints (budget, condition, location) and products already "
+    "suggested. Write it in the language the student uses."
+)
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+# Sessions with a summary queued or running, so a busy session is summarized once
+_compacting = set()
+_last_prune = 0.0
+
+
+def _get_executor():
+    """Per-process summary worker pool (recreated after a fork)"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=COMPACTION_WORKERS, thread_name_prefix='chatbot-summary')
+                _executor_pid = pid
+                _compacting.clear()
+    return _executor
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) without needing a tokenizer"""
+    return (len(text or '') + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def _first_turn_key(key):
+    return f'chatbot:first-turn:{key}'
+
+
+def get_session(session_id, user):
+    """
+    The caller's session for `session_id`, or a new unsaved one if it is missing,
+    malformed or belongs to someone else. Anonymous sessions are only reachable
+    by their key. A key handed out for a one-turn conversation becomes a session
+    row (with that first turn) the first time the client sends it back.
+    """
+    if session_id:
+        try:
+            key = uuid.UUID(str(session_id))
+        except ValueError:
+            key = None
+        if key:
+            session = ChatbotSession.objects.filter(key=key, user=user).first()
+            if session:
+                return session
+            first_turn = cache.get(_first_turn_key(key))
+            if first_turn and first_turn['user_id'] == (user.id if user else None):
+                cache.delete(_first_turn_key(key))
+                session = ChatbotSession.objects.create(key=key, user=user)
+                _store_turn(session, *first_turn['turn'])
+                return session
+    return ChatbotSession(user=user)
+
+
+def build_history(session):
+    """
+    Chat messages to put between the system prompt and the new user message:
+    the running summary plus as many recent turns as fit HISTORY_TOKEN_BUDGET.
+    Turns (a user message and everything after it up to the next one) are kept
+    or dropped whole, so a reply never appears without the message it answers.
+    """
+    history = []
+    if session.pk is None:
+        return history
+    budget = HISTORY_TOKEN_BUDGET
+    if session.summary:
+        budget -= estimate_tokens(session.summary)
+
+    recent = (
+        ChatbotMessage.objects
+        .filter(session=session, id__gt=session.summarized_until)
+        .order_by('-id')
+        .values_list('role', 'content', 'token_count')
+    )
+    turn, turn_tokens = [], 0
+    for role, content, token_count in recent.iterator():
+        turn.append({"role": role, "content": content})
+        turn_tokens += token_count
+        if role != ChatbotMessage.ROLE_USER:
+            continue
+        budget -= turn_tokens
+        if budget < 0:
+            break
+        history.extend(turn)
+        turn, turn_tokens = [], 0
+    # Messages left in `turn` lost their user message to the summary (or the budget)
+    history.reverse()
+
+    if session.summary:
+        history.insert(0, {
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {session.summary}",
+        })
+    return history
+
+
+def remember_turn(session, user_message, reply):
+    """
+    Store one exchange of the conversation. The first exchange of a new session
+    is only cached: most one-shot visitors never come back with the session_id.
+    """
+    if session.pk is None:
+        cache.set(
+            _first_turn_key(session.key),
+            {'user_id': session.user_id, 'turn': (user_message, reply)},
+            FIRST_TURN_TTL,
+        )
+        return
+    _store_turn(session, user_message, reply)
+    session.save(update_fields=['updated_at'])
+    schedule_prune()
+
+
+def _store_turn(session, user_message, reply):
+    ChatbotMessage.objects.bulk_create([
+        ChatbotMessage(
+            session=session, role=ChatbotMessage.ROLE_USER,
+            content=user_message, token_count=estimate_tokens(user_message),
+        ),
+        ChatbotMessage(
+            session=session, role=ChatbotMessage.ROLE_ASSISTANT,
+            content=reply, token_count=estimate_tokens(reply),
+        ),
+    ])
+
+
+def prune_sessions():
+    """Delete sessions idle for longer than SESSION_RETENTION; returns how many went"""
+    cutoff = timezone.now() - timedelta(seconds=SESSION_RETENTION)
+    return ChatbotSession.objects.filter(updated_at__lt=cutoff).delete()[1].get(ChatbotSession._meta.label, 0)
+
+
+def schedule_prune():
+    """Prune idle sessions in the background, at most every PRUNE_EVERY seconds per process"""
+    global _last_prune
+    now = time.monotonic()
+    with _executor_lock:
+        if now - _last_prune < PRUNE_EVERY:
+            return
+        _last_prune = now
+    _get_executor().submit(_prune_in_worker)
+
+
+def _prune_in_worker():
+    try:
+        prune_sessions()
+    except Exception:
+        logger.exception("Could not prune chatbot sessions")
+    finally:
+        connections.close_all()
+
+
+def compact_history(session, client):
+    """
+    Fold the oldest unsummarized turns into the running summary once they exceed
+    the budget, keeping about half of it as verbatim recent history.
+    Summarizing in batches keeps this to an occasional extra completion.
+    """
+    try:
+        _compact_history(session, client)
+    except Exception as e:
+        # The budget is enforced when building the context anyway; retry next turn
+        logger.error(f"Chatbot history summary failed: {e}")
+
+
+def _pending_tokens(session):
+    pending = ChatbotMessage.objects.filter(session=session, id__gt=session.summarized_until)
+    return pending, pending.aggregate(total=Sum('token_count'))['total'] or 0
+
+
+def schedule_compaction(session, client):
+    """
+    Summarize the session in the background if it has outgrown the budget, so the
+    reply never waits on the extra completion. The summary takes a limiter slot.
+    """
+    if session.pk is None or _pending_tokens(session)[1] <= HISTORY_TOKEN_BUDGET - SUMMARY_MAX_TOKENS:
+        return
+    executor = _get_executor()
+    with _executor_lock:
+        if session.pk in _compacting:
+            return
+        _compacting.add(session.pk)
+    executor.submit(_compact_in_worker, session.pk, client)
+
+
+def _compact_in_worker(session_id, client):
+    try:
+        session = ChatbotSession.objects.filter(pk=session_id).first()
+        if session is not None:
+            with llm_slot():
+                compact_history(session, client)
+    except LLMBusy:
+        # No capacity right now; the next turn schedules it again
+        logger.debug(f"Chatbot history summary for session {session_id} skipped: LLM busy")
+    except Exception:
+        logger.exception(f"Chatbot history summary for session {session_id} failed")
+    finally:
+        with _executor_lock:
+            _compacting.discard(session_id)
+        # Worker threads get their own DB connections; don't leave them open
+        connections.close_all()
+
+
+def _compact_history(session, client):
+    pending, total = _pending_tokens(session)
+    budget = HISTORY_TOKEN_BUDGET - SUMMARY_MAX_TOKENS
+    if total <= budget:
+        return
+
+    folded = []
+    for message in pending.order_by('id').only('id', 'role', 'content', 'token_count'):
+        # Fold whole turns: stop only where the next turn starts
+        if total <= budget // 2 and message.role == ChatbotMessage.ROLE_USER:
+            break
+        folded.append(message)
+        total -= message.token_count
+    if not folded:
+        return
+
+    transcript = "\n".join(f"{message.role}: {message.content}" for message in folded)
+    with llm_call('summary') as timing:
+        completion = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Previous summary:\n{session.summary or '(none)'}\n\nNew messages:\n{transcript}"},
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        )
+        timing.add_usage(getattr(completion, 'usage', None))
+    session.summary = (completion.choices[0].message.content or '').strip()
+    session.summarized_until = folded[-1].id
+    session.save(update_fields=['summary', 'summarized_until', 'updated_at'])
@@ -0,0 +1,241 @@
+"""
+Local intent classifier for the chatbot fast path.
+
+Plain product lookups ("calculator", "lab coat in cairo", "عايز مسطرة") are
+answered by searching directly, without the two LLM round trips. A message
+takes the fast path only if no rule marks it as something else (support,
+recommendations, follow-ups on earlier results, questions, small talk) and a
+small logistic regression over hashed word/character features is confident
+it is a search. The model is trained in-process from TRAINING_EXAMPLES on
+first use (a few milliseconds); everything else goes to the LLM.
+"""
+import math
+import re
+import threading
+import zlib
+
+from django.conf import settings
+
+from .fallback import search_query_from_message
+from .metrics import registry
+
+FAST_PATH = getattr(settings, 'CHATBOT_INTENT_FAST_PATH', True)
+# Probability of "search" the model needs before the LLM is skipped
+FAST_PATH_THRESHOLD = getattr(settings, 'CHATBOT_INTENT_THRESHOLD', 0.75)
+# Longer messages usually carry context or conditions only the LLM handles
+MAX_WORDS = 8
+DIM = 4096
+EPOCHS = 40
+LEARNING_RATE = 0.5
+L2 = 1e-4
+
+WORD_RE = re.compile(r'\w+')
+
+# Messages that must reach the LLM, whatever the model says
+LLM_RULES = (
+    ('support', re.compile(
+        r'\b(refund\w*|complain\w*|supervisor|human|agent|support|account|order\w*|payment|pay|paid|'
+        r'deliver\w*|shipping|scam\w*|fraud|problem|issue|bug|error|password|login|report\w*|block\w*|'
+        r'sell|selling|list(?:ing)?|post|upload)\b'
+        r'|مشرف|شكوى|شكوي|طلبي|حسابي|مشكل|استرجاع|استرداد|الدفع|توصيل|ابيع|أبيع|نصب',
+        re.IGNORECASE,
+    )),
+    ('recommendation', re.compile(
+        r'\b(recommend\w*|suggest\w*|which|should|best|better|compare|vs|versus|difference|advice|advise)\b'
+        r'|رشح|اقترح|انسب|أنسب|افضل|أفضل|الفرق|انصح',
+        re.IGNORECASE,
+    )),
+    ('follow_up', re.compile(
+        r'\b(cheaper|another|other|others|more|second|third|first one|that one|this one|it|them|those|these|again)\b'
+        r'|ارخص|أرخص|تاني|غيره|غيرها|اللي|دول',
+        re.IGNORECASE,
+    )),
+    ('question', re.compile(r'\b(how|why|when|who|what|whats|what\'s)\b|ازاي|إزاي|ليه|امتى|مين|ايه|إيه', re.IGNORECASE)),
+    ('small_talk', re.compile(
+        r'^\W*(hi|hello|hey|thanks|thank you|ok|okay|yes|no|sure|bye|good (morning|evening)|'
+        r'مرحبا|شكرا|اهلا|أهلا|سلام|نعم|لا|ايوه|اه)\W*$',
+        re.IGNORECASE,
+    )),
+)
+
+# (message, is_search) pairs the model is trained on
+TRAINING_EXAMPLES = (
+    ('calculator', True),
+    ('scientific calculator', True),
+    ('casio calculator', True),
+    ('lab coat', True),
+    ('lab coat in cairo', True),
+    ('white lab coat size m', True),
+    ('ruler', True),
+    ('ruler from giza', True),
+    ('drawing board', True),
+    ('t-square', True),
+    ('arduino uno', True),
+    ('breadboard', True),
+    ('stethoscope', True),
+    ('anatomy atlas', True),
+    ('physics textbook', True),
+    ('used laptop', True),
+    ('graphing calculator alexandria', True),
+    ('i need a calculator', True),
+    ('i need a lab coat', True),
+    ('i want a microscope', True),
+    ('looking for a stethoscope', True),
+    ('looking for engineering tools in mansoura', True),
+    ('do you have a multimeter', True),
+    ('do you have drafting pens?', True),
+    ('any cheap calculators', True),
+    ('search for soldering iron', True),
+    ('find me a protractor', True),
+    ('need compass set', True),
+    ('safety goggles', True),
+    ('casio fx-991es', True),
+    ('آلة حاسبة', True),
+    ('الة حاسبة علمية', True),
+    ('بالطو معمل', True),
+    ('بالطو في القاهرة', True),
+    ('مسطرة', True),
+    ('عايز مسطرة', True),
+    ('عاوز آلة حاسبة', True),
+    ('محتاج سماعة طبية', True),
+    ('كتب تشريح', True),
+    ('لوحة رسم هندسي', True),
+    ('ميكروسكوب', True),
+    ('عندكم اردوينو', True),
+    ('ابحث عن كتاب كيمياء', True),
+    ('hello', False),
+    ('thanks a lot', False),
+    ('how do i sell my calculator', False),
+    ('my order did not arrive', False),
+    ('i want a refund', False),
+    ('talk to a human please', False),
+    ('the seller did not answer me', False),
+    ('recommend something for first year engineering', False),
+    ('what should i buy for anatomy', False),
+    ('which calculator is better for exams', False),
+    ('compare the casio and the canon', False),
+    ('is this seller trustworthy', False),
+    ('why is my account blocked', False),
+    ('how does delivery work', False),
+    ('can you show me cheaper ones', False),
+    ('show me more', False),
+    ('the second one please', False),
+    ('is it still available', False),
+    ('tell me about your store', False),
+    ('what can you do', False),
+    ('yes', False),
+    ('no thanks', False),
+    ('can you help me', False),
+    ('i need help', False),
+    ('i am a medical student at cairo university what do i need', False),
+    ('can i pay cash on delivery', False),
+    ('مرحبا', False),
+    ('شكرا جدا', False),
+    ('عايز اكلم مشرف', False),
+    ('فين طلبي', False),
+    ('ازاي ابيع حاجة', False),
+    ('ايه الفرق بين الاتنين', False),
+    ('رشحلي حاجة لسنة اولى', False),
+    ('البائع مش بيرد', False),
+    ('عندي مشكلة في حسابي', False),
+    ('في حاجة ارخص', False),
+)
+
+
+def _features(text):
+    """Hashed feature indices of a message: words, word pairs, character trigrams and its length"""
+    words = WORD_RE.findall(text.lower())
+    features = [f'w:{word}' for word in words]
+    features.extend(f'b:{first} {second}' for first, second in zip(words, words[1:]))
+    for word in words:
+        padded = f' {word} '
+        features.extend(f'c:{padded[i:i + 3]}' for i in range(len(padded) - 2))
+    features.append(f'n:{min(len(words), MAX_WORDS + 1)}')
+    features.append('bias')
+    return [zlib.crc32(feature.encode('utf-8')) & (DIM - 1) for feature in features]
+
+
+def _sigmoid(value):
+    if value < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+def train(examples=TRAINING_EXAMPLES):
+    """Logistic regression weights (a list of DIM floats) fitted with plain SGD"""
+    weights = [0.0] * DIM
+    samples = [(_features(text), 1.0 if is_search else 0.0) for text, is_search in examples]
+    for _ in range(EPOCHS):
+        for indices, label in samples:
+            error = _sigmoid(sum(weights[index] for index in indices)) - label
+            step = LEARNING_RATE * error / len(indices)
+            for index in indices:
+                weights[index] -= step + LEARNING_RATE * L2 * weights[index]
+    return weights
+
+
+_weights = None
+_weights_lock = threading.Lock()
+
+
+def _model():
+    global _weights
+    if _weights is None:
+        with _weights_lock:
+            if _weights is None:
+                _weights = train()
+    return _weights
+
+
+def search_probability(message):
+    weights = _model()
+    return _sigmoid(sum(weights[index] for index in _features(message)))
+
+
+class Intent:
+    """Routing decision for one message: fast_path with its search query, or the LLM and why"""
+
+    def __init__(self, fast_path, reason, score=None, query=None):
+        self.fast_path = fast_path
+        self.reason = reason
+        self.score = score
+        self.query = query
+
+    def __repr__(self):
+        return f'Intent(fast_path={self.fast_path}, reason={self.reason!r}, score={self.score}, query={self.query!r})'
+
+
+def classify_intent(message):
+    """Decide whether `message` is a plain product search the chatbot can answer locally"""
+    message = (message or '').strip()
+    if not FAST_PATH:
+        return Intent(False, 'disabled')
+    if not message or '[The user also attached an image' in message:
+        return Intent(False, 'not_text')
+    words = WORD_RE.findall(message)
+    if len(words) > MAX_WORDS:
+        return Intent(False, 'long')
+    for reason, pattern in LLM_RULES:
+        if pattern.search(message):
+            return Intent(False, reason)
+    score = search_probability(message)
+    if score < FAST_PATH_THRESHOLD:
+        return Intent(False, 'model', score)
+    query = search_query_from_message(message)
+    if not WORD_RE.search(query):
+        return Intent(False, 'no_query', score)
+    return Intent(True, 'search', score, query)
+
+
+def record_route(intent):
+    registry.increment('intent.fast_path' if intent.fast_path else 'intent.llm')
+    if not intent.fast_path:
+        registry.increment(f'intent.llm.{intent.reason}')
+
+
+def intent_stats():
+    """Share of chatbot turns answered on the fast path in this process"""
+    counters = registry.snapshot()['counters']
+    fast = counters.get('intent.fast_path', 0)
+    total = fast + counters.get('intent.llm', 0)
+    return {'turns': total, 'fast_path': fast, 'fast_path_ratio': fast / total if total else 0.0}
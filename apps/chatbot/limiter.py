@@ -0,0 +1,224 @@
+import contextvars
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import registry, span
+
+# Chatbot turns and other outbound LLM calls (summaries, TTS) allowed at once in
+# this process, and how many more may wait for a slot before new ones are turned away
+LLM_CONCURRENCY = getattr(settings, 'CHATBOT_LLM_CONCURRENCY', 4)
+LLM_QUEUE_SIZE = getattr(settings, 'CHATBOT_LLM_QUEUE_SIZE', 8)
+# Seconds a call waits for a slot before giving up with a 503
+LLM_QUEUE_TIMEOUT = getattr(settings, 'CHATBOT_LLM_QUEUE_TIMEOUT', 10.0)
+# Calls one visitor may have running or waiting; more get a 429
+LLM_PER_USER = getattr(settings, 'CHATBOT_LLM_PER_USER', 2)
+# Optional limit across all workers, kept as slot keys in the shared cache
+# (only meaningful with a cache shared between processes, e.g. Redis or memcached)
+LLM_GLOBAL_CONCURRENCY = getattr(settings, 'CHATBOT_LLM_GLOBAL_CONCURRENCY', None)
+# A global slot expires after this many seconds if its worker died holding it
+LLM_SLOT_TTL = getattr(settings, 'CHATBOT_LLM_SLOT_TTL', 120)
+GLOBAL_SLOT_POLL = 0.05
+
+# Who the current LLM calls are made for (see caller()); None for background work
+_current_caller = contextvars.ContextVar('chatbot_llm_caller', default=None)
+# Set while the current context holds a slot, so nested slot() calls pass through
+_holding = contextvars.ContextVar('chatbot_llm_holding', default=False)
+
+
+class LLMBusy(Exception):
+    """No LLM capacity for this call; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after, status=503, reason='queue_full'):
+        super().__init__(f"LLM capacity exhausted ({reason}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.status = status
+        self.reason = reason
+
+
+class _Waiter:
+    def __init__(self, key):
+        self.key = key
+        self.granted = False
+        self.event = threading.Event()
+
+
+class LLMLimiter:
+    """
+    Counting semaphore for outbound LLM calls with a bounded wait queue.
+    Waiting calls are granted round-robin across callers, so one visitor firing
+    many requests cannot hold back everyone else, and each caller may have at
+    most `per_user` calls running or queued. When the queue is full, the call
+    fails right away with LLMBusy instead of parking another worker thread.
+    """
+
+    def __init__(self, concurrency=None, queue_size=None, queue_timeout=None, per_user=None,
+                 global_concurrency=None):
+        self.concurrency = concurrency or LLM_CONCURRENCY
+        self.queue_size = LLM_QUEUE_SIZE if queue_size is None else queue_size
+        self.queue_timeout = queue_timeout or LLM_QUEUE_TIMEOUT
+        self.per_user = per_user or LLM_PER_USER
+        self.global_concurrency = global_concurrency or LLM_GLOBAL_CONCURRENCY
+        self._lock = threading.Lock()
+        self._active = 0
+        self._pending = {}
+        self._waiting = {}
+        self._rotation = deque()
+        self._queued = 0
+        # Moving average of how long a call holds its slot, for Retry-After
+        self._hold_seconds = 2.0
+
+    def retry_after(self):
+        """Seconds until the current queue should have drained (at least 1)"""
+        return max(1, math.ceil((self._queued + 1) * self._hold_seconds / self.concurrency))
+
+    def _check(self, key):
+        """Raise LLMBusy if `key` may not queue another call (caller holds the lock)"""
+        if key is not None and self._pending.get(key, 0) >= self.per_user:
+            registry.increment('llm.rejected.per_user')
+            raise LLMBusy(self.retry_after(), status=429, reason='per_user')
+        if self._active >= self.concurrency and self._queued >= self.queue_size:
+            registry.increment('llm.rejected.queue_full')
+            raise LLMBusy(self.retry_after())
+
+    def admit(self, key):
+        """Fail fast, before any work is done for a request, if its calls would be rejected"""
+        with self._lock:
+            self._check(key)
+
+    def _acquire(self, key):
+        with self._lock:
+            self._check(key)
+            self._pending[key] = self._pending.get(key, 0) + 1
+            # Free slot and nobody waiting: go ahead without queueing
+            if self._active < self.concurrency and not self._queued:
+                self._active += 1
+                return
+            waiter = _Waiter(key)
+            if key not in self._waiting:
+                self._waiting[key] = deque()
+                self._rotation.append(key)
+            self._waiting[key].append(waiter)
+            self._queued += 1
+
+        if waiter.event.wait(self.queue_timeout):
+            return
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiting[key].remove(waiter)
+            if not self._waiting[key]:
+                del self._waiting[key]
+                self._rotation.remove(key)
+            self._queued -= 1
+            self._forget(key)
+            registry.increment('llm.rejected.timeout')
+            raise LLMBusy(self.retry_after(), reason='timeout')
+
+    def _forget(self, key):
+        self._pending[key] -= 1
+        if not self._pending[key]:
+            del self._pending[key]
+
+    def _release(self, key, held_seconds=None):
+        with self._lock:
+            self._active -= 1
+            self._forget(key)
+            if held_seconds is not None:
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+            # Hand free slots to the waiting callers in turn
+            while self._active < self.concurrency and self._rotation:
+                next_key = self._rotation.popleft()
+                waiter = self._waiting[next_key].popleft()
+                if self._waiting[next_key]:
+                    self._rotation.append(next_key)
+                else:
+                    del self._waiting[next_key]
+                self._queued -= 1
+                self._active += 1
+                waiter.granted = True
+                waiter.event.set()
+
+    def _acquire_global(self):
+        """Take one of the cross-process slot keys, polling until the queue timeout"""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            for index in range(self.global_concurrency):
+                slot_key = f'chatbot:llm-slot:{index}'
+                if cache.add(slot_key, token, LLM_SLOT_TTL):
+                    return slot_key, token
+            if time.monotonic() >= deadline:
+                registry.increment('llm.rejected.global')
+                raise LLMBusy(self.retry_after(), reason='global')
+            time.sleep(GLOBAL_SLOT_POLL)
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold an LLM call slot for the current caller while the block runs.
+        Re-entrant: a chatbot turn takes one slot and the calls inside it reuse it.
+        """
+        if _holding.get():
+            yield
+            return
+        key = _current_caller.get()
+        with span('llm_queue'):
+            self._acquire(key)
+            global_slot = None
+            if self.global_concurrency:
+                try:
+                    global_slot = self._acquire_global()
+                except LLMBusy:
+                    self._release(key)
+                    raise
+        started = time.monotonic()
+        token = _holding.set(True)
+        try:
+            yield
+        finally:
+            _holding.reset(token)
+            if global_slot is not None:
+                slot_key, token = global_slot
+                if cache.get(slot_key) == token:
+                    cache.delete(slot_key)
+            self._release(key, time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'queued': self._queued,
+                'concurrency': self.concurrency,
+                'queue_size': self.queue_size,
+                'hold_seconds': round(self._hold_seconds, 2),
+            }
+
+
+llm_limiter = LLMLimiter()
+
+
+@contextmanager
+def caller(key):
+    """Attribute the LLM calls made inside the block to `key` (per-user fairness)"""
+    token = _current_caller.set(key)
+    try:
+        yield key
+    finally:
+        _current_caller.reset(token)
+
+
+def admit(key):
+    """Reject a request up front (LLMBusy) if the limiter would turn its calls away"""
+    llm_limiter.admit(key)
+
+
+def llm_slot():
+    """Slot of the process-wide limiter; wrap every outbound LLM call (or whole turn) in it"""
+    return llm_limiter.slot()
@@ -0,0 +1,192 @@
+import re
+
+# Egyptian governorates: canonical name (as stored in Product.governorate) ->
+# English spellings/transliterations and Arabic names. English "el"/"al" articles
+# and Arabic attached prefixes (و ب ف ل) are handled by the pattern, not listed here.
+GOVERNORATES = {
+    'cairo': ('cairo', 'kairo', 'qahira', 'qahirah', 'kahera'),
+    'giza': ('giza', 'gizah', 'geeza', 'jizah', 'gizeh'),
+    'alexandria': ('alexandria', 'alex', 'iskandariya', 'iskandariyah', 'eskendereya', 'eskenderiya', 'alexandrie'),
+    'aswan': ('aswan', 'asswan', 'assuan'),
+    'asyut': ('asyut', 'assiut', 'assiout', 'asiut', 'assyut', 'asyout'),
+    'beheira': ('beheira', 'behera', 'buhayrah', 'bohaira'),
+    'beni suef': ('beni suef', 'beni sweif', 'bani suwayf', 'beni swaif', 'benisuef'),
+    'dakahlia': ('dakahlia', 'dakahleya', 'daqahliyah', 'dakahliya', 'daqahlia'),
+    'damietta': ('damietta', 'dumyat', 'domyat', 'damiata'),
+    'faiyum': ('faiyum', 'fayoum', 'fayum', 'fayyum'),
+    'gharbia': ('gharbia', 'gharbiya', 'gharbeya', 'gharbiyah'),
+    'ismailia': ('ismailia', 'ismailiya', 'ismaileya', 'ismailiyah'),
+    'kafr el-sheikh': ('kafr el sheikh', 'kafr elsheikh', 'kafr al shaykh', 'kafr el shaikh', 'kafrelsheikh'),
+    'luxor': ('luxor', 'uqsur', 'loxor'),
+    'matruh': ('matruh', 'matrouh', 'marsa matruh', 'mersa matruh'),
+    'minya': ('minya', 'menia', 'minia', 'menya'),
+    'monufia': ('monufia', 'menoufia', 'minufiya', 'menofia', 'monofia', 'menoufeya'),
+    'new valley': ('new valley', 'wadi el gedid', 'wadi al jadid'),
+    'north sinai': ('north sinai', 'shamal sina'),
+    'port said': ('port said', 'portsaid', 'bur said', 'por said'),
+    'qalyubia': ('qalyubia', 'qalyubiya', 'kalyubia', 'qaliubiya', 'qalubia', 'kalyoubeya'),
+    'qena': ('qena', 'qina', 'kena'),
+    'red sea': ('red sea', 'bahr el ahmar', 'bahr al ahmar'),
+    'sharqia': ('sharqia', 'sharkia', 'sharqiya', 'sharkeya', 'sharqiyah'),
+    'sohag': ('sohag', 'suhag', 'sohaj', 'suhaj'),
+    'south sinai': ('south sinai', 'ganub sina', 'janub sina'),
+    'suez': ('suez', 'suweis', 'suways'),
+}
+
+GOVERNORATES_AR = {
+    'cairo': ('القاهرة',),
+    'giza': ('الجيزة',),
+    'alexandria': ('الإسكندرية', 'إسكندرية'),
+    'aswan': ('أسوان',),
+    'asyut': ('أسيوط',),
+    'beheira': ('البحيرة',),
+    'beni suef': ('بني سويف',),
+    'dakahlia': ('الدقهلية',),
+    'damietta': ('دمياط',),
+    'faiyum': ('الفيوم',),
+    'gharbia': ('الغربية',),
+    'ismailia': ('الإسماعيلية',),
+    'kafr el-sheikh': ('كفر الشيخ',),
+    'luxor': ('الأقصر',),
+    'matruh': ('مطروح',),
+    'minya': ('المنيا',),
+    'monufia': ('المنوفية',),
+    'new valley': ('الوادي الجديد',),
+    'north sinai': ('شمال سيناء',),
+    'port said': ('بورسعيد', 'بور سعيد'),
+    'qalyubia': ('القليوبية',),
+    'qena': ('قنا',),
+    'red sea': ('البحر الأحمر',),
+    'sharqia': ('الشرقية',),
+    'sohag': ('سوهاج',),
+    'south sinai': ('جنوب سيناء',),
+    'suez': ('السويس',),
+}
+
+# Prepositions that mark a location ("ruler from giza", "مسطرة في الجيزة");
+# they are stripped together with the name and an optional "the" before it
+LOCATION_PREPOSITIONS = ('from', 'in', 'at', 'near', 'around', 'في', 'من', 'عند')
+ENGLISH_ARTICLES = ('el', 'al')
+
+# One-to-one character folding, so token offsets stay valid on the lowercased text:
+# hyphens/underscores -> space, Arabic alef/yaa/taa marbuta variants
+_FOLD = str.maketrans({
+    '-': ' ', '_': ' ',
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ى': 'ي', 'ة': 'ه',
+})
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def fold_location_text(text):
+    """Lowercase and fold spelling variants; same length as text.lower()"""
+    return text.lower().translate(_FOLD)
+
+
+def _arabic_first_words(word):
+    """Arabic name with the prefixes that attach to it: و (and), ب/ف/ك/ل (in, at, like, to)"""
+    if word.startswith('ال'):
+        # "القاهرة", "بالقاهرة", "والقاهرة", "للقاهرة"
+        stems = ['ال', 'بال', 'فال', 'كال', 'لل']
+        base = word[2:]
+    else:
+        stems = ['', 'ب', 'ف', 'ل']
+        base = word
+    return [conjunction + stem + base for conjunction in ('', 'و') for stem in stems]
+
+
+def _build_phrases():
+    """Word tuple -> governorate, for every spelling and prefixed form"""
+    phrases = {}
+    for canonical, variants in GOVERNORATES.items():
+        for variant in variants:
+            words = fold_location_text(variant).split()
+            phrases[tuple(words)] = canonical
+            # Article glued to the name: "elgiza", "elfayoum" (spaced "el giza" is handled by the scanner)
+            for article in ENGLISH_ARTICLES:
+                phrases[(article + words[0], *words[1:])] = canonical
+        for variant in GOVERNORATES_AR.get(canonical, ()):
+            first, *rest = fold_location_text(variant).split()
+            for form in _arabic_first_words(first):
+                phrases[(form, *rest)] = canonical
+    return phrases
+
+
+# Module-level lookup tables: a query is tokenized once and scanned left to right,
+# trying the longest phrase at each word (dictionary lookups, no per-call setup)
+LOCATION_PHRASES = _build_phrases()
+MAX_PHRASE_WORDS = max(len(words) for words in LOCATION_PHRASES)
+_FIRST_WORDS = frozenset(words[0] for words in LOCATION_PHRASES)
+_PREPOSITIONS = frozenset(fold_location_text(p) for p in LOCATION_PREPOSITIONS)
+_ARTICLES = frozenset(ENGLISH_ARTICLES)
+
+
+def find_locations(query):
+    """(governorate, start, end, has_preposition) for every location mentioned in query"""
+    folded = fold_location_text(query)
+    words = WORD_PATTERN.findall(folded)
+    # Most queries name no place: one set check, no scanning
+    if _FIRST_WORDS.isdisjoint(words):
+        return []
+    tokens = [(match.start(), match.end()) for match in WORD_PATTERN.finditer(folded)]
+    found = []
+    i = 0
+    while i < len(tokens):
+        match = None
+        # An optional spaced article before the name: "el fayoum", "al minya"
+        for start in (i, i + 1) if words[i] in _ARTICLES else (i,):
+            if start < len(tokens) and words[start] in _FIRST_WORDS:
+                for size in range(min(MAX_PHRASE_WORDS, len(tokens) - start), 0, -1):
+                    canonical = LOCATION_PHRASES.get(tuple(words[start:start + size]))
+                    if canonical:
+                        match = canonical, start + size
+                        break
+            if match:
+                break
+        if not match:
+            i += 1
+            continue
+
+        canonical, end = match
+        first = i
+        # "the" goes with the name: "in the new valley", "from the red sea"
+        if first > 0 and words[first - 1] == 'the':
+            first -= 1
+        has_preposition = first > 0 and words[first - 1] in _PREPOSITIONS
+        if has_preposition:
+            first -= 1
+        found.append((canonical, tokens[first][0], tokens[end - 1][1], has_preposition))
+        i = end
+    return found
+
+
+def split_location(query):
+    """
+    (governorate, query without location phrases) in one pass; see
+    parse_location_from_query and strip_locations.
+    """
+    query = query.lower()
+    locations = find_locations(query)
+    if not locations:
+        return None, ' '.join(query.split())
+
+    location = next((name for name, _, _, has_preposition in locations if has_preposition), locations[0][0])
+    parts = []
+    position = 0
+    for _, start, end, _ in locations:
+        parts.append(query[position:start])
+        position = end
+    parts.append(query[position:])
+    return location, ' '.join(''.join(parts).split())
+
+
+def parse_location_from_query(query):
+    """
+    Governorate the user asks for, or None. A name introduced by a preposition
+    ("from giza", "في الجيزة") wins over a bare mention; otherwise the first one.
+    """
+    return split_location(query)[0]
+
+
+def strip_locations(query):
+    """Lowercased query with the location phrases (and their prepositions) removed"""
+    return split_location(query)[1]
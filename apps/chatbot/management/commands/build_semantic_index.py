@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.products.models import Product
+from apps.chatbot import semantic
+
+
+class Command(BaseCommand):
+    help = 'Build the offline semantic search index of active products used by the chatbot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help=f'Index file (default: {semantic.INDEX_PATH})')
+        parser.add_argument('--query', help='Show the closest products for a test query after building')
+
+    def handle(self, *args, **options):
+        if semantic.np is None:
+            raise CommandError('NumPy is required for the semantic index (pip install numpy)')
+
+        path = options['path'] or semantic.INDEX_PATH
+        started = time.perf_counter()
+        products = Product.objects.filter(status='active').select_related('category')
+        count = semantic.build_index(products, path=path)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} active products into {path} in {elapsed:.2f}s'))
+
+        if options['query']:
+            started = time.perf_counter()
+            matches = semantic.similar_products(options['query'], limit=5, path=path)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(f"Closest to '{options['query']}' ({elapsed:.1f} ms):")
+            titles = dict(Product.objects.filter(id__in=[pid for pid, _ in matches]).values_list('id', 'title'))
+            for product_id, score in matches:
+                self.stdout.write(f'  {score:.2f}  #{product_id} {titles.get(product_id, "")}')
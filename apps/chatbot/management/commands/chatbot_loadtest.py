@@ -0,0 +1,213 @@
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.chatbot.client import get_llm_client, reset_llm_client
+from apps.chatbot.metrics import registry
+from apps.chatbot.models import ChatbotSession
+from apps.chatbot.result_cache import invalidate_search_cache
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the full chatbot pipeline (views, tools, DB search, serialization, base64) '
+        'against the offline mock LLM backend, reporting our own overhead separately from the '
+        'simulated vendor latency. Runs against the configured database; created chatbot '
+        'sessions are removed afterwards unless --keep-sessions is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Total requests to send')
+        parser.add_argument('--concurrency', type=int, default=4, help='Parallel client threads')
+        parser.add_argument('--message', default='I need a calculator', help='Message to send')
+        parser.add_argument('--stream', action='store_true', help='Use the server-sent events endpoint')
+        parser.add_argument('--image', help='Attach this image file to every request')
+        parser.add_argument('--audio', help='Send this audio file instead of a text message')
+        parser.add_argument('--tts', action='store_true', help='Request TTS and download the audio')
+        parser.add_argument('--latency', type=float, default=None,
+                            help='Simulated seconds per completion (default: CHATBOT_MOCK_LATENCY)')
+        parser.add_argument('--no-latency', action='store_true', help='Disable all simulated vendor latency')
+        parser.add_argument('--cold', action='store_true', help='Expire the chatbot search cache before each request')
+        parser.add_argument('--keep-sessions', action='store_true', help='Keep the chatbot sessions created')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        uploads = {}
+        for field in ('image', 'audio'):
+            if options[field]:
+                with open(options[field], 'rb') as f:
+                    uploads[field] = (options[field].rsplit('/', 1)[-1], f.read())
+
+        with override_settings(CHATBOT_LLM_BACKEND='mock', ALLOWED_HOSTS=['*']):
+            reset_llm_client()
+            backend = get_llm_client()
+            if options['no_latency']:
+                backend.latency = {kind: 0 for kind in backend.latency}
+            elif options['latency'] is not None:
+                backend.latency['completion'] = options['latency']
+            registry.reset()
+            try:
+                results, session_keys = self._run(backend, uploads, options)
+            finally:
+                reset_llm_client()
+
+        if not options['keep_sessions'] and session_keys:
+            ChatbotSession.objects.filter(key__in=session_keys).delete()
+        self._report(results, options)
+
+    def _run(self, backend, uploads, options):
+        url = reverse('chatbot-stream' if options['stream'] else 'chatbot')
+        remaining = iter(range(options['requests']))
+        lock = threading.Lock()
+        results = []
+        session_keys = []
+
+        def worker(number):
+            # One address per thread: each acts as a separate visitor for the LLM limiter
+            client = Client(REMOTE_ADDR=f'10.0.{number // 256}.{number % 256}')
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    if options['cold']:
+                        invalidate_search_cache()
+                    result, session_key = self._request(client, backend, url, uploads, options)
+                    with lock:
+                        results.append(result)
+                        if session_key:
+                            session_keys.append(session_key)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - started
+        return results, session_keys
+
+    def _request(self, client, backend, url, uploads, options):
+        data = {'tts': 'true' if options['tts'] else 'false'}
+        if 'audio' not in uploads:
+            data['message'] = options['message']
+        for field, (name, content) in uploads.items():
+            data[field] = SimpleUploadedFile(name, content)
+
+        vendor_before = backend.simulated_seconds()
+        first_event = None
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.post(url, data)
+            if response.streaming:
+                body = []
+                for chunk in response.streaming_content:
+                    if first_event is None and (b'event: products' in chunk or b'event: delta' in chunk):
+                        first_event = time.perf_counter() - started
+                    body.append(chunk)
+                payload = self._stream_payload(b''.join(body).decode('utf-8'))
+            else:
+                payload = response.json()
+            audio_url = payload.get('audio_url')
+            if audio_url:
+                audio = client.get(urlparse(audio_url).path)
+                payload['audio_bytes'] = len(audio.content)
+            wall = time.perf_counter() - started
+
+        vendor = backend.simulated_seconds() - vendor_before
+        session_key = payload.get('session_id')
+        return {
+            'ok': response.status_code == 200 and 'error' not in payload,
+            'status': response.status_code,
+            'wall': wall,
+            'vendor': vendor,
+            'overhead': max(wall - vendor, 0.0),
+            'first_event': first_event,
+            'queries': len(queries),
+            'products': len(payload.get('products') or []),
+        }, session_key
+
+    @staticmethod
+    def _stream_payload(text):
+        """Merge the session and done/error events of an SSE body into one dict"""
+        payload = {}
+        for block in text.split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+            if lines.get('event') in ('session', 'done', 'error', 'audio'):
+                payload.update(json.loads(lines['data']))
+        return payload
+
+    def _report(self, results, options):
+        ok = [result for result in results if result['ok']]
+        failed = len(results) - len(ok)
+        self.stdout.write(
+            f"{len(results)} requests, concurrency {options['concurrency']}, "
+            f"{self.elapsed:.2f}s total, {len(results) / self.elapsed:.1f} req/s"
+        )
+        if failed:
+            statuses = sorted({result['status'] for result in results if not result['ok']})
+            self.stdout.write(self.style.ERROR(f"{failed} failed (status {', '.join(map(str, statuses))})"))
+        if not ok:
+            return
+
+        rows = [('total', 'wall'), ('vendor (simulated)', 'vendor'), ('our overhead', 'overhead')]
+        if options['stream']:
+            rows.append(('first products/delta', 'first_event'))
+        self.stdout.write(f"{'':22}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for label, key in rows:
+            values = [result[key] * 1000 for result in ok if result[key] is not None]
+            self.stdout.write(
+                f"{label:22}" + "".join(
+                    f"{value:>8.1f}ms" for value in (
+                        percentile(values, 0.5), percentile(values, 0.95),
+                        percentile(values, 0.99), max(values, default=0.0),
+                    )
+                )
+            )
+        queries = [result['queries'] for result in ok]
+        products = [result['products'] for result in ok]
+        self.stdout.write(
+            f"DB queries per request (request thread): {percentile(queries, 0.5)} median, {max(queries)} max; "
+            f"products returned: {percentile(products, 0.5)} median"
+        )
+        self._report_stages()
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def _report_stages(self):
+        """Server-side stage histograms (bucket upper bounds) collected during the run"""
+        snapshot = registry.snapshot()
+        stages = snapshot['stages']
+        if not stages:
+            return
+        if snapshot['counters']:
+            self.stdout.write(', '.join(f"{name}: {count}" for name, count in snapshot['counters'].items()))
+        width = max(22, max(map(len, stages)) + 2)
+        self.stdout.write(
+            f"{'stage':{width}}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>10}"
+            f"{'prompt tok':>12}{'cached':>10}{'compl. tok':>12}"
+        )
+        for name, stage in stages.items():
+            self.stdout.write(
+                f"{name:{width}}{stage['count']:>8}{stage['p50_ms']:>8.1f}ms{stage['p95_ms']:>8.1f}ms"
+                f"{stage['p99_ms']:>8.1f}ms{stage['queries']:>10}"
+                f"{stage['prompt_tokens']:>12}{stage['cached_tokens']:>10}{stage['completion_tokens']:>12}"
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from apps.chatbot import history
+
+
+class Command(BaseCommand):
+    help = 'Delete chatbot sessions idle for longer than CHATBOT_SESSION_RETENTION (run from cron)'
+
+    def handle(self, *args, **options):
+        deleted = history.prune_sessions()
+        days = history.SESSION_RETENTION / 86400
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} chatbot sessions idle for more than {days:g} days'))
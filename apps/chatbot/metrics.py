@@ -0,0 +1,252 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is open-ended)
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with token and DB query totals"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.queries = 0
+
+    def observe(self, span):
+        self.counts[bisect.bisect_left(BUCKETS_MS, span.duration_ms)] += 1
+        self.count += 1
+        self.total_ms += span.duration_ms
+        self.max_ms = max(self.max_ms, span.duration_ms)
+        self.prompt_tokens += span.prompt_tokens
+        self.cached_tokens += span.cached_tokens
+        self.completion_tokens += span.completion_tokens
+        self.queries += span.queries
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given percentile"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip((*BUCKETS_MS, self.max_ms), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 1) if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 1),
+            'buckets': dict(zip([*map(str, BUCKETS_MS), '+Inf'], self.counts)),
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'completion_tokens': self.completion_tokens,
+            'queries': self.queries,
+        }
+
+
+class MetricsRegistry:
+    """Per-process stage histograms and counters for the chatbot"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, span):
+        with self._lock:
+            self.histograms.setdefault(span.name, Histogram()).observe(span)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'stages': {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+registry = MetricsRegistry()
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.duration_ms = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.queries = 0
+
+    def add_usage(self, usage):
+        """
+        Record token counts from an OpenAI `usage` object (ignored if missing).
+        cached_tokens is the part of the prompt served from the vendor's prompt cache.
+        """
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+            self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+            details = getattr(usage, 'prompt_tokens_details', None)
+            self.cached_tokens += getattr(details, 'cached_tokens', 0) or 0
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            'duration_ms': round(self.duration_ms, 1),
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'completion_tokens': self.completion_tokens,
+            'queries': self.queries,
+        }
+
+
+class Trace:
+    """The spans of one chatbot request, in completion order"""
+
+    def __init__(self):
+        self.spans = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def tokens(self):
+        """Token accounting of the request: prompt (of which cached) and completion totals"""
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            'prompt': sum(span.prompt_tokens for span in spans),
+            'cached': sum(span.cached_tokens for span in spans),
+            'completion': sum(span.completion_tokens for span in spans),
+        }
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per span, the request total and its tokens"""
+        entries = []
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            details = [f'q={span.queries}']
+            if span.prompt_tokens or span.completion_tokens:
+                details.append(f'tok={span.prompt_tokens}+{span.completion_tokens}')
+            if span.cached_tokens:
+                details.append(f'cached={span.cached_tokens}')
+            entries.append(f'{span.name};dur={span.duration_ms:.1f};desc="{" ".join(details)}"')
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        tokens = self.tokens()
+        if tokens['prompt'] or tokens['completion']:
+            entries.append(
+                f'tokens;desc="prompt={tokens["prompt"]} cached={tokens["cached"]} completion={tokens["completion"]}"'
+            )
+        return ', '.join(entries)
+
+    def as_list(self):
+        with self._lock:
+            return [span.as_dict() for span in self.spans]
+
+
+_current_trace = contextvars.ContextVar('chatbot_trace', default=None)
+
+
+@contextmanager
+def span(name):
+    """
+    Time a pipeline stage and count the DB queries it runs on this thread.
+    The span lands in the registry histogram for `name` and, inside a request,
+    in that request's trace (Server-Timing). Yields the Span for token counts.
+    """
+    current = Span(name)
+
+    def count_query(execute, sql, params, many, context):
+        current.queries += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count_query):
+            yield current
+    finally:
+        current.duration_ms = (time.perf_counter() - started) * 1000
+        registry.observe(current)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+
+
+@contextmanager
+def activate(trace):
+    """Make `trace` collect the spans run inside the block (on this thread/context)"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def finish_trace(trace):
+    """Record the request total (duration and tokens) for a finished trace"""
+    current = Span('request')
+    current.duration_ms = (time.perf_counter() - trace.started) * 1000
+    tokens = trace.tokens()
+    current.prompt_tokens = tokens['prompt']
+    current.cached_tokens = tokens['cached']
+    current.completion_tokens = tokens['completion']
+    registry.observe(current)
+    logger.debug(f"Chatbot timings: {trace.server_timing()}")
+
+
+@contextmanager
+def request_trace():
+    """Collect the spans of the enclosed request handling into a new Trace"""
+    trace = Trace()
+    try:
+        with activate(trace):
+            yield trace
+    finally:
+        finish_trace(trace)
+
+
+def traced_events(trace, events):
+    """
+    Iterate a generator with `trace` active during each step. Streaming responses
+    are iterated after the view returned (and under ASGI on another thread), so
+    every step runs in a copy of the context this was called from, with the
+    trace set: other request-scoped context variables carry over as well.
+    """
+    context = contextvars.copy_context()
+    context.run(_current_trace.set, trace)
+    while True:
+        try:
+            event = context.run(next, events)
+        except StopIteration as stop:
+            return stop.value
+        yield event
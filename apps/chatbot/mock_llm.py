@@ -0,0 +1,229 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+
+# Simulated vendor latency in seconds: per completion (time to first token),
+# per streamed chunk, per Whisper transcription and per TTS rendering
+DEFAULT_LATENCY = {
+    'completion': 0.6,
+    'chunk': 0.01,
+    'transcription': 0.8,
+    'speech': 0.4,
+}
+MOCK_TRANSCRIPT = getattr(settings, 'CHATBOT_MOCK_TRANSCRIPT', "I'm looking for a calculator")
+MOCK_IMAGE_LABEL = getattr(settings, 'CHATBOT_MOCK_IMAGE_LABEL', 'calculator')
+
+# Silent 128 kbps / 44.1 kHz MPEG-1 Layer III frame (~26 ms of audio)
+SILENT_MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+# Spoken text runs at roughly 15 characters per second, i.e. ~2.5 frames per character
+MP3_FRAMES_PER_CHAR = 2.5
+
+RECOMMEND_WORDS = re.compile(r'\b(recommend\w*|suggest\w*)\b|رشح|اقترح', re.IGNORECASE)
+ESCALATE_WORDS = re.compile(r'\b(supervisor|human|refund|complain\w*)\b|مشرف|شكوى', re.IGNORECASE)
+SMALL_TALK = re.compile(r'^\W*(hi|hello|hey|thanks|thank you|مرحبا|شكرا|اهلا)\W*$', re.IGNORECASE)
+# Prompt caching as the vendor does it: a repeated prefix of at least 1024 tokens
+# is served from cache in 128-token increments
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+FILLER_WORDS = {
+    'i', 'im', "i'm", 'need', 'want', 'looking', 'for', 'a', 'an', 'the', 'some', 'any',
+    'do', 'you', 'have', 'is', 'there', 'please', 'can', 'find', 'me', 'search', 'buy', 'to',
+}
+
+
+class _Completions:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, model=None, messages=(), tools=None, stream=False, **kwargs):
+        content, tool_calls = self._backend.respond(messages, tools)
+        usage = self._backend.usage(messages, content, tool_calls, tools)
+        if stream:
+            include_usage = (kwargs.get('stream_options') or {}).get('include_usage', False)
+            return self._backend.stream(content, tool_calls, usage if include_usage else None)
+        self._backend.wait('completion')
+        message = SimpleNamespace(
+            role='assistant',
+            content=content,
+            tool_calls=[
+                SimpleNamespace(
+                    id=call_id, type='function',
+                    function=SimpleNamespace(name=name, arguments=arguments),
+                )
+                for call_id, name, arguments in tool_calls
+            ] or None,
+        )
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason='tool_calls' if tool_calls else 'stop')],
+            usage=usage,
+        )
+
+
+class _Transcriptions:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, model=None, file=None, **kwargs):
+        # Read the upload like the SDK would, so serialization cost is still measured
+        if hasattr(file, 'read'):
+            file.read()
+        elif isinstance(file, tuple):
+            data = file[1]
+            if hasattr(data, 'read'):
+                data.read()
+        self._backend.wait('transcription')
+        return SimpleNamespace(text=self._backend.transcript)
+
+
+class _Speech:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, model=None, voice=None, input='', **kwargs):
+        self._backend.wait('speech')
+        frames = max(1, int(len(input) * MP3_FRAMES_PER_CHAR))
+        return SimpleNamespace(content=SILENT_MP3_FRAME * frames)
+
+
+class MockLLMClient:
+    """
+    Deterministic, offline LLM backend with the same surface the chatbot uses from
+    the OpenAI client (chat.completions, audio.transcriptions, audio.speech).
+    It calls search_products / get_personalized_recommendations / escalate_to_supervisor
+    based on keywords, answers from the tool results, and sleeps for the configured
+    latency (CHATBOT_MOCK_LATENCY) so load tests see a realistic vendor share.
+    simulated_seconds() reports the latency added on the calling thread.
+    """
+
+    def __init__(self, latency=None, transcript=None, image_label=None):
+        self.latency = {**DEFAULT_LATENCY, **getattr(settings, 'CHATBOT_MOCK_LATENCY', {}), **(latency or {})}
+        self.transcript = transcript or MOCK_TRANSCRIPT
+        self.image_label = image_label or MOCK_IMAGE_LABEL
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.audio = SimpleNamespace(transcriptions=_Transcriptions(self), speech=_Speech(self))
+        self._local = threading.local()
+        self._prefixes = set()
+        self._prefixes_lock = threading.Lock()
+
+    def close(self):
+        pass
+
+    def simulated_seconds(self):
+        """Total simulated vendor latency spent on the current thread so far"""
+        return getattr(self._local, 'simulated', 0.0)
+
+    def wait(self, kind):
+        seconds = self.latency.get(kind, 0)
+        if seconds:
+            time.sleep(seconds)
+            self._local.simulated = self.simulated_seconds() + seconds
+
+    def usage(self, messages, content, tool_calls, tools=None):
+        """
+        Token counts estimated at ~4 characters per token. The tools and the first
+        system message form the cacheable prefix: seen before, they count as cached.
+        """
+        messages = list(messages)
+        leading = 1 if messages and messages[0].get('role') == 'system' else 0
+        prefix = json.dumps([tools, messages[:leading]], ensure_ascii=False)
+        rest = sum(len(json.dumps(message.get('content'), ensure_ascii=False)) for message in messages[leading:])
+        prefix_tokens = len(prefix) // 4
+        prompt = prefix_tokens + rest // 4
+        with self._prefixes_lock:
+            seen = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        cached = prefix_tokens - prefix_tokens % CACHE_INCREMENT if seen and prefix_tokens >= CACHE_MIN_TOKENS else 0
+        completion = (len(content or '') + sum(len(arguments) for _, _, arguments in tool_calls)) // 4
+        return SimpleNamespace(
+            prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+        )
+
+    def stream(self, content, tool_calls, usage=None):
+        self.wait('completion')
+        for index, (call_id, name, arguments) in enumerate(tool_calls):
+            # Arguments arrive in fragments, like the real API
+            half = len(arguments) // 2
+            yield self._chunk(tool_calls=[self._fragment(index, call_id, name, arguments[:half])])
+            self.wait('chunk')
+            yield self._chunk(tool_calls=[self._fragment(index, None, None, arguments[half:])])
+        for word in re.findall(r'\S+\s*', content or ''):
+            self.wait('chunk')
+            yield self._chunk(content=word)
+        if usage is not None:
+            yield SimpleNamespace(choices=[], usage=usage)
+
+    @staticmethod
+    def _chunk(content=None, tool_calls=None):
+        delta = SimpleNamespace(role='assistant', content=content, tool_calls=tool_calls)
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+
+    @staticmethod
+    def _fragment(index, call_id, name, arguments):
+        return SimpleNamespace(
+            index=index, id=call_id, type='function' if call_id else None,
+            function=SimpleNamespace(name=name, arguments=arguments),
+        )
+
+    def respond(self, messages, tools):
+        """Decide the (content, [(call_id, name, arguments)]) of the next assistant message"""
+        messages = list(messages)
+        last = messages[-1] if messages else {}
+        if last.get('role') == 'tool':
+            return self._answer_tool_results(messages), []
+
+        text = self._text(last.get('content'))
+        if isinstance(last.get('content'), list):
+            # Vision request: a short product label
+            return self.image_label, []
+        if not tools:
+            return f"Summary: the student asked about {text[:200]}", []
+        if SMALL_TALK.match(text):
+            return "Hello! What are you looking for today?", []
+
+        call_id = f"call_mock_{len(messages)}"
+        if ESCALATE_WORDS.search(text):
+            arguments = {"issue_summary": text[:200], "issue_type": "other", "priority": "medium"}
+            return None, [(call_id, "escalate_to_supervisor", json.dumps(arguments))]
+        if RECOMMEND_WORDS.search(text):
+            return None, [(call_id, "get_personalized_recommendations", "{}")]
+        return None, [(call_id, "search_products", json.dumps({"query": self._search_query(text)}))]
+
+    @staticmethod
+    def _text(content):
+        if isinstance(content, list):
+            return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        return content or ""
+
+    @staticmethod
+    def _search_query(text):
+        # Image uploads arrive as "... [The user also attached an image that appears to show: X]"
+        attached = re.search(r'appears to show: ([^\]]+)\]|similar to this: (.+)$', text)
+        if attached:
+            return (attached.group(1) or attached.group(2)).strip()
+        words = [word for word in re.findall(r"[\w']+", text.lower()) if word not in FILLER_WORDS]
+        return " ".join(words[:4]) or text.strip()
+
+    @staticmethod
+    def _answer_tool_results(messages):
+        lines = []
+        for message in reversed(messages):
+            if message.get('role') != 'tool':
+                break
+            try:
+                result = json.loads(message.get('content') or 'null')
+            except ValueError:
+                result = None
+            if isinstance(result, dict):
+                lines.append(result.get('message', 'Done.'))
+            elif result:
+                titles = ", ".join(f"{item['title']} ({item['price']:g} EGP)" for item in result[:3])
+                lines.append(f"I found {len(result)} option(s): {titles}.")
+            else:
+                lines.append("Sorry, I couldn't find matching products right now.")
+        return " ".join(reversed(lines))
@@ -1,3 +1,54 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class ChatbotSession(models.Model):
+    """
+    One conversation with the assistant. Clients keep `key` and send it back as
+    session_id; older turns are folded into `summary` so the prompt stays bounded.
+    """
+    key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='chatbot_sessions',
+    )
+    summary = models.TextField(blank=True, default='')
+    # Messages with an id up to this one are covered by `summary`
+    summarized_until = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='chatbot_session_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'Chatbot session {self.key}'
+
+
+class ChatbotMessage(models.Model):
+    ROLE_USER = 'user'
+    ROLE_ASSISTANT = 'assistant'
+    ROLE_CHOICES = (
+        (ROLE_USER, 'User'),
+        (ROLE_ASSISTANT, 'Assistant'),
+    )
+
+    session = models.ForeignKey(ChatbotSession, on_delete=models.CASCADE, related_name='messages')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    content = models.TextField()
+    # Estimated prompt tokens, stored so building the context never re-counts history
+    token_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['session', 'id'], name='chatbot_message_session_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.role}: {self.content[:50]}'
@@ -0,0 +1,219 @@
+import logging
+
+from django.conf import settings
+
+from .breaker import llm_call
+from .fallback import local_search_turn
+from .intent import classify_intent, record_route
+from .limiter import llm_slot
+from .metrics import span
+from .prompts import TOOLS, build_messages, tool_result_content
+from .result_cache import get_cached_search, reply_language, set_cached_search
+from .singleflight import LEADER, SHARED, flight_key, flights
+from .tools import parse_tool_arguments, run_tool_calls
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-4o"  # Use a widely available model
+# Model turns that may call tools before the reply is forced to plain text
+MAX_TOOL_ROUNDS = getattr(settings, 'CHATBOT_MAX_TOOL_ROUNDS', 3)
+# Tools whose results depend only on the message and the user tier, so a turn that
+# used nothing else can be shared with identical concurrent turns (see singleflight.py)
+SHAREABLE_TOOLS = frozenset({"search_products", "get_personalized_recommendations"})
+
+
+def complete(client, messages, stream=False, **kwargs):
+    """
+    Run one chat completion. When streaming, yields ("delta", {"text": ...})
+    per text chunk and reassembles tool call fragments.
+    Returns (content, tool_calls) with tool_calls in the dict shape the API
+    accepts back in `messages`.
+    """
+    if not stream:
+        with llm_call('completion') as timing:
+            completion = client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                **kwargs
+            )
+            timing.add_usage(getattr(completion, 'usage', None))
+        message = completion.choices[0].message
+        tool_calls = [
+            {
+                "id": tool_call.id,
+                "type": "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+            }
+            for tool_call in message.tool_calls or []
+        ]
+        return message.content or "", tool_calls
+
+    content = []
+    tool_calls = {}
+    with llm_call('completion') as timing:
+        chunks = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=500,
+            stream=True,
+            # Final chunk carries the token usage
+            stream_options={"include_usage": True},
+            **kwargs
+        )
+        for chunk in chunks:
+            timing.add_usage(getattr(chunk, 'usage', None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                yield "delta", {"text": delta.content}
+            for fragment in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(fragment.index, {
+                    "id": None,
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                })
+                if fragment.id:
+                    tool_call["id"] = fragment.id
+                if fragment.function:
+                    tool_call["function"]["name"] += fragment.function.name or ""
+                    tool_call["function"]["arguments"] += fragment.function.arguments or ""
+    return "".join(content), [tool_calls[index] for index in sorted(tool_calls)]
+
+
+def run_turn(client, user_message, user, stream=False, history=None):
+    """
+    Answer one chatbot message. Plain product searches (see intent.py) are
+    answered locally with a templated reply; everything else goes to the LLM,
+    which runs the tool calls it asks for. All tool calls of a model turn are
+    executed together and their results go back in a single follow-up
+    completion; after MAX_TOOL_ROUNDS tool rounds the model has to answer in
+    text. Concurrent identical opening messages (no history) from the same
+    user tier share one LLM turn (singleflight.py).
+
+    Generator of (event, data) progress events: tool_call, products, and
+    delta (reply text; only when streaming or replaying a cached reply).
+    Returns (reply, products); products is None if no product tool ran.
+    `user` is None for anonymous visitors; `history` holds earlier turns of the
+    conversation (see history.build_history).
+    """
+    with span('intent'):
+        intent = classify_intent(user_message)
+    record_route(intent)
+    if intent.fast_path:
+        with span('fast_path'):
+            reply, products = local_search_turn(intent.query, user_message, user)
+        yield "products", {"products": products}
+        yield "delta", {"text": reply}
+        return reply, products
+
+    # Identical opening messages from the same tier share one LLM turn
+    if not history:
+        return (yield from _coalesced_turn(client, user_message, user, stream))
+    return (yield from _slot_turn(client, user_message, user, stream, history))
+
+
+def _slot_turn(client, user_message, user, stream, history):
+    # The whole LLM turn holds one limiter slot (see limiter.py)
+    with llm_slot():
+        return (yield from _llm_turn(client, user_message, user, stream, history))
+
+
+def _coalesced_turn(client, user_message, user, stream):
+    key = flight_key(user_message, user)
+    role, shared = flights.join(key)
+    if role == SHARED:
+        reply, products = shared
+        if products is not None:
+            yield "products", {"products": products}
+        yield "delta", {"text": reply}
+        return reply, products
+    if role != LEADER:
+        return (yield from _slot_turn(client, user_message, user, stream, None))
+
+    events = _slot_turn(client, user_message, user, stream, None)
+    shareable = True
+    try:
+        while True:
+            try:
+                event, data = next(events)
+            except StopIteration as stop:
+                reply, products = stop.value
+                break
+            if event == "tool_call" and data["name"] not in SHAREABLE_TOOLS:
+                shareable = False
+            yield event, data
+    except BaseException:
+        events.close()
+        flights.abandon(key)
+        raise
+    if shareable:
+        flights.publish(key, (reply, products))
+    else:
+        flights.abandon(key)
+    return reply, products
+
+
+def _llm_turn(client, user_message, user, stream, history):
+    messages = build_messages(user_message, history)
+    language = reply_language(user_message)
+    products = None
+    cache_query = None
+
+    for round_number in range(MAX_TOOL_ROUNDS + 1):
+        tool_kwargs = {"tools": TOOLS, "tool_choice": "auto"} if round_number < MAX_TOOL_ROUNDS else {}
+        reply, tool_calls = yield from complete(client, messages, stream, **tool_kwargs)
+        if not tool_calls:
+            if round_number == 0:
+                logger.debug("No tool calls made by AI")
+            break
+
+        calls = [
+            (tool_call["function"]["name"], parse_tool_arguments(tool_call["function"]["arguments"]))
+            for tool_call in tool_calls
+        ]
+        for name, args in calls:
+            yield "tool_call", {"name": name, "arguments": args}
+
+        # A plain "search for X" opening turn: reuse the products and reply of an identical
+        # recent search (same user tier), skipping the DB and the follow-up completion.
+        # With history the reply may depend on the conversation, so it is never shared.
+        if round_number == 0 and not history and len(calls) == 1 and calls[0][0] == "search_products":
+            cache_query = calls[0][1].get("query", "")
+            cached = get_cached_search(cache_query, user, language)
+            if cached is not None:
+                yield "products", {"products": cached["products"]}
+                yield "delta", {"text": cached["reply"]}
+                return cached["reply"], cached["products"]
+        elif round_number > 0:
+            # Later rounds called more tools: the reply is no longer just the search's
+            cache_query = None
+
+        messages.append({"role": "assistant", "content": reply or None, "tool_calls": tool_calls})
+        for tool_call, (result, tool_products) in zip(tool_calls, run_tool_calls(calls, user, user_message)):
+            if tool_products is not None:
+                products = tool_products
+                yield "products", {"products": tool_products}
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "content": tool_result_content(result),
+            })
+
+    logger.debug(f"Final response content: '{reply}'")
+    if cache_query is not None:
+        set_cached_search(cache_query, user, language, products, reply)
+    return reply, products
+
+
+def drain(events):
+    """Run a run_turn() generator to completion, discarding events, and return its result"""
+    while True:
+        try:
+            next(events)
+        except StopIteration as stop:
+            return stop.value
@@ -0,0 +1,168 @@
+# Static prompt and tool definitions for the chatbot completions, and the builder
+# that assembles them with the conversation into the messages of a request
+import json
+import textwrap
+
+
+def compact_prompt(text):
+    """Dedented prompt without trailing spaces or runs of blank lines (they cost tokens)"""
+    lines = [line.rstrip() for line in textwrap.dedent(text).strip().splitlines()]
+    return "\n".join(line for i, line in enumerate(lines) if line or (i and lines[i - 1]))
+
+
+# Define functions for product search and personalized recommendations
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_products",
+            "description": "Search for available college tools and supplies in our e-commerce store",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "The tool or item to search for (e.g., ruler, calculator, thermometer)",
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_personalized_recommendations",
+            "description": "Get personalized product recommendations based on the user's location, university and faculty",
+            "parameters": {
+                "type": "object",
+                "properties": {}
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "escalate_to_supervisor",
+            "description": "Escalate a user issue to a human supervisor when the AI cannot resolve the problem. Use this when: 1) The user is frustrated after multiple attempts to help, 2) The issue requires human intervention (refunds, account issues, disputes), 3) Technical bugs that need developer attention, 4) The user explicitly requests to speak with a human.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "issue_summary": {
+                        "type": "string",
+                        "description": "A brief summary of the user's issue and what has been attempted to resolve it"
+                    },
+                    "issue_type": {
+                        "type": "string",
+                        "enum": ["technical_bug", "payment_issue", "account_problem", "product_complaint", "seller_dispute", "feature_request", "other"],
+                        "description": "Category of the issue"
+                    },
+                    "priority": {
+                        "type": "string",
+                        "enum": ["low", "medium", "high"],
+                        "description": "Priority level based on urgency and user frustration"
+                    }
+                },
+                "required": ["issue_summary", "issue_type", "priority"]
+            }
+        }
+    }
+]
+
+SYSTEM_PROMPT = compact_prompt("""
+            You are a helpful AI assistant for a college supplies e-commerce website called Stuplies.
+            You help students find and purchase tools they need for their studies, AND you provide customer support.
+            Only respond to queries related to the website, polietly refuse to answer questions concerning anything unrelating to the website stating that you can only answer questions that relate to te website and it's content.     
+            === PRODUCT SEARCH ===
+            CRITICAL: When a user asks about ANY tools, supplies, or items for sale, ALWAYS use the search_products function first. Do not answer from memory or make up information.
+            
+            Available tools and supplies include: rulers, calculators, thermometers, notebooks, pens, pencils, erasers, geometry sets, laboratory equipment, measuring tools, and many other study supplies.
+
+            When products are found:
+            - Take direct action: Always navigate the user to the product details page automatically
+            - Say something brief like "Found it! Here are the options..." 
+
+            LOCATION-BASED SEARCHES: If a user specifies a location, the search prioritizes products from that location.
+
+            === CUSTOMER SUPPORT ===
+            You also handle customer support, troubleshooting, and complaints. Common issues include:
+            
+            **Technical Issues:**
+            - Login/registration problems → Suggest: clear browser cache, try different browser, check email for verification
+            - Page not loading → Suggest: refresh, check internet connection, try incognito mode
+            - Images not displaying → Suggest: refresh page, check internet speed
+            - Payment failing → Suggest: check card details, try different payment method, ensure sufficient funds
+            - App crashes → Suggest: update browser, clear cache, disable extensions
+            
+            **Account Issues:**
+            - Forgot password → Direct to "Forgot Password" link on login page
+            - Can't verify email → Suggest checking spam folder, request new verification email
+            - Profile not updating → Suggest: log out and back in, clear cache
+            
+            **Product/Order Issues:**
+            - Product not as described → Advise to contact seller first via chat, explain dispute process
+            - Seller not responding → Suggest waiting 24-48 hours, then escalate
+            - Want refund → Explain the platform connects buyers/sellers directly, refunds depend on seller
+            
+            **Platform Navigation:**
+            - How to post ad → Explain: go to "My Ads" → "Add New Product" → fill details → submit
+            - How to contact seller → Explain: click on product → "Chat with Seller" button
+            - How to edit/delete listing → Go to "My Ads" → find listing → edit/delete options
+            
+            **Troubleshooting Approach:**
+            1. Listen carefully and acknowledge the user's frustration
+            2. Ask clarifying questions if needed
+            3. Provide step-by-step solutions
+            4. If first solution doesn't work, try alternatives
+            5. If you cannot resolve after 2-3 attempts OR the user is very frustrated OR it requires human intervention → USE escalate_to_supervisor function
+
+            === ESCALATION RULES ===
+            Use escalate_to_supervisor when:
+            - User explicitly asks for a human/manager/supervisor
+            - Issue involves money/payments that need manual review  
+            - Account is locked or banned (needs admin)
+            - Dispute between buyer and seller
+            - Bug that you cannot help troubleshoot
+            - User remains unsatisfied after your troubleshooting attempts
+            - Any issue you genuinely cannot resolve
+
+            When escalating, be empathetic: "I understand this is frustrating. Let me escalate this to our support team who will personally look into this for you."
+
+            === LANGUAGE ===
+            Respond in the same language the user writes in (Arabic or English).
+            Be friendly, helpful, and professional. Use emojis sparingly for friendliness.
+            """)
+
+# The static prefix of every completion: the same dict (and the same TOOLS list) is
+# sent on every request, so the serialized prefix is byte-identical and the vendor's
+# prompt cache can serve it. Anything per-request goes after it.
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Product fields the model sees in a tool result; the full product dicts only go to the client
+TOOL_RESULT_FIELDS = ("id", "title", "price", "condition")
+TOOL_RESULT_DESCRIPTION_CHARS = 120
+
+
+def build_messages(user_message, history=None):
+    """System prefix, earlier turns (summary first, see history.build_history), new message"""
+    return [SYSTEM_MESSAGE, *(history or []), {"role": "user", "content": user_message}]
+
+
+def compact_product(product):
+    compact = {field: product[field] for field in TOOL_RESULT_FIELDS if field in product}
+    description = " ".join((product.get("description") or "").split())
+    if len(description) > TOOL_RESULT_DESCRIPTION_CHARS:
+        description = description[:TOOL_RESULT_DESCRIPTION_CHARS].rsplit(" ", 1)[0] + "…"
+    if description:
+        compact["description"] = description
+    return compact
+
+
+def tool_result_content(result):
+    """
+    A tool result as message content: product lists projected to TOOL_RESULT_FIELDS
+    plus a truncated description, serialized without whitespace or \\u escapes
+    """
+    if isinstance(result, list):
+        result = [compact_product(item) if isinstance(item, dict) else item for item in result]
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# How long a (query, user tier) search result and its phrased reply are reused
+SEARCH_CACHE_TIMEOUT = getattr(settings, 'CHATBOT_SEARCH_CACHE_TIMEOUT', 60 * 10)
+SEARCH_VERSION_KEY = 'chatbot:search-version'
+
+ARABIC_CHARS = re.compile(r'[؀-ۿ]')
+NON_WORD_CHARS = re.compile(r'[^\w\s-]+')
+
+
+def normalize_query(query):
+    """'  Lab Coat?! ' -> 'lab coat' so trivially different phrasings share an entry"""
+    query = NON_WORD_CHARS.sub(' ', (query or '').lower())
+    return ' '.join(query.split())
+
+
+def user_tier(user):
+    """The (university, faculty, governorate) a cached result is valid for"""
+    if not user:
+        return ('', '', '')
+    return tuple(
+        (getattr(user, field, '') or '').strip().lower()
+        for field in ('university', 'faculty', 'governorate')
+    )
+
+
+def reply_language(message):
+    """Replies mirror the user's language, so Arabic and English askers get separate entries"""
+    return 'ar' if ARABIC_CHARS.search(message or '') else 'en'
+
+
+def _search_version():
+    version = cache.get(SEARCH_VERSION_KEY)
+    if version is None:
+        cache.add(SEARCH_VERSION_KEY, 1, timeout=None)
+        version = cache.get(SEARCH_VERSION_KEY, 1)
+    return version
+
+
+def _search_key(query, user, language):
+    raw = '|'.join((normalize_query(query), *user_tier(user), language))
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'chatbot:search:{_search_version()}:{digest}'
+
+
+def get_cached_search(query, user, language):
+    """Return {'products': [...], 'reply': '...'} for a previous identical search, or None"""
+    entry = cache.get(_search_key(query, user, language))
+    if entry is not None:
+        logger.debug(f"Search cache hit for '{query}'")
+    return entry
+
+
+def set_cached_search(query, user, language, products, reply):
+    if not reply:
+        return
+    cache.set(
+        _search_key(query, user, language),
+        {'products': products, 'reply': reply},
+        SEARCH_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_search_cache():
+    """Expire every cached search; called whenever the set of searchable products may have changed"""
+    try:
+        cache.incr(SEARCH_VERSION_KEY)
+    except ValueError:
+        cache.add(SEARCH_VERSION_KEY, 1, timeout=None)
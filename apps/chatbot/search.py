@@ -0,0 +1,246 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from apps.products.models import Product
+from .locations import split_location
+from .semantic import similar_products
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_LIMIT = 10
+RECOMMENDATION_CACHE_TIMEOUT = getattr(settings, 'CHATBOT_RECOMMENDATION_CACHE_TIMEOUT', 60 * 15)
+
+
+# Fields matched for each search term, in priority order
+SEARCH_FIELDS = ('title', 'description', 'category__name')
+
+
+def build_search_terms(search_query):
+    """Expand a cleaned query into the list of terms tried, most specific first"""
+    search_terms = [search_query]
+    # Add common shortened versions
+    if 'calculator' in search_query:
+        search_terms.extend(['calc', 'calculat'])
+    if 'computer' in search_query:
+        search_terms.extend(['comp', 'comput'])
+    if 'notebook' in search_query:
+        search_terms.extend(['note', 'book'])
+    if 'pencil' in search_query:
+        search_terms.extend(['pen', 'cil'])
+    # Add the first 4-5 characters as a fallback
+    if len(search_query) > 4:
+        search_terms.append(search_query[:4])
+    return search_terms
+
+
+def _match_filter_and_rank(search_terms):
+    """
+    Build the WHERE clause and a rank expression for the search strategies.
+    The rank is the index of the first (term, field) strategy a product matches,
+    so ordering by it reproduces the old "one query per strategy" priority.
+    """
+    match_q = Q()
+    whens = []
+    for term in search_terms:
+        for field in SEARCH_FIELDS:
+            lookup = {f'{field}__icontains': term}
+            match_q |= Q(**lookup)
+            whens.append(When(then=Value(len(whens)), **lookup))
+    return match_q, Case(*whens, default=Value(len(whens)), output_field=IntegerField())
+
+
+def _semantic_rank(candidates):
+    """Position of a product among the semantic candidates (most similar first); others last"""
+    whens = [When(id=product_id, then=Value(position)) for position, (product_id, _) in enumerate(candidates)]
+    return Case(*whens, default=Value(len(whens)), output_field=IntegerField())
+
+
+def _tier_rank(user_university, user_faculty):
+    """
+    Rank a product by the user's campus hierarchy:
+    1 = same university + same faculty, 2 = same university, 3 = anything else
+    """
+    whens = []
+    if user_university and user_faculty:
+        whens.append(When(university_normalized=user_university, faculty_normalized=user_faculty, then=Value(1)))
+    if user_university:
+        # Same-faculty products were already caught by the first When
+        whens.append(When(university_normalized=user_university, then=Value(2)))
+    return Case(*whens, default=Value(3), output_field=IntegerField())
+
+
+def search_products(query, user=None):
+    """
+    Search for products in the database with hierarchical filtering:
+    1. Specified location (if mentioned in query)
+    2. Same university + same faculty (highest priority)
+    3. Same university + different faculty (medium priority)
+    4. Transfer not available (fallback - no filtering)
+    Returns only top 3 cheapest results from the best level that has any match
+    Semantic similarity (offline index) orders substring matches of the same strategy;
+    products it finds alone (typos, related wording) are returned only when nothing matches
+    Each step is a single ranked query
+    """
+    # Clean and prepare search query
+    query = query.lower().strip()
+
+    # Parse location from query and remove the location phrase ("from giza",
+    # "في الجيزة") for better product matching
+    specified_location, search_query = split_location(query)
+    logger.debug(f"Parsed location from query: '{specified_location}'")
+
+    search_terms = build_search_terms(search_query)
+    logger.debug(f"Searching for '{search_query}' with terms: {search_terms}")
+
+    # Get user info for filtering
+    user_university = ""
+    user_faculty = ""
+    if user:
+        user_university = (getattr(user, 'university', '') or '').lower().strip()
+        user_faculty = (getattr(user, 'faculty', '') or '').lower().strip()
+
+    logger.debug(f"User university: '{user_university}', faculty: '{user_faculty}'")
+
+    match_q, match_rank = _match_filter_and_rank(search_terms)
+    candidates = similar_products(search_query) if search_query else []
+    if candidates:
+        logger.debug(f"Semantic candidates: {candidates[:5]}")
+    semantic_rank = _semantic_rank(candidates)
+
+    if specified_location:
+        # For location-specific searches only that location counts,
+        # if nothing is there we return empty results (no fallback)
+        tier = Value(0, output_field=IntegerField())
+    else:
+        tier = _tier_rank(user_university, user_faculty)
+
+    def best_tier(match_filter, ordering):
+        queryset = Product.objects.filter(match_filter, status='active').select_related('category', 'seller')
+        if specified_location:
+            queryset = queryset.filter(governorate__iexact=specified_location)
+        products = list(
+            queryset.annotate(tier=tier, match_rank=match_rank, semantic_rank=semantic_rank)
+            .order_by('tier', *ordering, 'price', 'id')[:3]
+        )
+        # Only the best tier is returned (lower tiers are a fallback, not a top-up)
+        if products:
+            products = [product for product in products if product.tier == products[0].tier]
+            logger.debug(f"Level {products[0].tier} found {len(products)} products")
+        return products
+
+    # Semantic similarity only reorders substring matches within a strategy;
+    # products found by the semantic index alone are used only if nothing matches
+    products = best_tier(match_q, ('match_rank', 'semantic_rank'))
+    if not products and candidates:
+        products = best_tier(Q(id__in=[product_id for product_id, _ in candidates]), ('semantic_rank',))
+
+    return format_products(products)
+
+
+def format_products(products):
+    """Helper function to format product queryset to dictionary"""
+    results = []
+    for product in products:
+        results.append({
+            "id": product.id,
+            "title": product.title,
+            "description": product.description,
+            "price": float(product.price),
+            "condition": product.condition,
+            "category": product.category.name if product.category else "No category",
+            "university": product.university or "Not specified",
+            "faculty": product.faculty or "Not specified",
+            "seller": {
+                "id": product.seller.id,
+                "name": product.seller.first_name or product.seller.username,
+                "username": product.seller.username,
+            } if product.seller else {"name": "Unknown Seller"}
+        })
+    return results
+
+
+def _campus_version_key(kind, value):
+    digest = hashlib.md5(value.encode('utf-8')).hexdigest()
+    return f'chatbot:campus-version:{kind}:{digest}'
+
+
+def _campus_version(kind, value):
+    key = _campus_version_key(kind, value)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def invalidate_campus_recommendations(university, faculty):
+    """
+    Expire cached recommendations for every (university, faculty) pair that
+    shares the given university or faculty, by bumping their version counters
+    """
+    for kind, value in (('university', university), ('faculty', faculty)):
+        value = (value or '').strip().lower()
+        if not value:
+            continue
+        key = _campus_version_key(kind, value)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Nothing cached under this value yet
+            cache.add(key, 1, timeout=None)
+
+
+def get_personalized_recommendations(user):
+    """
+    Get products recommended for the user's university and faculty
+    Only recommend if there's a university/faculty match
+    Same university AND faculty rank above a single match
+    Case-insensitive matching via the normalized campus columns, cached per (university, faculty)
+    """
+    university = (getattr(user, 'university', '') or '').lower().strip()
+    faculty = (getattr(user, 'faculty', '') or '').lower().strip()
+
+    logger.debug(f"Getting recommendations for university: {university}, faculty: {faculty}")
+
+    if not university and not faculty:
+        # No university/faculty info, return empty recommendations
+        return []
+
+    cache_key = 'chatbot:recommendations:{}:{}:{}'.format(
+        _campus_version('university', university) if university else 0,
+        _campus_version('faculty', faculty) if faculty else 0,
+        hashlib.md5(f'{university}|{faculty}'.encode('utf-8')).hexdigest(),
+    )
+    results = cache.get(cache_key)
+    if results is not None:
+        return results
+
+    match_q = Q()
+    if university:
+        match_q |= Q(university_normalized=university)
+    if faculty:
+        match_q |= Q(faculty_normalized=faculty)
+
+    if university and faculty:
+        match_score = Case(
+            When(university_normalized=university, faculty_normalized=faculty, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    else:
+        match_score = Value(1, output_field=IntegerField())
+
+    products = (
+        Product.objects.filter(match_q, status='active')
+        .select_related('category', 'seller')
+        .annotate(match_score=match_score)
+        .order_by('-match_score', 'id')[:RECOMMENDATION_LIMIT]
+    )
+
+    results = format_products(products)
+    cache.set(cache_key, results, RECOMMENDATION_CACHE_TIMEOUT)
+    return results
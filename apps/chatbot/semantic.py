@@ -0,0 +1,288 @@
+"""
+Offline semantic index for chatbot product search.
+
+Products are embedded as signed, hashed character n-gram vectors (no model, no
+network) and stored in one memory-mapped file that every worker process maps
+read-only, so the matrix is shared through the page cache.
+
+File layout: int64 header [magic, dim, capacity, count], int64 product ids
+[capacity], then float32 vectors [capacity, dim]. A product id of 0 marks a
+removed row. Writers take an exclusive file lock; growing the file rewrites it
+and swaps it in with os.replace, which readers notice by its new inode.
+"""
+import logging
+import os
+import re
+import threading
+import zlib
+
+from django.conf import settings
+
+try:
+    import numpy as np
+except ImportError:  # Semantic ranking is skipped without NumPy
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: single process, thread lock only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = getattr(
+    settings, 'CHATBOT_SEMANTIC_INDEX_PATH',
+    os.path.join(str(settings.BASE_DIR), 'var', 'chatbot_semantic.idx'),
+)
+# Vector width (power of two); 512 float32s = 2 KB per product
+DIM = getattr(settings, 'CHATBOT_SEMANTIC_DIM', 512)
+# Cosine similarity a product needs to count as a semantic match
+MIN_SCORE = getattr(settings, 'CHATBOT_SEMANTIC_MIN_SCORE', 0.25)
+# Candidates handed to search_products per query
+CANDIDATES = 50
+
+MAGIC = 0x43425345  # "CBSE"
+HEADER_SIZE = 4
+INITIAL_CAPACITY = 1024
+NGRAM_SIZES = (3, 4)
+DESCRIPTION_CHARS = 1000
+FIELD_WEIGHTS = (('title', 2.0), ('category', 1.5), ('description', 1.0))
+
+WORD_RE = re.compile(r'\w+')
+
+_write_lock = threading.Lock()
+_read_lock = threading.Lock()
+_reader = None
+_reader_key = None
+_warned_missing = False
+
+
+def _add_features(vector, text, weight):
+    for word in WORD_RE.findall((text or '').lower()):
+        padded = f' {word} '
+        features = [f'w:{word}']
+        if len(padded) <= NGRAM_SIZES[0]:
+            features.append(padded)
+        for size in NGRAM_SIZES:
+            features.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+        for feature in features:
+            hashed = zlib.crc32(feature.encode('utf-8'))
+            # Signed hashing keeps collisions from only ever adding similarity
+            vector[hashed & (DIM - 1)] += -weight if hashed & 0x80000000 else weight
+
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+def embed(text):
+    """Unit-length hashed n-gram vector for a search query"""
+    vector = np.zeros(DIM, dtype=np.float32)
+    _add_features(vector, text, 1.0)
+    return _normalize(vector)
+
+
+def embed_product(product):
+    """Unit-length vector for a product: title, category and description, weighted"""
+    texts = {
+        'title': product.title,
+        'category': product.category.name if product.category_id else '',
+        'description': (product.description or '')[:DESCRIPTION_CHARS],
+    }
+    vector = np.zeros(DIM, dtype=np.float32)
+    for field, weight in FIELD_WEIGHTS:
+        _add_features(vector, texts[field], weight)
+    return _normalize(vector)
+
+
+def _layout(capacity):
+    ids_offset = HEADER_SIZE * 8
+    vectors_offset = ids_offset + capacity * 8
+    return ids_offset, vectors_offset, vectors_offset + capacity * DIM * 4
+
+
+def _open(path, mode):
+    """Map an index file; returns (header, ids, vectors)"""
+    header = np.memmap(path, dtype=np.int64, mode=mode, shape=(HEADER_SIZE,))
+    if header[0] != MAGIC or header[1] != DIM:
+        raise ValueError(f"{path} is not a {DIM}-dimension chatbot semantic index; rebuild it")
+    capacity = int(header[2])
+    ids_offset, vectors_offset, _ = _layout(capacity)
+    ids = np.memmap(path, dtype=np.int64, mode=mode, offset=ids_offset, shape=(capacity,))
+    vectors = np.memmap(path, dtype=np.float32, mode=mode, offset=vectors_offset, shape=(capacity, DIM))
+    return header, ids, vectors
+
+
+def _write_new(path, ids, vectors, capacity):
+    """Write a complete index to a temporary file and atomically swap it in"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    _, _, size = _layout(capacity)
+    with open(tmp_path, 'wb') as f:
+        f.truncate(size)
+    header = np.memmap(tmp_path, dtype=np.int64, mode='r+', shape=(HEADER_SIZE,))
+    header[:] = (MAGIC, DIM, capacity, len(ids))
+    _, new_ids, new_vectors = _open(tmp_path, 'r+')
+    new_ids[:len(ids)] = ids
+    new_vectors[:len(ids)] = vectors
+    for array in (header, new_ids, new_vectors):
+        array.flush()
+    del header, new_ids, new_vectors
+    os.replace(tmp_path, path)
+
+
+class _FileLock:
+    """Exclusive lock shared by threads and processes writing the index"""
+
+    def __init__(self, path):
+        self.path = f'{path}.lock'
+
+    def __enter__(self):
+        _write_lock.acquire()
+        if fcntl:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        _write_lock.release()
+
+
+def build_index(products, path=None):
+    """
+    (Re)build the index from scratch for the given products (usually every active
+    product). Returns the number of products indexed.
+    """
+    path = path or INDEX_PATH
+    ids = []
+    vectors = []
+    for product in products.iterator() if hasattr(products, 'iterator') else products:
+        ids.append(product.id)
+        vectors.append(embed_product(product))
+    capacity = max(INITIAL_CAPACITY, 1 << max(len(ids) - 1, 0).bit_length())
+    with _FileLock(path):
+        _write_new(
+            path,
+            np.array(ids, dtype=np.int64),
+            np.array(vectors, dtype=np.float32).reshape(len(ids), DIM),
+            capacity,
+        )
+    return len(ids)
+
+
+def index_products(products, path=None):
+    """
+    Add or refresh products in an existing index. Does nothing until the index
+    has been built (manage.py build_semantic_index), so a partial index never
+    replaces the full one.
+    """
+    path = path or INDEX_PATH
+    if np is None or not os.path.exists(path):
+        return
+    rows = [(product.id, embed_product(product)) for product in products]
+    if not rows:
+        return
+    with _FileLock(path):
+        header, ids, vectors = _open(path, 'r+')
+        count = int(header[3])
+        slots = {}
+        for product_id, _ in rows:
+            existing = np.flatnonzero(ids[:count] == product_id)
+            if len(existing):
+                slots[product_id] = int(existing[0])
+        new_ids = {product_id for product_id, _ in rows if product_id not in slots}
+        if count + len(new_ids) > len(ids):
+            # Out of room: rewrite at double capacity (readers remap on the new inode)
+            capacity = len(ids)
+            while count + len(new_ids) > capacity:
+                capacity *= 2
+            _write_new(path, np.array(ids[:count]), np.array(vectors[:count]), capacity)
+            del header, ids, vectors
+            header, ids, vectors = _open(path, 'r+')
+        for product_id, vector in rows:
+            slot = slots.get(product_id)
+            if slot is None:
+                slot = slots[product_id] = count
+                count += 1
+            vectors[slot] = vector
+            ids[slot] = product_id
+        # Publish the new rows only after they are written
+        header[3] = count
+        for array in (vectors, ids, header):
+            array.flush()
+
+
+def remove_products(product_ids, path=None):
+    """Drop products (deactivated, expired, deleted) from an existing index"""
+    path = path or INDEX_PATH
+    if np is None or not os.path.exists(path):
+        return
+    with _FileLock(path):
+        header, ids, vectors = _open(path, 'r+')
+        count = int(header[3])
+        for slot in np.flatnonzero(np.isin(ids[:count], list(product_ids))):
+            ids[slot] = 0
+            vectors[slot] = 0
+        ids.flush()
+        vectors.flush()
+
+
+def _get_reader(path):
+    """Read-only mapping of the index, remapped when the file is replaced"""
+    global _reader, _reader_key
+    stat = os.stat(path)
+    key = (path, stat.st_dev, stat.st_ino)
+    with _read_lock:
+        if _reader_key != key:
+            _reader = _open(path, 'r')
+            _reader_key = key
+        return _reader
+
+
+def _warn_missing(path):
+    """Say once per process that semantic ranking is off, instead of silently skipping it"""
+    global _warned_missing
+    if not _warned_missing:
+        _warned_missing = True
+        if np is None:
+            logger.warning("Chatbot semantic ranking is off: NumPy is not installed")
+        else:
+            logger.warning(f"Chatbot semantic ranking is off: no index at {path} (run manage.py build_semantic_index)")
+
+
+def similar_products(query, limit=CANDIDATES, path=None):
+    """
+    Ids of the products most similar to `query` with their cosine scores, best
+    first, keeping only those at or above MIN_SCORE. Empty if the index is unavailable.
+    """
+    path = path or INDEX_PATH
+    if np is None or not os.path.exists(path):
+        _warn_missing(path)
+        return []
+    try:
+        header, ids, vectors = _get_reader(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Chatbot semantic index unavailable: {e}")
+        return []
+
+    count = int(header[3])
+    query_vector = embed(query)
+    if not count or not query_vector.any():
+        return []
+
+    scores = vectors[:count] @ query_vector
+    limit = min(limit, count)
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    top = top[np.argsort(-scores[top])]
+    return [
+        (int(ids[slot]), float(scores[slot]))
+        for slot in top
+        if ids[slot] and scores[slot] >= MIN_SCORE
+    ]
@@ -0,0 +1,50 @@
+import logging
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from apps.products.models import Product
+from .result_cache import invalidate_search_cache
+from .search import invalidate_campus_recommendations
+from .semantic import index_products, remove_products
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_init, sender=Product)
+def remember_product_status(sender, instance, **kwargs):
+    instance._chatbot_loaded_status = instance.status
+    instance._chatbot_loaded_campus = (instance.university, instance.faculty)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    """Approval, expiry, edits and deletion all change what the chatbot may recommend"""
+    invalidate_campus_recommendations(instance.university, instance.faculty)
+    # Moved to another university or faculty: the old campus must stop recommending it
+    if instance._chatbot_loaded_campus != (instance.university, instance.faculty):
+        invalidate_campus_recommendations(*instance._chatbot_loaded_campus)
+    # Only active products are searchable: a status change or an edit to an active listing can change results
+    if instance.status == 'active' or instance.status != instance._chatbot_loaded_status:
+        invalidate_search_cache()
+    try:
+        if instance.status == 'active':
+            index_products([instance])
+        elif instance._chatbot_loaded_status == 'active':
+            remove_products([instance.pk])
+    except Exception as e:
+        # A stale semantic index only affects ranking; never fail the save over it
+        logger.error(f"Chatbot semantic index update failed: {e}")
+    instance._chatbot_loaded_status = instance.status
+    instance._chatbot_loaded_campus = (instance.university, instance.faculty)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    invalidate_campus_recommendations(instance.university, instance.faculty)
+    if instance.status == 'active':
+        invalidate_search_cache()
+        try:
+            remove_products([instance.pk])
+        except Exception as e:
+            logger.error(f"Chatbot semantic index update failed: {e}")
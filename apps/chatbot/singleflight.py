@@ -0,0 +1,130 @@
+"""
+Request coalescing ("singleflight") for identical chatbot turns.
+
+When many students send the same first message at once, one request (the
+leader) runs the LLM turn and the others wait for its result instead of each
+paying for the full pipeline. Turns are keyed by the normalized message, the
+user tier and the reply language (see flight_key). Within a process, waiters
+block on the leader's in-flight call; with CHATBOT_SINGLEFLIGHT_SHARED, workers
+also coordinate through a lock and a short-lived result in the shared cache.
+
+Only (reply, products) is shared, as a private copy per waiter; everything
+personal (session, history, audio) is still done per request by the views.
+"""
+import copy
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import registry, span
+from .result_cache import normalize_query, reply_language, user_tier
+
+# Seconds a waiter waits for the leader before computing the turn itself
+SINGLEFLIGHT_WAIT = getattr(settings, 'CHATBOT_SINGLEFLIGHT_WAIT', 30.0)
+# Coalesce across worker processes too (needs a cache shared between them)
+SINGLEFLIGHT_SHARED = getattr(settings, 'CHATBOT_SINGLEFLIGHT_SHARED', False)
+# How long a leader's result stays in the shared cache for other workers' waiters
+SINGLEFLIGHT_RESULT_TTL = 10
+POLL_SECONDS = 0.05
+
+LEADER = 'leader'
+SHARED = 'shared'
+ALONE = 'alone'
+
+
+def flight_key(message, user):
+    raw = '|'.join((normalize_query(message), *user_tier(user), reply_language(message)))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.result = None
+
+
+class SingleFlight:
+    """
+    join(key) returns (role, result):
+    LEADER: compute, then publish(key, result) or abandon(key);
+    SHARED: `result` is a copy of the leader's result;
+    ALONE: the leader failed or took too long, compute without publishing.
+    """
+
+    def __init__(self, wait=None, shared=None):
+        self.wait = wait or SINGLEFLIGHT_WAIT
+        self.shared = SINGLEFLIGHT_SHARED if shared is None else shared
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = _Flight()
+
+        if flight is not None:
+            with span('singleflight_wait'):
+                finished = flight.done.wait(self.wait)
+            if finished and flight.ok:
+                registry.increment('singleflight.shared')
+                return SHARED, copy.deepcopy(flight.result)
+            registry.increment('singleflight.alone')
+            return ALONE, None
+
+        if self.shared:
+            role, result = self._join_shared(key)
+            if role != LEADER:
+                # Another worker led: pass its outcome on to this process's waiters
+                self._finish(key, result, ok=role == SHARED)
+                registry.increment(f'singleflight.{role}')
+                return role, result
+        registry.increment('singleflight.leader')
+        return LEADER, None
+
+    def _join_shared(self, key):
+        lock_key = f'chatbot:flight-lock:{key}'
+        result_key = f'chatbot:flight:{key}'
+        # The lock expires on its own if the leading worker dies mid-turn
+        if cache.add(lock_key, 1, self.wait):
+            return LEADER, None
+        deadline = time.monotonic() + self.wait
+        with span('singleflight_wait'):
+            while time.monotonic() < deadline:
+                result = cache.get(result_key)
+                if result is not None:
+                    return SHARED, result
+                if cache.get(lock_key) is None:
+                    # Released: the result was just stored, or the leader gave up
+                    result = cache.get(result_key)
+                    return (SHARED, result) if result is not None else (ALONE, None)
+                time.sleep(POLL_SECONDS)
+        return ALONE, None
+
+    def _finish(self, key, result, ok):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.result = result
+            flight.ok = ok
+            flight.done.set()
+
+    def publish(self, key, result):
+        """Hand the leader's result to every waiter"""
+        if self.shared:
+            cache.set(f'chatbot:flight:{key}', result, SINGLEFLIGHT_RESULT_TTL)
+            cache.delete(f'chatbot:flight-lock:{key}')
+        self._finish(key, copy.deepcopy(result), ok=True)
+
+    def abandon(self, key):
+        """The leader has no shareable result: waiters compute their own"""
+        if self.shared:
+            cache.delete(f'chatbot:flight-lock:{key}')
+        self._finish(key, None, ok=False)
+
+
+flights = SingleFlight()
@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signing
+
+from .client import get_llm_client
+from .breaker import llm_call
+from .tts_cache import AudioCache
+
+logger = logging.getLogger(__name__)
+
+TTS_MODEL = getattr(settings, 'CHATBOT_TTS_MODEL', 'tts-1')
+TTS_VOICE = getattr(settings, 'CHATBOT_TTS_VOICE', 'alloy')
+# Limit text length for TTS to avoid excessive usage/latency
+TTS_MAX_CHARS = 1000
+# How long an audio link stays valid
+TTS_TOKEN_MAX_AGE = getattr(settings, 'CHATBOT_TTS_TOKEN_MAX_AGE', 60 * 60)
+TTS_WORKERS = getattr(settings, 'CHATBOT_TTS_WORKERS', 4)
+TTS_WAIT_TIMEOUT = 30
+TTS_SIGNING_SALT = 'apps.chatbot.speech'
+
+_executor = None
+_executor_pid = None
+_pending = {}
+_lock = threading.RLock()
+# Rendered MP3s by content hash; replies repeat a lot ("Found it! Here are the options...")
+audio_cache = AudioCache()
+
+
+def _get_executor():
+    """Per-process TTS worker pool (recreated after a fork, like the LLM client)"""
+    global _executor, _executor_pid, _pending
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        _executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix='chatbot-tts')
+        _executor_pid = pid
+        _pending = {}
+    return _executor
+
+
+def normalize_speech_text(text):
+    """Text as it is spoken: NFC, whitespace collapsed, capped at TTS_MAX_CHARS"""
+    text = re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text or '')).strip()
+    return text[:TTS_MAX_CHARS]
+
+
+def _audio_key(text):
+    return hashlib.sha256(f'{TTS_MODEL}|{TTS_VOICE}|{text}'.encode('utf-8')).hexdigest()
+
+
+def synthesize_speech(text):
+    """Call the TTS API and return the MP3 bytes"""
+    with llm_call('tts'):
+        speech_response = get_llm_client().audio.speech.create(
+            model=TTS_MODEL,
+            voice=TTS_VOICE,
+            input=text,
+        )
+    return speech_response.content
+
+
+def _render(text):
+    key = _audio_key(text)
+    audio = audio_cache.get(key)
+    if audio is None:
+        audio = synthesize_speech(text)
+        audio_cache.set(key, audio)
+    return audio
+
+
+def _forget(key):
+    with _lock:
+        _pending.pop(key, None)
+
+
+def schedule_speech(text):
+    """
+    Start rendering `text` in the background and return a signed token for it.
+    The token carries the text itself, so any worker or instance can serve the
+    audio: from the cache, by waiting on the local job, or by rendering on demand.
+    """
+    text = normalize_speech_text(text)
+    key = _audio_key(text)
+    with _lock:
+        executor = _get_executor()
+        # Already rendered, or being rendered for another reply: no new TTS call
+        hit = key in _pending or key in audio_cache
+        if not hit:
+            future = executor.submit(_render, text)
+            _pending[key] = future
+            future.add_done_callback(lambda _future: _forget(key))
+    audio_cache.record(hit)
+    return signing.dumps(text, salt=TTS_SIGNING_SALT, compress=True)
+
+
+def get_speech(token):
+    """
+    Return the MP3 bytes for a token from schedule_speech().
+    Raises signing.BadSignature (or SignatureExpired) for invalid tokens.
+    """
+    text = normalize_speech_text(signing.loads(token, salt=TTS_SIGNING_SALT, max_age=TTS_TOKEN_MAX_AGE))
+    key = _audio_key(text)
+    with _lock:
+        future = _pending.get(key)
+    if future is not None:
+        return future.result(timeout=TTS_WAIT_TIMEOUT)
+    return _render(text)
+
+
+def tts_cache_stats():
+    """Hit rate of the TTS cache (per reply asking for audio) in this process"""
+    return audio_cache.stats()
@@ -0,0 +1,48 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_events(events):
+    """Format the (event, data) pairs of a generator as SSE, passing its return value through"""
+    while True:
+        try:
+            event, data = next(events)
+        except StopIteration as stop:
+            return stop.value
+        yield sse_event(event, data)
+
+
+async def _iterate_async(events):
+    """
+    Drive a sync event generator from ASGI one item at a time.
+    Django would otherwise buffer a sync iterator completely before sending it.
+    thread_sensitive keeps every step (and its DB connection) on the same thread.
+    """
+    iterator = iter(events)
+    done = object()
+    next_event = sync_to_async(next, thread_sensitive=True)
+    while True:
+        event = await next_event(iterator, done)
+        if event is done:
+            break
+        yield event
+
+
+def event_stream_response(events, request):
+    """Wrap a generator of sse_event() strings in a StreamingHttpResponse for WSGI or ASGI"""
+    django_request = getattr(request, '_request', request)
+    if isinstance(django_request, ASGIRequest):
+        events = _iterate_async(events)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx/Cloud Run front proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -1,3 +1,1026 @@
-from django.test import TestCase
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import wave
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+import openai
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from apps.products.models import Category, Product
+from . import breaker, history, intent, limiter, pipeline, result_cache, search, semantic, singleflight, speech, tools, uploads
+from .client import build_openai_client, get_llm_client, reset_llm_client
+from .locations import split_location
+from .mock_llm import MockLLMClient
+from .metrics import registry
+from .models import ChatbotMessage, ChatbotSession
+from .prompts import TOOLS, build_messages, tool_result_content
+from .search import search_products
+from .tts_cache import AudioCache
+
+
+class StandInOpenAIServer:
+    """
+    Local stand-in for the OpenAI HTTP API.
+    Answers chat completions with a canned reply, counts TCP connections and can
+    add a per-connection delay to simulate the TLS handshake of the real endpoint.
+    """
+
+    def __init__(self, connect_delay=0.0, response_delay=0.0, reply="Found it! Here are the options..."):
+        self.connect_delay = connect_delay
+        self.response_delay = response_delay
+        self.reply = reply
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stand_in._lock:
+                    stand_in.connections += 1
+                time.sleep(stand_in.connect_delay)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                with stand_in._lock:
+                    stand_in.requests += 1
+                time.sleep(stand_in.response_delay)
+                body = json.dumps({
+                    "id": "chatcmpl-standin",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "gpt-4o",
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": stand_in.reply},
+                    }],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class PooledOpenAIClientTests(SimpleTestCase):
+    calls = 5
+
+    def _complete(self, client):
+        completion = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": "calculator"}],
+        )
+        return completion.choices[0].message.content
+
+    def test_pooled_client_reuses_one_connection(self):
+        with StandInOpenAIServer(connect_delay=0.05) as server:
+            # First call pays the SDK's lazy imports; keep that out of the measurement
+            warmup = build_openai_client(api_key="test", base_url=server.base_url)
+            self._complete(warmup)
+            warmup.close()
+            server.connections = server.requests = 0
+
+            client = build_openai_client(api_key="test", base_url=server.base_url)
+            started = time.perf_counter()
+            for _ in range(self.calls):
+                self.assertEqual(self._complete(client), server.reply)
+            pooled_elapsed = time.perf_counter() - started
+            client.close()
+
+            self.assertEqual(server.requests, self.calls)
+            self.assertEqual(server.connections, 1)
+
+            # Old behaviour: a fresh client (and connection) per request
+            server.connections = 0
+            started = time.perf_counter()
+            for _ in range(self.calls):
+                fresh = build_openai_client(api_key="test", base_url=server.base_url)
+                self._complete(fresh)
+                fresh.close()
+            fresh_elapsed = time.perf_counter() - started
+
+            self.assertEqual(server.connections, self.calls)
+        # Wall-clock numbers depend on the machine: reported on request, not asserted
+        if os.environ.get("CHATBOT_BENCHMARKS"):
+            print(f"\nOpenAI client, {self.calls} calls: pooled {pooled_elapsed * 1000:.0f} ms, "
+                  f"fresh client per call {fresh_elapsed * 1000:.0f} ms")
+
+
+class SummaryClient:
+    """Minimal client whose completions return a fixed summary and record the prompts"""
+
+    def __init__(self, summary="Wants a cheap calculator in Cairo."):
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.summary = summary
+
+    def _create(self, **kwargs):
+        self.prompts.append(kwargs["messages"])
+        message = SimpleNamespace(content=self.summary)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class ScriptedClient:
+    """Client whose completions replay `replies`: text, or a list of (tool name, arguments) calls"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.requests.append(kwargs)
+        reply = self.replies.pop(0)
+        if isinstance(reply, str):
+            message = SimpleNamespace(content=reply, tool_calls=None)
+        else:
+            message = SimpleNamespace(content=None, tool_calls=[
+                SimpleNamespace(id=f"call_{index}", function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+                for index, (name, args) in enumerate(reply)
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@mock.patch.object(history, "SUMMARY_MAX_TOKENS", 20)
+@mock.patch.object(history, "HISTORY_TOKEN_BUDGET", 120)
+@mock.patch.object(history, "PRUNE_EVERY", float("inf"))  # no background cleanup inside test transactions
+class ChatbotHistoryTests(TestCase):
+    def _converse(self, session, client, turns):
+        for turn in range(turns):
+            history.remember_turn(session, f"question {turn} " + "x" * 60, f"answer {turn} " + "y" * 60)
+            history.compact_history(session, client)
+
+    def test_context_stays_within_budget(self):
+        session = ChatbotSession.objects.create()
+        client = SummaryClient()
+        self._converse(session, client, 10)
+
+        context = history.build_history(session)
+        used = sum(history.estimate_tokens(message["content"]) for message in context)
+        self.assertLessEqual(used, history.HISTORY_TOKEN_BUDGET + history.MESSAGE_OVERHEAD_TOKENS)
+        self.assertEqual(context[0]["role"], "system")
+        self.assertIn(client.summary, context[0]["content"])
+        # Most recent exchange is kept verbatim, in order
+        self.assertEqual([m["role"] for m in context[-2:]], ["user", "assistant"])
+        self.assertTrue(context[-1]["content"].startswith("answer 9"))
+
+    def test_older_turns_are_summarized_in_batches(self):
+        session = ChatbotSession.objects.create()
+        client = SummaryClient()
+        self._converse(session, client, 10)
+
+        self.assertEqual(ChatbotMessage.objects.filter(session=session).count(), 20)
+        self.assertLess(len(client.prompts), 10)
+        session.refresh_from_db()
+        self.assertEqual(session.summary, client.summary)
+        # The previous summary is fed into the next one
+        self.assertIn(client.summary, client.prompts[-1][1]["content"])
+
+    def test_compaction_is_scheduled_off_the_request_path(self):
+        session = ChatbotSession.objects.create()
+        client = SummaryClient()
+        with mock.patch.object(history, "_get_executor") as executor:
+            history.remember_turn(session, "short", "short")
+            history.schedule_compaction(session, client)
+            executor.return_value.submit.assert_not_called()
+
+            for turn in range(3):
+                history.remember_turn(session, f"question {turn} " + "x" * 60, f"answer {turn} " + "y" * 60)
+            history.schedule_compaction(session, client)
+            history.schedule_compaction(session, client)  # already queued
+        executor.return_value.submit.assert_called_once()
+        self.assertEqual(client.prompts, [])
+
+        # The worker holds a limiter slot while it summarizes
+        worker, session_id, _ = executor.return_value.submit.call_args.args
+        with mock.patch.object(history, "connections"), \
+                mock.patch.object(history, "llm_slot", wraps=history.llm_slot) as slot:
+            worker(session_id, client)
+        slot.assert_called_once()
+        session.refresh_from_db()
+        self.assertEqual(session.summary, client.summary)
+        self.assertNotIn(session.pk, history._compacting)
+
+    def test_session_lookup_is_scoped_to_owner(self):
+        session = ChatbotSession.objects.create(user=None)
+        self.assertEqual(history.get_session(str(session.key), None), session)
+        self.assertNotEqual(history.get_session("not-a-uuid", None), session)
+
+    def test_session_is_written_once_the_client_continues_it(self):
+        owner = get_user_model().objects.create(username="owner")
+        session = history.get_session(None, owner)
+        history.remember_turn(session, "first question", "first answer")
+        history.schedule_compaction(session, SummaryClient())
+        self.assertFalse(ChatbotSession.objects.exists())
+        # Only the owner can pick up the cached first turn
+        self.assertIsNone(history.get_session(str(session.key), None).pk)
+
+        continued = history.get_session(str(session.key), owner)
+        self.assertEqual((continued.key, continued.user), (session.key, owner))
+        self.assertEqual(
+            [m["content"] for m in history.build_history(continued)], ["first question", "first answer"]
+        )
+        history.remember_turn(continued, "second question", "second answer")
+        self.assertEqual(ChatbotMessage.objects.filter(session=continued).count(), 4)
+
+    def test_idle_sessions_are_pruned(self):
+        idle, active = ChatbotSession.objects.create(), ChatbotSession.objects.create()
+        ChatbotSession.objects.filter(pk=idle.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=history.SESSION_RETENTION + 60)
+        )
+        # Storing a turn only queues the cleanup
+        with mock.patch.object(history, "PRUNE_EVERY", 600), mock.patch.object(history, "_last_prune", 0.0), \
+                mock.patch.object(history, "_get_executor") as executor:
+            history.remember_turn(active, "short", "short")
+            history.remember_turn(active, "short", "short")
+        executor.return_value.submit.assert_called_once_with(history._prune_in_worker)
+        self.assertEqual(ChatbotSession.objects.count(), 2)
+
+        out = StringIO()
+        call_command("prune_chatbot_sessions", stdout=out)
+        self.assertIn("Deleted 1 ", out.getvalue())
+        self.assertEqual(list(ChatbotSession.objects.all()), [active])
+
+    def test_history_keeps_whole_turns(self):
+        session = ChatbotSession.objects.create()
+        history.remember_turn(session, "hi", "hello")
+        # The reply alone would fit the budget, the whole turn does not
+        history.remember_turn(session, "q" * 440, "short answer")
+        self.assertEqual(history.build_history(session), [])
+
+        session = ChatbotSession.objects.create()
+        for turn in range(2):
+            history.remember_turn(session, f"question {turn}", f"answer {turn}")
+        # The summary covers the first question but not its answer
+        session.summarized_until = ChatbotMessage.objects.filter(session=session).order_by("id")[0].id
+        self.assertEqual(
+            [m["content"] for m in history.build_history(session)], ["question 1", "answer 1"]
+        )
+
+    def test_summary_folds_whole_turns(self):
+        session = ChatbotSession.objects.create()
+        client = SummaryClient()
+        for turn in range(6):
+            history.remember_turn(session, f"question {turn} " + "x" * 100, f"answer {turn}")
+            history.compact_history(session, client)
+        session.refresh_from_db()
+        self.assertTrue(session.summary)
+        first_kept = ChatbotMessage.objects.filter(session=session, id__gt=session.summarized_until).order_by("id")[0]
+        self.assertEqual(first_kept.role, ChatbotMessage.ROLE_USER)
+
+
+class SemanticIndexTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(semantic, "INDEX_PATH", os.path.join(tmp.name, "semantic.idx"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.seller = get_user_model().objects.create(username="seller")
+        self.category = Category.objects.create(name="Electronics")
+        self.calculator = self._product("Casio scientific calculator", "Barely used, for engineering students")
+        self.arduino = self._product("Arduino Uno starter kit", "Microcontroller board with sensors")
+
+    def _product(self, title, description, status="active"):
+        return Product.objects.create(
+            title=title, description=description, price=100, condition="used",
+            category=self.category, seller=self.seller, status=status,
+        )
+
+    def _build(self):
+        return semantic.build_index(Product.objects.filter(status="active").select_related("category"))
+
+    def test_nothing_is_written_before_the_index_is_built(self):
+        self._product("Lab coat", "White lab coat")
+        self.assertFalse(os.path.exists(semantic.INDEX_PATH))
+        with mock.patch.object(semantic, "_warned_missing", False), \
+                self.assertLogs(semantic.logger, "WARNING") as logs:
+            self.assertEqual(semantic.similar_products("lab coat"), [])
+            self.assertEqual(semantic.similar_products("lab coat"), [])
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("build_semantic_index", logs.output[0])
+
+    def test_misspelled_query_finds_product(self):
+        self.assertEqual(self._build(), 2)
+        matches = semantic.similar_products("calculater")
+        self.assertEqual(matches[0][0], self.calculator.id)
+        self.assertEqual([p["id"] for p in search_products("calculater")], [self.calculator.id])
+        # Substring matches still come first
+        self.assertEqual(search_products("arduino")[0]["id"], self.arduino.id)
+
+    def test_semantic_candidates_do_not_displace_substring_matches_from_other_tiers(self):
+        student = get_user_model().objects.create(username="student", university="Cairo University")
+        near_miss = Product.objects.create(
+            title="Sciantific kalkulator", description="Kit for engineering", price=50,
+            condition="used", category=self.category, seller=self.seller, status="active",
+            university="Cairo University",
+        )
+        self._build()
+        self.assertIn(near_miss.id, [pid for pid, _ in semantic.similar_products("scientific calculator")])
+        # The exact match from another university wins over a semantic hit on the user's own campus
+        self.assertEqual(
+            [p["id"] for p in search_products("scientific calculator", student)], [self.calculator.id]
+        )
+
+    def test_index_follows_approval_and_deactivation(self):
+        self._build()
+        lab_coat = self._product("Lab coat size M", "White coat for chemistry labs", status="pending")
+        self.assertNotIn(lab_coat.id, [pid for pid, _ in semantic.similar_products("labcoat")])
+
+        lab_coat.status = "active"
+        lab_coat.save()
+        self.assertEqual(semantic.similar_products("labcoat")[0][0], lab_coat.id)
+
+        lab_coat.status = "expired"
+        lab_coat.save()
+        self.assertNotIn(lab_coat.id, [pid for pid, _ in semantic.similar_products("labcoat")])
+
+    def test_index_grows_past_its_capacity(self):
+        self._build()
+        with mock.patch.object(semantic, "INITIAL_CAPACITY", 2):
+            semantic.build_index(Product.objects.filter(status="active").select_related("category"))
+        pencils = self._product("Pencil set HB 2B", "Drawing pencils")
+        self.assertEqual(semantic.similar_products("pencils")[0][0], pencils.id)
+        self.assertEqual(semantic.similar_products("calculater")[0][0], self.calculator.id)
+
+
+class CampusRecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.seller = get_user_model().objects.create(username="seller")
+        self.category = Category.objects.create(name="Tools")
+        self.student = SimpleNamespace(university="Cairo University", faculty="Engineering")
+
+    def _product(self, title, university, faculty, status="active"):
+        return Product.objects.create(
+            title=title, description="", price=100, condition="used", category=self.category,
+            seller=self.seller, status=status, university=university, faculty=faculty,
+        )
+
+    def _recommended(self):
+        return [product["id"] for product in search.get_personalized_recommendations(self.student)]
+
+    def test_same_university_and_faculty_rank_first(self):
+        university_only = self._product("Ruler", "Cairo University", "Commerce")
+        both = self._product("Calculator", " cairo university", "ENGINEERING ")
+        faculty_only = self._product("Drawing board", "Ain Shams University", "Engineering")
+        self._product("Brush", "Alexandria University", "Arts")
+        self._product("Old calculator", "Cairo University", "Engineering", status="pending")
+        self.assertEqual(self._recommended(), [both.id, university_only.id, faculty_only.id])
+
+    def test_moving_a_product_expires_the_old_campus(self):
+        product = self._product("Calculator", "Cairo University", "Engineering")
+        self.assertEqual(self._recommended(), [product.id])
+        with self.assertNumQueries(0):
+            self._recommended()  # served from the cache
+
+        product.university, product.faculty = "Alexandria University", "Arts"
+        product.save()
+        self.assertEqual(self._recommended(), [])
+
+
+@mock.patch.object(search, "similar_products", return_value=[])  # substring matching only
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.seller = get_user_model().objects.create(username="seller")
+        self.category = Category.objects.create(name="Stationery")
+
+    def _product(self, title, price, description="", status="active", **campus):
+        return Product.objects.create(
+            title=title, description=description, price=price, condition="used",
+            category=self.category, seller=self.seller, status=status, **campus,
+        )
+
+    def _found(self, query, user=None):
+        return [product["id"] for product in search_products(query, user)]
+
+    def test_match_strategy_order_then_price_limited_to_three(self, _):
+        pad = self._product("Calc pad", 10)  # shortened term only
+        kit = self._product("Study kit", 50, description="Comes with a calculator")
+        graphing = self._product("Graphing calculator", 500)
+        casio = self._product("Casio calculator", 200)
+        self._product("Old calculator", 1, status="expired")
+        # Full term in the title, then in the description, then the shortened term; cheapest first within each
+        self.assertEqual(self._found("calculator"), [casio.id, graphing.id, kit.id])
+        self.assertEqual(self._found("calc"), [pad.id, casio.id, graphing.id])
+
+    def test_only_the_best_campus_tier_is_returned(self, _):
+        student = SimpleNamespace(university="Cairo University", faculty="Engineering")
+        elsewhere = self._product("Ruler", 5, university="Ain Shams University", faculty="Engineering")
+        same_university = self._product("Metal ruler", 20, university="Cairo University", faculty="Commerce")
+        same_faculty = self._product("Long ruler", 30, university="cairo university ", faculty="ENGINEERING")
+        self.assertEqual(self._found("ruler", student), [same_faculty.id])
+        same_faculty.delete()
+        self.assertEqual(self._found("ruler", student), [same_university.id])
+        self.assertEqual(self._found("ruler"), [elsewhere.id, same_university.id])
+
+    def test_named_location_filters_without_fallback(self, _):
+        student = SimpleNamespace(university="Cairo University", faculty="Engineering")
+        self._product("Ruler", 5, university="Cairo University", faculty="Engineering", governorate="Cairo")
+        giza = self._product("Ruler", 50, governorate="Giza")
+        self.assertEqual(self._found("ruler from giza", student), [giza.id])
+        self.assertEqual(self._found("ruler in alex", student), [])
+
+
+class SearchResultCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # These tests exercise the LLM path; plain searches would skip it
+        patcher = mock.patch.object(intent, "FAST_PATH", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Product.objects.create(
+            title="Casio calculator", description="Scientific", price=250, condition="used",
+            category=Category.objects.create(name="Calculators"),
+            seller=get_user_model().objects.create(username="seller"), status="active",
+        )
+
+    def _turn(self, client, history=None):
+        return pipeline.drain(pipeline.run_turn(client, "I need a calculator", None, history=history))
+
+    def _search(self, *then):
+        return [("search_products", {"query": "calculator"})], *then
+
+    def test_repeated_search_skips_the_follow_up_completion(self):
+        first = ScriptedClient(*self._search("Here is a Casio calculator."))
+        reply, products = self._turn(first)
+        self.assertEqual(len(first.requests), 2)
+
+        second = ScriptedClient(*self._search())
+        self.assertEqual(self._turn(second), (reply, products))
+        self.assertEqual(len(second.requests), 1)
+
+        # A product change expires every cached search
+        result_cache.invalidate_search_cache()
+        third = ScriptedClient(*self._search("Fresh answer."))
+        self.assertEqual(self._turn(third)[0], "Fresh answer.")
+        self.assertEqual(len(third.requests), 2)
+
+    def test_conversation_specific_turns_are_not_cached(self):
+        # Later rounds used another tool
+        self._turn(ScriptedClient(*self._search(
+            [("get_personalized_recommendations", {})], "Calculators, plus picks for your campus.",
+        )))
+        # The answer depended on earlier turns
+        history = [{"role": "user", "content": "My budget is 100 EGP"}, {"role": "assistant", "content": "Noted."}]
+        self._turn(ScriptedClient(*self._search("Over your budget, sorry.")), history=history)
+
+        client = ScriptedClient(*self._search("Here is a Casio calculator."))
+        self.assertEqual(self._turn(client)[0], "Here is a Casio calculator.")
+        self.assertEqual(len(client.requests), 2)
+
+
+class ToolCallTests(SimpleTestCase):
+    def test_parallel_calls_run_together_and_keep_call_order(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def run(name, args, user, user_message):
+            # Every call waits for the other two, so this only passes if they run at once
+            barrier.wait()
+            time.sleep(0.05 * (3 - args["n"]))  # the first call finishes last
+            return args["n"], None
+
+        calls = [("search_products", {"n": n}) for n in range(3)]
+        with mock.patch.object(tools, "_run_tool", side_effect=run):
+            self.assertEqual(tools.run_tool_calls(calls, None, "hi"), [(0, None), (1, None), (2, None)])
+
+    def test_failing_call_does_not_drop_the_others(self):
+        def run(name, args, user, user_message):
+            if name == "escalate_to_supervisor":
+                raise RuntimeError("outbox down")
+            return [{"id": 1}], [{"id": 1}]
+
+        calls = [("search_products", {}), ("escalate_to_supervisor", {}), ("get_personalized_recommendations", {})]
+        with mock.patch.object(tools, "_run_tool", side_effect=run), self.assertLogs(tools.logger, "ERROR"):
+            results = tools.run_tool_calls(calls, None, "hi")
+        self.assertEqual(results, [
+            ([{"id": 1}], [{"id": 1}]),
+            ({"error": "Tool 'escalate_to_supervisor' failed"}, None),
+            ([{"id": 1}], [{"id": 1}]),
+        ])
+
+    @mock.patch.object(pipeline, "MAX_TOOL_ROUNDS", 2)
+    def test_tool_rounds_are_capped(self):
+        recommend = [("get_personalized_recommendations", {})]
+        client = ScriptedClient(recommend, recommend, "Here are some picks.")
+        with mock.patch.object(tools, "_run_tool", return_value=([], [])):
+            reply, products = pipeline.drain(pipeline._llm_turn(client, "Surprise me", None, False, None))
+        self.assertEqual((reply, products), ("Here are some picks.", []))
+        self.assertEqual(["tools" in request for request in client.requests], [True, True, False])
+        # Both rounds of tool results went back to the model
+        self.assertEqual([m["role"] for m in client.requests[-1]["messages"][-4:]], ["assistant", "tool"] * 2)
+
+
+@override_settings(
+    CHATBOT_LLM_BACKEND="mock",
+    CHATBOT_MOCK_LATENCY={"completion": 0, "chunk": 0, "transcription": 0, "speech": 0},
+)
+class MockBackendTests(TestCase):
+    def setUp(self):
+        reset_llm_client()
+        self.addCleanup(reset_llm_client)
+        # These tests exercise the LLM path; plain searches would skip it
+        patcher = mock.patch.object(intent, "FAST_PATH", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        seller = get_user_model().objects.create(username="seller")
+        category = Category.objects.create(name="Calculators")
+        self.product = Product.objects.create(
+            title="Casio calculator", description="Scientific", price=250, condition="used",
+            category=category, seller=seller, status="active",
+        )
+
+    def test_full_tool_flow_without_network(self):
+        response = self.client.post(reverse("chatbot"), {"message": "I need a calculator"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([p["id"] for p in data["products"]], [self.product.id])
+        self.assertIn("Casio calculator", data["reply"])
+
+    def test_tts_reply_links_to_its_audio(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with mock.patch.object(speech, "audio_cache", AudioCache(tmp.name, max_bytes=100000)):
+            data = self.client.post(reverse("chatbot"), {"message": "I need a calculator", "tts": "true"}).json()
+            self.assertNotIn("audio", data)
+            response = self.client.get(data["audio_url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "audio/mpeg")
+        self.assertEqual(response.content, speech.synthesize_speech(speech.normalize_speech_text(data["reply"])))
+        # Without tts there is no audio at all
+        data = self.client.post(reverse("chatbot"), {"message": "I need a calculator"}).json()
+        self.assertNotIn("audio_url", data)
+
+    def test_audio_link_must_be_signed(self):
+        forged = signing.dumps("Hello", salt="not-the-tts-salt", compress=True)
+        response = self.client.get(reverse("chatbot-audio", args=[forged]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_reassembles_tool_call_fragments(self):
+        response = self.client.post(reverse("chatbot-stream"), {"message": "I need a calculator"})
+        body = b"".join(response.streaming_content).decode("utf-8")
+        self.assertIn('event: tool_call\ndata: {"name": "search_products", "arguments": {"query": "calculator"}}', body)
+        self.assertIn("event: done", body)
+
+    def test_vendor_outage_degrades_to_search_and_opens_the_breaker(self):
+        outage = breaker.CircuitBreaker(min_calls=2, failure_rate=0.5, cooldown=60)
+        error = openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+        completions = get_llm_client().chat.completions
+        with mock.patch.object(breaker, "llm_breaker", outage), \
+                mock.patch.object(completions, "create", side_effect=error) as create:
+            for _ in range(3):
+                response = self.client.post(reverse("chatbot"), {"message": "I need a calculator"})
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                self.assertTrue(data["degraded"])
+                self.assertEqual([p["id"] for p in data["products"]], [self.product.id])
+                self.assertIn("Casio calculator", data["reply"])
+            # Two failures opened the breaker; the third request never called the vendor
+            self.assertEqual(create.call_count, 2)
+            self.assertEqual(outage.stats()["state"], breaker.OPEN)
+
+    def test_stream_falls_back_to_search_while_the_llm_is_unavailable(self):
+        outage = breaker.CircuitBreaker(min_calls=1, cooldown=60)
+        outage.record(True)
+        completions = get_llm_client().chat.completions
+        with mock.patch.object(breaker, "llm_breaker", outage), mock.patch.object(completions, "create") as create:
+            response = self.client.post(reverse("chatbot-stream"), {"message": "عايز calculator"})
+            body = b"".join(response.streaming_content).decode("utf-8")
+        create.assert_not_called()
+        events = [
+            (event[len("event: "):], json.loads(data[len("data: "):]))
+            for event, data in (block.split("\n") for block in body.strip().split("\n\n"))
+        ]
+        self.assertEqual([name for name, _ in events], ["session", "products", "delta", "done"])
+        self.assertEqual([p["id"] for p in events[1][1]["products"]], [self.product.id])
+        # The filler words are dropped before searching and the reply keeps the user's language
+        self.assertTrue(events[2][1]["text"].startswith("المساعد غير متاح مؤقتاً، لكن هذه نتائج البحث عن \"calculator\""))
+        self.assertTrue(events[3][1]["degraded"])
+
+    def test_plain_search_skips_the_llm(self):
+        completions = get_llm_client().chat.completions
+        with mock.patch.object(intent, "FAST_PATH", True), mock.patch.object(completions, "create") as create:
+            response = self.client.post(reverse("chatbot"), {"message": "عايز calculator"})
+            body = b"".join(self.client.post(
+                reverse("chatbot-stream"), {"message": "calculator"}
+            ).streaming_content).decode("utf-8")
+        create.assert_not_called()
+        data = response.json()
+        self.assertEqual([p["id"] for p in data["products"]], [self.product.id])
+        self.assertTrue(data["reply"].startswith("هذه نتائج البحث"))
+        self.assertIn("Casio calculator", data["reply"])
+        self.assertIn('event: products', body)
+        self.assertNotIn('event: tool_call', body)
+
+    def test_stage_timings_reach_header_and_registry(self):
+        registry.reset()
+        response = self.client.post(reverse("chatbot"), {"message": "I need a calculator"})
+        timing = response["Server-Timing"]
+        for stage in ("history;", "completion;", "tool.search_products;", "total;", "tokens;"):
+            self.assertIn(stage, timing)
+        stages = registry.snapshot()["stages"]
+        self.assertEqual(stages["completion"]["count"], 2)
+        self.assertGreater(stages["completion"]["prompt_tokens"], 0)
+        self.assertGreater(stages["tool.search_products"]["queries"], 0)
+        self.assertEqual(stages["request"]["count"], 1)
+
+
+class PromptBuilderTests(SimpleTestCase):
+    def test_static_prefix_is_byte_identical_across_requests(self):
+        first = build_messages("calculator")
+        second = build_messages("لاب كوت", [{"role": "system", "content": "Summary: ..."}])
+        prefix = json.dumps([TOOLS, first[0]], ensure_ascii=False)
+        self.assertEqual(prefix, json.dumps([TOOLS, second[0]], ensure_ascii=False))
+        self.assertFalse(first[0]["content"].startswith((" ", "\n")))
+        self.assertNotIn("  \n", first[0]["content"])
+
+    def test_tool_results_are_projected(self):
+        product = {
+            "id": 7, "title": "مسطرة", "description": "word " * 60, "price": 25.0, "condition": "used",
+            "category": "Tools", "university": "Cairo", "faculty": "Engineering",
+            "seller": {"id": 3, "name": "Sara", "username": "sara"},
+        }
+        content = tool_result_content([product])
+        self.assertIn('"title":"مسطرة"', content)
+        compact = json.loads(content)[0]
+        self.assertEqual(set(compact), {"id", "title", "price", "condition", "description"})
+        self.assertLessEqual(len(compact["description"]), 121)
+        self.assertEqual(tool_result_content({"message": "ok"}), '{"message":"ok"}')
+
+
+INTENT_CORPUS = [
+    # (message, fast path, reason)
+    ("calculator", True, "search"),
+    ("lab coat in cairo", True, "search"),
+    ("I need a scientific calculator", True, "search"),
+    ("do you have a multimeter?", True, "search"),
+    ("عايز بالطو", True, "search"),
+    ("مسطرة في الجيزة", True, "search"),
+    ("where is my order", False, "support"),
+    ("I want to talk to a supervisor", False, "support"),
+    ("عايز اكلم مشرف", False, "support"),
+    ("recommend something for first year", False, "recommendation"),
+    ("show me cheaper ones", False, "follow_up"),
+    ("how does delivery work", False, "support"),
+    ("hello", False, "small_talk"),
+    ("can you help me", False, "model"),
+    ("I am a second year engineering student at Cairo University looking for tools", False, "long"),
+]
+
+
+class IntentClassifierTests(SimpleTestCase):
+    def test_corpus(self):
+        for message, fast_path, reason in INTENT_CORPUS:
+            with self.subTest(message=message):
+                routed = intent.classify_intent(message)
+                self.assertEqual((routed.fast_path, routed.reason), (fast_path, reason))
+        self.assertEqual(intent.classify_intent("I need a scientific calculator").query, "scientific calculator")
+
+
+@override_settings(CHATBOT_LLM_BACKEND="mock")
+class LLMLimiterTests(SimpleTestCase):
+    def wait_until_queued(self, llm_limiter, count):
+        deadline = time.monotonic() + 5
+        while llm_limiter.stats()["queued"] < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_waiting_calls_are_granted_round_robin_per_caller(self):
+        llm_limiter = limiter.LLMLimiter(concurrency=1, queue_size=10, per_user=5)
+        order = []
+
+        def call(key, name):
+            with limiter.caller(key), llm_limiter.slot():
+                order.append(name)
+
+        threads = []
+        with limiter.caller("a"), llm_limiter.slot():
+            for key, name in (("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")):
+                thread = threading.Thread(target=call, args=(key, name))
+                thread.start()
+                threads.append(thread)
+                self.wait_until_queued(llm_limiter, len(threads))
+        for thread in threads:
+            thread.join()
+        # b1 queued last but does not wait behind all of a's calls
+        self.assertEqual(order, ["a1", "b1", "a2", "a3"])
+
+    def test_breaker_lets_one_trial_call_through_after_the_cooldown(self):
+        llm_breaker = breaker.CircuitBreaker(min_calls=1, cooldown=0.01)
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        with self.assertRaises(openai.RateLimitError):
+            with llm_breaker.guard():
+                raise openai.RateLimitError("slow down", response=httpx.Response(429, request=request), body=None)
+        with self.assertRaises(breaker.LLMUnavailable):
+            with llm_breaker.guard():
+                pass
+        time.sleep(0.02)
+        self.assertTrue(llm_breaker.allow())
+        self.assertFalse(llm_breaker.allow())  # only one trial at a time
+        llm_breaker.record(False)
+        self.assertEqual(llm_breaker.state, breaker.CLOSED)
+
+    def test_requests_are_rejected_fast_when_the_queue_is_full(self):
+        full = limiter.LLMLimiter(concurrency=1, queue_size=0, per_user=1)
+        holding, done = threading.Event(), threading.Event()
+
+        def hold_slot():
+            with limiter.caller("other"), full.slot():
+                holding.set()
+                done.wait(5)
+
+        holder = threading.Thread(target=hold_slot)
+        holder.start()
+        self.addCleanup(holder.join)
+        self.addCleanup(done.set)
+        holding.wait(5)
+        with mock.patch.object(limiter, "llm_limiter", full):
+            started = time.monotonic()
+            response = self.client.post(reverse("chatbot"), {"message": "recommend me a calculator"})
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], str(response.json()["retry_after"]))
+            # The same caller over its own share gets a 429
+            with self.assertRaises(limiter.LLMBusy) as busy:
+                full.admit("other")
+            self.assertEqual(busy.exception.status, 429)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_identical_concurrent_turns_share_one_llm_turn(self):
+        client = MockLLMClient(latency={"completion": 0.2, "chunk": 0})
+        create = mock.Mock(wraps=client.chat.completions.create)
+        client.chat.completions.create = create
+        flights = singleflight.SingleFlight(wait=5)
+        key = singleflight.flight_key("hello", None)
+        results = []
+
+        def turn():
+            results.append(pipeline.drain(pipeline.run_turn(client, "hello", None)))
+
+        with mock.patch.object(pipeline, "flights", flights):
+            threads = [threading.Thread(target=turn)]
+            threads[0].start()
+            deadline = time.monotonic() + 5
+            while key not in flights._flights:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.001)
+            threads.extend(threading.Thread(target=turn) for _ in range(3))
+            for thread in threads[1:]:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(set(reply for reply, _ in results)), 1)
+
+    def test_workers_share_a_result_through_the_cache(self):
+        leader = singleflight.SingleFlight(wait=5, shared=True)
+        other_worker = singleflight.SingleFlight(wait=5, shared=True)
+        joined = []
+        self.assertEqual(leader.join("k")[0], singleflight.LEADER)
+        polling = threading.Event()
+        sleep = time.sleep
+
+        def poll_sleep(seconds):
+            polling.set()
+            sleep(seconds)
+
+        waiter = threading.Thread(target=lambda: joined.append(other_worker.join("k")))
+        with mock.patch.object(singleflight.time, "sleep", poll_sleep):
+            waiter.start()
+            polling.wait(5)
+            leader.publish("k", ("reply", [{"id": 1}]))
+            waiter.join()
+        self.assertEqual(joined, [(singleflight.SHARED, ("reply", [{"id": 1}]))])
+
+        # A leader that gives up sends the others off to compute their own turn
+        self.assertEqual(leader.join("k2")[0], singleflight.LEADER)
+        leader.abandon("k2")
+        self.assertEqual(other_worker.join("k2")[0], singleflight.LEADER)
+
+
+@override_settings(CHATBOT_LLM_BACKEND="mock", CHATBOT_MOCK_LATENCY={"speech": 0})
+class SpeechCacheTests(SimpleTestCase):
+    def setUp(self):
+        reset_llm_client()
+        self.addCleanup(reset_llm_client)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = AudioCache(tmp.name, max_bytes=100000)
+        patcher = mock.patch.object(speech, "audio_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_reply_is_served_from_disk(self):
+        first = speech.get_speech(speech.schedule_speech("Found it! Here are the options..."))
+        with mock.patch.object(speech, "synthesize_speech") as synthesize:
+            # Same text up to whitespace: same key, no TTS call
+            second = speech.get_speech(speech.schedule_speech("Found it!  Here are the options...\n"))
+            synthesize.assert_not_called()
+        self.assertEqual(first, second)
+        stats = speech.tts_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_least_recently_used_audio_is_evicted(self):
+        # ~417 bytes per MP3 frame, 2.5 frames per character: ~8 KB per 8-character reply
+        self.cache.max_bytes = 20000
+        for text in ("reply aa", "reply bb"):
+            speech.get_speech(speech.schedule_speech(text))
+        os.utime(self.cache._path(speech._audio_key("reply aa")), (0, 0))
+        speech.get_speech(speech.schedule_speech("reply bb"))  # refreshes bb
+        speech.get_speech(speech.schedule_speech("reply cc"))
+
+        self.assertNotIn(speech._audio_key("reply aa"), self.cache)
+        self.assertIn(speech._audio_key("reply bb"), self.cache)
+        self.assertIn(speech._audio_key("reply cc"), self.cache)
+        self.assertLessEqual(self.cache.stats()["bytes"], self.cache.max_bytes)
+
+
+def wav_upload(seconds, rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(1)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x80" * int(seconds * rate))
+    return SimpleUploadedFile("note.wav", buffer.getvalue(), content_type="audio/wav")
+
+
+@mock.patch.object(uploads, "AUDIO_MAX_SECONDS", 2)
+@mock.patch.object(uploads, "AUDIO_MAX_BITRATE", 64_000)  # 16 KB for two seconds
+class UploadTests(SimpleTestCase):
+    def test_audio_size_and_duration_limits(self):
+        with mock.patch.object(uploads, "AUDIO_MAX_BYTES", 10_000):
+            self.assertIn("too large", uploads.validate_audio_upload(wav_upload(1.5)))
+        self.assertIsNone(uploads.validate_audio_upload(wav_upload(1.5)))
+        # The WAV header wins over what the client reports
+        self.assertIn("too long", uploads.validate_audio_upload(wav_upload(3), "1"))
+
+        def webm(size):
+            return SimpleUploadedFile("note.webm", b"\x1a" * size, content_type="audio/webm")
+        self.assertIsNone(uploads.validate_audio_upload(webm(10_000), "1.5"))
+        self.assertIsNone(uploads.validate_audio_upload(webm(10_000)))
+        self.assertIn("too long", uploads.validate_audio_upload(webm(10_000), "90"))
+        # Without a readable header a large recording is refused whatever the client claims
+        self.assertIn("too long", uploads.validate_audio_upload(webm(20_000)))
+        self.assertIn("too long", uploads.validate_audio_upload(webm(20_000), "1"))
+
+    def test_whisper_buffers_are_closed_when_the_call_fails(self):
+        for size in (1_000, 5_000):
+            upload = SimpleUploadedFile("note.webm", b"\x1a" * size, content_type="audio/webm")
+            with mock.patch.object(uploads, "AUDIO_IN_MEMORY_MAX_BYTES", 2_000):
+                with self.assertRaises(RuntimeError):
+                    with uploads.whisper_file(upload) as (filename, buffer, content_type):
+                        self.assertEqual((filename, content_type), ("recording.webm", "audio/webm"))
+                        self.assertEqual(buffer.read(), b"\x1a" * size)
+                        raise RuntimeError("upstream failed")
+            self.assertTrue(buffer.closed)
+            self.assertFalse(upload.closed)
+
+    def test_django_temporary_upload_is_passed_through(self):
+        upload = TemporaryUploadedFile("note.ogg", "audio/ogg", 3, None)
+        self.addCleanup(upload.close)
+        upload.write(b"Ogg")
+        with uploads.whisper_file(upload) as (filename, buffer, content_type):
+            self.assertIs(buffer, upload.file)
+            self.assertEqual((filename, buffer.read()), ("recording.ogg", b"Ogg"))
+        self.assertTrue(os.path.exists(upload.temporary_file_path()))
+
+
+def image_upload(image, format="PNG", **save_kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **save_kwargs)
+    return SimpleUploadedFile(f"photo.{format.lower()}", buffer.getvalue(), content_type=f"image/{format.lower()}")
+
+
+class VisionImageTests(SimpleTestCase):
+    def open_result(self, upload):
+        mime, data = uploads.vision_image(upload)
+        self.assertEqual(mime, "image/jpeg")
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual((image.format, image.mode), ("JPEG", "RGB"))
+        return image
+
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees: stored landscape, shown portrait
+        upload = image_upload(Image.new("RGB", (80, 40), "red"), "JPEG", exif=exif)
+        self.assertEqual(self.open_result(upload).size, (40, 80))
+
+    def test_large_photo_is_shrunk_to_the_vision_size(self):
+        upload = image_upload(Image.new("RGB", (2048, 1024), "blue"), "JPEG")
+        self.assertEqual(self.open_result(upload).size, (512, 256))
+
+    def test_transparent_and_palette_images_become_jpeg(self):
+        transparent = Image.new("RGBA", (30, 30), (0, 0, 0, 0))
+        # Transparency is flattened onto white, not black
+        self.assertEqual(self.open_result(image_upload(transparent)).getpixel((15, 15)), (255, 255, 255))
+        palette = Image.new("RGB", (30, 30), (0, 128, 0)).convert("P", palette=Image.Palette.ADAPTIVE)
+        red, green, blue = self.open_result(image_upload(palette, "GIF")).getpixel((15, 15))
+        self.assertLess(abs(green - 128) + red + blue, 30)
+
+
+# (query, governorate, query left for the product search)
+LOCATION_CORPUS = [
+    ("ruler from giza", "giza", "ruler"),
+    ("Calculator in Cairo", "cairo", "calculator"),
+    ("lab coat at alex", "alexandria", "lab coat"),
+    ("notebook in el fayoum", "faiyum", "notebook"),
+    ("drawing board elfayoum", "faiyum", "drawing board"),
+    ("calculator Kafr El-Sheikh", "kafr el-sheikh", "calculator"),
+    ("Port Said ruler", "port said", "ruler"),
+    ("arduino from assiut", "asyut", "arduino"),
+    ("lamp in the new valley", "new valley", "lamp"),
+    ("ruler from the red sea", "red sea", "ruler"),
+    ("the red sea ruler", "red sea", "ruler"),
+    ("cairo calculator from giza", "giza", "calculator"),
+    ("ruler in marsa matruh", "matruh", "ruler"),
+    ("مسطرة في الجيزة", "giza", "مسطرة"),
+    ("آلة حاسبة بالقاهرة", "cairo", "آلة حاسبة"),
+    ("كتاب من الاسكندريه", "alexandria", "كتاب"),
+    ("بالطو للقاهرة", "cairo", "بالطو"),
+    ("سماعة من بور سعيد", "port said", "سماعة"),
+    ("جهاز في المنيا", "minya", "جهاز"),
+    # Words that merely contain a place name or a preposition are left alone
+    ("information systems book", None, "information systems book"),
+    ("pin for breadboard", None, "pin for breadboard"),
+    ("alexa speaker", None, "alexa speaker"),
+    ("pencil in good condition", None, "pencil in good condition"),
+    ("suezcanal poster", None, "suezcanal poster"),
+    ("atlas of anatomy", None, "atlas of anatomy"),
+]
+
+
+class LocationParserTests(SimpleTestCase):
+    def test_corpus(self):
+        for query, location, rest in LOCATION_CORPUS:
+            with self.subTest(query=query):
+                self.assertEqual(split_location(query), (location, rest))
+
+    @skipUnless(os.environ.get("CHATBOT_BENCHMARKS"), "set CHATBOT_BENCHMARKS=1 to run benchmarks")
+    def test_microbenchmark(self):
+        queries = [query for query, _, _ in LOCATION_CORPUS]
+        rounds = 200
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for query in queries:
+                split_location(query)
+        per_call = (time.perf_counter() - started) / (rounds * len(queries))
+        # Reported, not asserted: typically 5-15 µs; a regex alternation over every spelling took 40-350 µs
+        print(f"\nsplit_location: {per_call * 1e6:.1f} µs per call")
@@ -0,0 +1,127 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from apps.support.outbox import enqueue_ticket
+from .metrics import span
+from .search import search_products, get_personalized_recommendations
+
+logger = logging.getLogger(__name__)
+
+# Parallel tool calls of one model turn run concurrently on this many threads
+TOOL_WORKERS = getattr(settings, 'CHATBOT_TOOL_WORKERS', 4)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def parse_tool_arguments(arguments):
+    """Tool call arguments arrive as a JSON string (possibly empty)"""
+    if not arguments:
+        return {}
+    return json.loads(arguments)
+
+
+def escalate_to_supervisor(args, user, user_message):
+    issue_summary = args.get("issue_summary", "No summary provided")
+    issue_type = args.get("issue_type", "other")
+    priority = args.get("priority", "medium")
+
+    # Get user info if authenticated
+    user_info = "Anonymous user"
+    if user is not None:
+        user_info = f"User: {user.username} (ID: {user.id})"
+
+    logger.info(f"Support escalation ({priority}, {issue_type}) from {user_info}: {issue_summary}")
+
+    # Saved and sent to the admins after the response (see apps/support/outbox.py)
+    enqueue_ticket(user, issue_type, priority, issue_summary, user_message)
+
+    # Return confirmation to AI
+    return {
+        "status": "escalated",
+        "ticket_created": True,
+        "message": "Issue has been escalated to human support. A supervisor will review and respond within 24-48 hours."
+    }
+
+
+def run_tool(name, args, user, user_message):
+    """
+    Execute one tool call requested by the model.
+    Returns (result, products): `result` is what goes back to the model,
+    `products` is the product list to show the user (None for non-product tools).
+    `user` is None for anonymous visitors. A failing tool reports an error to
+    the model instead of failing the turn (and the other calls of that turn).
+    """
+    with span(f"tool.{name}"):
+        try:
+            return _run_tool(name, args, user, user_message)
+        except Exception:
+            logger.exception(f"Tool '{name}' failed")
+            return {"error": f"Tool '{name}' failed"}, None
+
+
+def _run_tool(name, args, user, user_message):
+    if name == "search_products":
+        query = args.get("query", "")
+        logger.debug(f"Searching for: {query}")
+        products = search_products(query, user)
+        logger.debug(f"Found products: {len(products)}")
+        return products, products
+
+    if name == "get_personalized_recommendations":
+        logger.debug("Getting personalized recommendations")
+        products = get_personalized_recommendations(user)
+        logger.debug(f"Found recommendations: {len(products)}")
+        return products, products
+
+    if name == "escalate_to_supervisor":
+        logger.debug("Escalating issue to supervisor")
+        return escalate_to_supervisor(args, user, user_message), None
+
+    logger.warning(f"Model requested unknown tool '{name}'")
+    return {"error": f"Unknown tool '{name}'"}, None
+
+
+def _get_executor():
+    """Per-process tool worker pool (recreated after a fork)"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix='chatbot-tools')
+                _executor_pid = pid
+    return _executor
+
+
+def _run_tool_in_worker(name, args, user, user_message):
+    try:
+        return run_tool(name, args, user, user_message)
+    finally:
+        # Worker threads get their own DB connections; don't leave them open
+        connections.close_all()
+
+
+def run_tool_calls(calls, user, user_message):
+    """
+    Execute all (name, args) tool calls of one model turn.
+    The calls of a turn don't depend on each other, so several are run
+    concurrently; results come back as (result, products) in call order.
+    """
+    if len(calls) <= 1:
+        return [run_tool(name, args, user, user_message) for name, args in calls]
+    executor = _get_executor()
+    # Each call runs in a copy of this context so its timing span joins the request trace
+    futures = [
+        executor.submit(contextvars.copy_context().run, _run_tool_in_worker, name, args, user, user_message)
+        for name, args in calls
+    ]
+    return [future.result() for future in futures]
@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_DIR = getattr(
+    settings, 'CHATBOT_TTS_CACHE_DIR',
+    os.path.join(str(settings.BASE_DIR), 'var', 'tts-cache'),
+)
+TTS_CACHE_MAX_BYTES = getattr(settings, 'CHATBOT_TTS_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+# Eviction trims the cache to this share of the limit, so it runs once per batch of writes
+EVICT_TO = 0.9
+
+
+class AudioCache:
+    """
+    Content-addressed MP3 store on local disk, shared by every worker on the host.
+    Files are named by their key and sharded by its first two characters; a read
+    refreshes the file's mtime, and eviction removes the least recently used files
+    once the directory grows past max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or TTS_CACHE_DIR
+        self.max_bytes = max_bytes or TTS_CACHE_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bytes on disk as of the last scan plus this process's writes since
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.mp3')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return audio
+
+    def set(self, key, audio):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(audio)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def record(self, hit):
+        """Count a lookup for the hit rate"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _entries(self):
+        """(mtime, size, path) of every cached file"""
+        entries = []
+        try:
+            shards = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return entries
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.mp3'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used files until the cache is under EVICT_TO of its limit"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * EVICT_TO)
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+            self._size = total
+        logger.debug(f"TTS cache trimmed to {total} bytes")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'bytes': self._size,
+            }
@@ -0,0 +1,169 @@
+import io
+import logging
+import os
+import tempfile
+import wave
+from contextlib import contextmanager
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Voice notes are short; these limits are checked before anything is sent to Whisper
+AUDIO_MAX_BYTES = getattr(settings, 'CHATBOT_AUDIO_MAX_BYTES', 10 * 1024 * 1024)
+AUDIO_MAX_SECONDS = getattr(settings, 'CHATBOT_AUDIO_MAX_SECONDS', 60)
+# Compressed recordings (webm, ogg, mp3, m4a) have no header we read the length from and
+# the client-reported duration can't be trusted, so they are also bounded by size:
+# AUDIO_MAX_SECONDS at this bitrate (browser voice recordings use 32-128 kbps)
+AUDIO_MAX_BITRATE = getattr(settings, 'CHATBOT_AUDIO_MAX_BITRATE', 256_000)
+# Uploads up to this size are handed to Whisper straight from memory
+AUDIO_IN_MEMORY_MAX_BYTES = getattr(settings, 'CHATBOT_AUDIO_IN_MEMORY_MAX_BYTES', int(2.5 * 1024 * 1024))
+
+# Image search only needs a 1-3 word description, so photos are shrunk to the
+# 512px "low detail" size GPT-4o vision works at (a flat 85 image tokens)
+IMAGE_MAX_BYTES = getattr(settings, 'CHATBOT_IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+IMAGE_MAX_PIXELS = getattr(settings, 'CHATBOT_IMAGE_MAX_PIXELS', 40_000_000)
+VISION_IMAGE_MAX_SIDE = getattr(settings, 'CHATBOT_VISION_IMAGE_MAX_SIDE', 512)
+VISION_IMAGE_QUALITY = 80
+
+# Whisper detects the format from the file extension
+AUDIO_EXTENSIONS = {
+    'audio/webm': 'webm',
+    'video/webm': 'webm',
+    'audio/ogg': 'ogg',
+    'audio/mpeg': 'mp3',
+    'audio/mp3': 'mp3',
+    'audio/mp4': 'm4a',
+    'audio/x-m4a': 'm4a',
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+    'audio/wave': 'wav',
+}
+WHISPER_EXTENSIONS = {'flac', 'm4a', 'mp3', 'mp4', 'mpeg', 'mpga', 'oga', 'ogg', 'wav', 'webm'}
+
+
+def audio_filename(upload):
+    """A filename with an extension Whisper understands (browser recordings default to webm)"""
+    content_type = (upload.content_type or '').split(';')[0].strip().lower()
+    extension = os.path.splitext(upload.name or '')[1].lstrip('.').lower()
+    if extension not in WHISPER_EXTENSIONS:
+        extension = AUDIO_EXTENSIONS.get(content_type, 'webm')
+    return f"recording.{extension}"
+
+
+def wav_duration(upload):
+    """Duration in seconds read from a WAV header, or None for other formats"""
+    try:
+        upload.seek(0)
+        with wave.open(upload, 'rb') as wav:
+            return wav.getnframes() / float(wav.getframerate() or 1)
+    except (wave.Error, EOFError):
+        return None
+    finally:
+        upload.seek(0)
+
+
+def validate_audio_upload(upload, reported_duration=None):
+    """
+    Check an audio upload against the size and duration limits.
+    The duration comes from the WAV header when possible. Other formats are
+    checked against the duration the client reports (browsers know it when they
+    stop recording) and, since that can't be trusted, against the size
+    AUDIO_MAX_SECONDS of audio takes at AUDIO_MAX_BITRATE.
+    Returns an error message, or None when the upload is acceptable.
+    """
+    if upload.size > AUDIO_MAX_BYTES:
+        return f"Audio recording is too large (max {AUDIO_MAX_BYTES // (1024 * 1024)} MB)"
+
+    duration = wav_duration(upload)
+    if duration is None:
+        if upload.size > AUDIO_MAX_SECONDS * AUDIO_MAX_BITRATE // 8:
+            return f"Audio recording is too long (max {AUDIO_MAX_SECONDS} seconds)"
+        try:
+            duration = float(reported_duration)
+        except (TypeError, ValueError):
+            duration = None
+    if duration is not None and duration > AUDIO_MAX_SECONDS:
+        return f"Audio recording is too long (max {AUDIO_MAX_SECONDS} seconds)"
+    return None
+
+
+@contextmanager
+def whisper_file(upload):
+    """
+    Yield a (filename, file, content_type) tuple for the Whisper API.
+    Small uploads are passed from memory; larger ones go through a spooled
+    temporary file (or Django's own temporary upload file when it already made one).
+    Buffers are always closed, also when the upstream call fails.
+    """
+    filename = audio_filename(upload)
+    content_type = upload.content_type or 'audio/webm'
+    upload.seek(0)
+
+    if hasattr(upload, 'temporary_file_path'):
+        # Already on disk and deleted by Django at the end of the request
+        yield (filename, upload.file, content_type)
+        return
+
+    if upload.size <= AUDIO_IN_MEMORY_MAX_BYTES:
+        buffer = io.BytesIO(upload.read())
+    else:
+        buffer = tempfile.SpooledTemporaryFile(max_size=AUDIO_IN_MEMORY_MAX_BYTES)
+        for chunk in upload.chunks():
+            buffer.write(chunk)
+        buffer.seek(0)
+
+    try:
+        yield (filename, buffer, content_type)
+    finally:
+        buffer.close()
+
+
+def validate_image_upload(upload):
+    """
+    Check an image upload against the byte and pixel limits without decoding it
+    (Pillow reads the dimensions from the header). Returns an error message or None.
+    """
+    if upload.size > IMAGE_MAX_BYTES:
+        return f"Image is too large (max {IMAGE_MAX_BYTES // (1024 * 1024)} MB)"
+    try:
+        upload.seek(0)
+        with Image.open(upload) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = IMAGE_MAX_PIXELS
+    except (UnidentifiedImageError, OSError):
+        # Not a limit problem; the analysis step logs it and carries on without the image
+        return None
+    finally:
+        upload.seek(0)
+    if width * height > IMAGE_MAX_PIXELS:
+        return f"Image resolution is too large (max {IMAGE_MAX_PIXELS // 1_000_000} megapixels)"
+    return None
+
+
+def vision_image(upload):
+    """
+    Prepare an uploaded photo for the vision model: decode at reduced scale where
+    the format allows it, apply the EXIF orientation, flatten transparency,
+    downscale to VISION_IMAGE_MAX_SIDE and re-encode as JPEG.
+    Returns (mime_type, jpeg_bytes).
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        # JPEG can decode directly at 1/2, 1/4 or 1/8 scale, skipping most of the work
+        image.draft('RGB', (VISION_IMAGE_MAX_SIDE, VISION_IMAGE_MAX_SIDE))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((VISION_IMAGE_MAX_SIDE, VISION_IMAGE_MAX_SIDE), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=VISION_IMAGE_QUALITY, optimize=True)
+    return 'image/jpeg', output.getvalue()
@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import ChatbotAPIView
+from .views import ChatbotAPIView, ChatbotAudioView, ChatbotMetricsView, ChatbotStreamView
 
 urlpatterns = [
     path("chatbot/", ChatbotAPIView.as_view(), name="chatbot"),
+    path("chatbot/stream/", ChatbotStreamView.as_view(), name="chatbot-stream"),
+    path("chatbot/audio/<str:token>/", ChatbotAudioView.as_view(), name="chatbot-audio"),
+    path("chatbot/metrics/", ChatbotMetricsView.as_view(), name="chatbot-metrics"),
 ]
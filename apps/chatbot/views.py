@@ -2,337 +2,52 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import permissions
+from rest_framework.throttling import BaseThrottle
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.core import signing
+from django.http import HttpResponse
+from django.urls import reverse
 from .serializers import ChatbotSerializer
-from openai import OpenAI
-import os
-import json
 import traceback
 import logging
-from apps.products.models import Product, Category
+from .search import search_products
+from .client import get_llm_client, llm_configured
+from .breaker import DEGRADE_ON, LLMUnavailable, llm_breaker, llm_call
+from .fallback import fallback_turn
+from .history import build_history, get_session, remember_turn, schedule_compaction
+from .intent import classify_intent, intent_stats
+from .limiter import LLMBusy, admit, caller, llm_limiter
+from .metrics import Trace, activate, finish_trace, registry, request_trace, span, traced_events
+from .pipeline import CHAT_MODEL, drain, run_turn
+from .speech import TTS_TOKEN_MAX_AGE, get_speech, schedule_speech, tts_cache_stats
+from .streaming import event_stream_response, sse_event, sse_events
+from .uploads import validate_audio_upload, validate_image_upload, vision_image, whisper_file
 
 logger = logging.getLogger(__name__)
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or getattr(settings, "OPENAI_API_KEY", None)
-
-
-def parse_location_from_query(query):
-    """Parse location keywords from search query"""
-    query_lower = query.lower()
-
-    # Common location keywords and their mappings
-    location_keywords = {
-        'giza': 'giza',
-        'cairo': 'cairo',
-        'alexandria': 'alexandria',
-        'alex': 'alexandria',
-        'aswan': 'aswan',
-        'asyut': 'asyut',
-        'beheira': 'beheira',
-        'beni suef': 'beni suef',
-        'dakahlia': 'dakahlia',
-        'damietta': 'damietta',
-        'faiyum': 'faiyum',
-        'gharbia': 'gharbia',
-        'ismailia': 'ismailia',
-        'kafr el-sheikh': 'kafr el-sheikh',
-        'luxor': 'luxor',
-        'matruh': 'matruh',
-        'minya': 'minya',
-        'monufia': 'monufia',
-        'new valley': 'new valley',
-        'north sinai': 'north sinai',
-        'port said': 'port said',
-        'qalyubia': 'qalyubia',
-        'qena': 'qena',
-        'red sea': 'red sea',
-        'sharqia': 'sharqia',
-        'sohag': 'sohag',
-        'south sinai': 'south sinai',
-        'suez': 'suez'
-    }
-
-    # Check for location patterns: "from X", "in X", "X ruler", etc.
-    patterns = [
-        r'from (\w+(?:\s+\w+)*)',
-        r'in (\w+(?:\s+\w+)*)',
-        r'at (\w+(?:\s+\w+)*)'
-    ]
-
-    import re
-    for pattern in patterns:
-        match = re.search(pattern, query_lower)
-        if match:
-            location_candidate = match.group(1).strip()
-            # Check if it's a known location
-            for keyword, location in location_keywords.items():
-                if keyword in location_candidate or location_candidate in keyword:
-                    return location
-
-    # Direct location mentions
-    for keyword, location in location_keywords.items():
-        if keyword in query_lower:
-            return location
-
-    return None
-
-
-def search_products(query, user=None):
-    """
-    Search for products in the database with hierarchical filtering:
-    1. Specified location (if mentioned in query)
-    2. Same university + same faculty (highest priority)
-    3. Same university + different faculty (medium priority)
-    4. Transfer not available (fallback - no filtering)
-    Returns only top 3 cheapest results from each level
-    Uses flexible search with common substrings for better matching
-    """
-    # Clean and prepare search query
-    query = query.lower().strip()
-
-    # Parse location from query
-    specified_location = parse_location_from_query(query)
-    logger.debug(f"Parsed location from query: '{specified_location}'")
-
-    # Remove location words from search query for better product matching
-    location_words = ['from', 'in', 'at', 'cairo', 'giza', 'alexandria', 'alex']
-    search_query = query
-    for word in location_words:
-        search_query = search_query.replace(word, '').strip()
-
-    # Create search variations for better matching
-    search_terms = [search_query]
-    # Add common shortened versions
-    if 'calculator' in search_query:
-        search_terms.extend(['calc', 'calculat'])
-    if 'computer' in search_query:
-        search_terms.extend(['comp', 'comput'])
-    if 'notebook' in search_query:
-        search_terms.extend(['note', 'book'])
-    if 'pencil' in search_query:
-        search_terms.extend(['pen', 'cil'])
-    # Add the first 4-5 characters as a fallback
-    if len(search_query) > 4:
-        search_terms.append(search_query[:4])
-
-    logger.debug(f"Searching for '{search_query}' with terms: {search_terms}")
-
-    # Get user info for filtering
-    user_university = ""
-    user_faculty = ""
-    if user:
-        user_university = (getattr(user, 'university', '') or '').lower().strip()
-        user_faculty = (getattr(user, 'faculty', '') or '').lower().strip()
-
-    logger.debug(f"User university: '{user_university}', faculty: '{user_faculty}'")
-
-    # Base queryset
-    base_queryset = Product.objects.filter(status='active').select_related('category', 'seller')
-    final_results = []
-
-    # Define search strategies - check each search term
-    search_strategies = []
-    for term in search_terms:
-        search_strategies.extend([
-            ('title__icontains', term),
-            ('description__icontains', term),
-            ('category__name__icontains', term)
-        ])
-
-    # Use a set to track product IDs and avoid duplicates
-    seen_product_ids = set()
-
-    # LEVEL 0: Specified location in query (highest priority if location mentioned)
-    if specified_location:
-        logger.debug(f"Level 0 - Searching ONLY in specified location: {specified_location}")
-        level0_products = []
-
-        for field, value in search_strategies:
-            if len(level0_products) >= 3:
-                break
-
-            products = base_queryset.filter(**{field: value})
-            # Filter by governorate (location)
-            products = products.filter(governorate__iexact=specified_location)
-            products = products.order_by('price')  # Cheapest first
-
-            for product in products:
-                if product.id not in seen_product_ids and len(level0_products) < 3:
-                    level0_products.append(product)
-                    seen_product_ids.add(product.id)
-
-        final_results.extend(level0_products)
-        logger.debug(f"Level 0 found {len(level0_products)} products in {specified_location}")
-
-        # For location-specific searches, if no products found in that location,
-        # return empty results (don't fall back to other locations)
-        return format_products(final_results)
-
-    # LEVEL 1: Same university + same faculty (highest priority)
-    if user_university and user_faculty:
-        logger.debug("Level 1 - Searching same university + same faculty")
-        level1_products = []
-
-        for field, value in search_strategies:
-            if len(level1_products) >= 3:
-                break
-
-            products = base_queryset.filter(**{field: value})
-            products = products.filter(university__iexact=user_university, faculty__iexact=user_faculty)
-            products = products.order_by('price')  # Cheapest first
-
-            for product in products:
-                if product.id not in seen_product_ids and len(level1_products) < 3:
-                    level1_products.append(product)
-                    seen_product_ids.add(product.id)
-
-        final_results.extend(level1_products)
-        logger.debug(f"Level 1 found {len(level1_products)} products")
-
-        # If we have results from level 1, return them
-        if final_results:
-            return format_products(final_results)
-
-    # LEVEL 2: Same university + different faculty (medium priority)
-    if user_university and len(final_results) < 3:
-        logger.debug("Level 2 - Searching same university + different faculty")
-        level2_products = []
-
-        for field, value in search_strategies:
-            if len(level2_products) >= 3:
-                break
-
-            products = base_queryset.filter(**{field: value})
-            products = products.filter(university__iexact=user_university)
-
-            # Exclude user's faculty to get different faculties
-            if user_faculty:
-                products = products.exclude(faculty__iexact=user_faculty)
-
-            products = products.order_by('price')  # Cheapest first
-
-            for product in products:
-                if product.id not in seen_product_ids and len(level2_products) < 3:
-                    level2_products.append(product)
-                    seen_product_ids.add(product.id)
-
-        final_results.extend(level2_products)
-        logger.debug(f"Level 2 found {len(level2_products)} products")
-
-        # If we have results from level 2, return them
-        if final_results:
-            return format_products(final_results)
-
-    # LEVEL 3: Transfer not available - general search (lowest priority)
-    logger.debug("Level 3 - Transfer not available, general search")
-    level3_products = []
-
-    for field, value in search_strategies:
-        if len(level3_products) >= 3:
-            break
-
-        products = base_queryset.filter(**{field: value})
-        products = products.order_by('price')  # Cheapest first
-
-        for product in products:
-            if product.id not in seen_product_ids and len(level3_products) < 3:
-                level3_products.append(product)
-                seen_product_ids.add(product.id)
-
-    final_results.extend(level3_products)
-    logger.debug(f"Level 3 found {len(level3_products)} products")
-
-    return format_products(final_results)
-
-
-def format_products(products):
-    """Helper function to format product queryset to dictionary"""
-    results = []
-    for product in products:
-        results.append({
-            "id": product.id,
-            "title": product.title,
-            "description": product.description,
-            "price": float(product.price),
-            "condition": product.condition,
-            "category": product.category.name if product.category else "No category",
-            "university": product.university or "Not specified",
-            "faculty": product.faculty or "Not specified",
-            "seller": {
-                "id": product.seller.id,
-                "name": product.seller.first_name or product.seller.username,
-                "username": product.seller.username,
-            } if product.seller else {"name": "Unknown Seller"}
-        })
-    return results
 
+def caller_key(request):
+    """Whose share of the LLM limiter a request uses: the user, or the client address"""
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"ip:{BaseThrottle().get_ident(request)}"
 
-def get_personalized_recommendations(user):
-    """
-    Get products recommended for the user's university and faculty
-    Only recommend if there's a university/faculty match
-    Case-insensitive matching
-    """
-    university = (getattr(user, 'university', '') or '').lower().strip()
-    faculty = (getattr(user, 'faculty', '') or '').lower().strip()
-
-    logger.debug(f"Getting recommendations for university: {university}, faculty: {faculty}")
-
-    if not university and not faculty:
-        # No university/faculty info, return empty recommendations
-        return []
-
-    # Search for products by PRODUCT university and faculty
-    products = Product.objects.filter(status='active').select_related('category', 'seller')
-
-    matching_products = []
-
-    for product in products:
-        # Case-insensitive comparison
-        product_university = (product.university or '').lower().strip()
-        product_faculty = (product.faculty or '').lower().strip()
-
-        matches = []
-
-        if university and product_university == university:
-            matches.append('university')
-        if faculty and product_faculty == faculty:
-            matches.append('faculty')
-
-        # Include if at least one field matches (university or faculty)
-        if matches:
-            matching_products.append(product)
-            logger.debug(f"Product '{product.title}' matches on: {matches}")
-            if len(matching_products) >= 10:  # Limit to 10
-                break
-
-    products = matching_products
-    
-    # Convert to list
-    products = list(products)
-
-    results = []
-    for product in products:
-        results.append({
-            "id": product.id,
-            "title": product.title,
-            "description": product.description,
-            "price": float(product.price),
-            "condition": product.condition,
-            "category": product.category.name if product.category else "No category",
-            "university": product.university or "Not specified",
-            "faculty": product.faculty or "Not specified",
-            "seller": {
-                "id": product.seller.id,
-                "name": product.seller.first_name or product.seller.username,
-                "username": product.seller.username,
-            } if product.seller else {"name": "Unknown Seller"}
-        })
 
-    return results
+def busy_response(busy):
+    """429/503 with Retry-After for a request the LLM limiter turned away"""
+    response = Response(
+        {
+            "error": "chatbot_busy",
+            "detail": "The assistant is busy right now, please try again shortly.",
+            "retry_after": busy.retry_after,
+        },
+        status=busy.status,
+    )
+    response["Retry-After"] = str(busy.retry_after)
+    return response
 
 
 @method_decorator(csrf_exempt, name="dispatch")
@@ -343,74 +58,65 @@ class ChatbotAPIView(APIView):
     def get_permissions(self):
         return [permissions.AllowAny()]
 
-    def post(self, request):
-        try:
-            is_initial = request.data.get("initial", False)
-            if is_initial:
-                # Return initial welcome message
-                return Response({
-                    "reply": "Looking for something specific? Can I help you?",
-                    "products": []
-                    }, status=status.HTTP_200_OK)
+    def read_user_message(self, request, client):
+        """
+        Work out the text to answer from the message, audio and image inputs.
+        Returns (user_message, response); a response means reply with it right away
+        (validation errors, transcribe_only mode).
+        """
+        # Handle audio file if present
+        audio_file = request.FILES.get('audio')
+        image_file = request.FILES.get('image')
+        transcribe_only = request.data.get('transcribe_only', 'false').lower() == 'true'
+        user_message = ""
+        image_analysis = None
+
+        if audio_file:
+            # Reject oversized/overlong recordings before paying for an upstream call
+            audio_error = validate_audio_upload(audio_file, request.data.get('audio_duration'))
+            if audio_error:
+                return None, Response({"error": audio_error}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+            try:
+                # Transcribe using Whisper (auto-detects language - supports Arabic and English)
+                with llm_call("transcription"), whisper_file(audio_file) as audio:
+                    transcription = client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=audio
+                        # No language parameter = auto-detect (supports Arabic, English, etc.)
+                    )
+
+                user_message = transcription.text
+                logger.debug(f"Transcribed audio to: '{user_message}'")
+
+                # If transcribe_only mode, return just the transcription
+                if transcribe_only:
+                    return None, Response({"transcription": user_message}, status=status.HTTP_200_OK)
 
-            # Handle audio file if present
-            audio_file = request.FILES.get('audio')
-            image_file = request.FILES.get('image')
-            transcribe_only = request.data.get('transcribe_only', 'false').lower() == 'true'
-            user_message = ""
-            image_analysis = None
-            
-            client = OpenAI(api_key=OPENAI_API_KEY)
-
-            if audio_file:
-                try:
-                    # Save temporary file for Whisper
-                    import tempfile
-                    from django.core.files.storage import default_storage
-                    from django.core.files.base import ContentFile
-                    
-                    # Create a temp file path
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_audio:
-                        for chunk in audio_file.chunks():
-                            temp_audio.write(chunk)
-                        temp_audio_path = temp_audio.name
-
-                    # Transcribe using Whisper (auto-detects language - supports Arabic and English)
-                    with open(temp_audio_path, "rb") as audio:
-                        transcription = client.audio.transcriptions.create(
-                            model="whisper-1", 
-                            file=audio
-                            # No language parameter = auto-detect (supports Arabic, English, etc.)
-                        )
-                    
-                    
-                    user_message = transcription.text
-                    logger.debug(f"Transcribed audio to: '{user_message}'")
-                    
-                    # Clean up temp file
-                    os.remove(temp_audio_path)
-                    
-                    # If transcribe_only mode, return just the transcription
-                    if transcribe_only:
-                        return Response({"transcription": user_message}, status=status.HTTP_200_OK)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing audio: {e}")
-                    return Response({"error": "Failed to process audio recording"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Handle image file if present - analyze for product search
-            if image_file:
-                try:
-                    import base64
-                    
-                    # Read image and encode to base64
-                    image_data = image_file.read()
+            except LLMBusy:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing audio: {e}")
+                return None, Response({"error": "Failed to process audio recording"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Handle image file if present - analyze for product search
+        if image_file:
+            image_error = validate_image_upload(image_file)
+            if image_error:
+                return None, Response({"error": image_error}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+            try:
+                import base64
+
+                # Shrink/re-encode before base64: the model only needs a small JPEG to name the product
+                with span("image_prep"):
+                    image_mime, image_data = vision_image(image_file)
                     image_base64 = base64.b64encode(image_data).decode('utf-8')
-                    image_mime = image_file.content_type or 'image/jpeg'
-                    
-                    # Ask GPT-4o Vision to analyze the image for product identification
+
+                # Ask GPT-4o Vision to analyze the image for product identification
+                with llm_call("vision") as timing:
                     vision_response = client.chat.completions.create(
-                        model="gpt-4o",
+                        model=CHAT_MODEL,
                         messages=[
                             {
                                 "role": "user",
@@ -422,7 +128,8 @@ class ChatbotAPIView(APIView):
                                     {
                                         "type": "image_url",
                                         "image_url": {
-                                            "url": f"data:{image_mime};base64,{image_base64}"
+                                            "url": f"data:{image_mime};base64,{image_base64}",
+                                            "detail": "low"
                                         }
                                     }
                                 ]
@@ -430,358 +137,134 @@ class ChatbotAPIView(APIView):
                         ],
                         max_tokens=50
                     )
-                    
-                    image_analysis = vision_response.choices[0].message.content.strip()
-                    logger.debug(f"Image analysis result: '{image_analysis}'")
-                    
-                except Exception as e:
-                    logger.error(f"Error analyzing image: {e}")
-                    image_analysis = None
-            
-            # Get text message if no audio
-            if not audio_file:
-                # Standard text message
-                serializer = ChatbotSerializer(data=request.data)
-                # If serializer is invalid and we didn't have audio, return error
-                # Note: if audio was sent, we might not have a message body, so we skip serializer validation of 'message'
-                if not serializer.is_valid():
-                    # Check if we got 'message' in data even if serializer complained (e.g. standard form data)
-                    user_message = request.data.get('message', '')
-                    if not user_message and not image_file:
-                         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-                else:
-                    user_message = serializer.validated_data.get("message", "")
-
-            # If we have image analysis but no/empty user message, use image analysis as the query
-            if image_analysis and not user_message.strip():
-                user_message = f"I'm looking for products similar to this: {image_analysis}"
-            elif image_analysis and user_message.strip():
-                # Combine user message with image analysis context
-                user_message = f"{user_message}. [The user also attached an image that appears to show: {image_analysis}]"
-
-            if not user_message:
-                 return Response({"error": "No message provided"}, status=status.HTTP_400_BAD_REQUEST)
-
-            if not OPENAI_API_KEY:
+                    timing.add_usage(getattr(vision_response, "usage", None))
+
+                image_analysis = vision_response.choices[0].message.content.strip()
+                logger.debug(f"Image analysis result: '{image_analysis}'")
+
+            except LLMUnavailable:
+                # Circuit breaker open: answer from the text alone
+                image_analysis = None
+            except LLMBusy:
+                raise
+            except Exception as e:
+                logger.error(f"Error analyzing image: {e}")
+                image_analysis = None
+
+        # Get text message if no audio
+        if not audio_file:
+            # Standard text message
+            serializer = ChatbotSerializer(data=request.data)
+            # If serializer is invalid and we didn't have audio, return error
+            # Note: if audio was sent, we might not have a message body, so we skip serializer validation of 'message'
+            if not serializer.is_valid():
+                # Check if we got 'message' in data even if serializer complained (e.g. standard form data)
+                user_message = request.data.get('message', '')
+                if not user_message and not image_file:
+                    return None, Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                user_message = serializer.validated_data.get("message", "")
+
+        # If we have image analysis but no/empty user message, use image analysis as the query
+        if image_analysis and not user_message.strip():
+            user_message = f"I'm looking for products similar to this: {image_analysis}"
+        elif image_analysis and user_message.strip():
+            # Combine user message with image analysis context
+            user_message = f"{user_message}. [The user also attached an image that appears to show: {image_analysis}]"
+
+        if not user_message:
+            return None, Response({"error": "No message provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return user_message, None
+
+    def audio_url(self, request, reply):
+        """Schedule background TTS for the reply and return the URL it will be served from"""
+        try:
+            audio_token = schedule_speech(reply)
+        except Exception as e:
+            logger.error(f"TTS Error: {e}")
+            # Don't fail the whole request if separate TTS fails
+            return None
+        return request.build_absolute_uri(reverse("chatbot-audio", args=[audio_token]))
+
+    def post(self, request):
+        # Per-stage timings go out as a Server-Timing header and into the metrics registry
+        with request_trace() as trace, caller(caller_key(request)):
+            response = self.answer(request)
+        response["Server-Timing"] = trace.server_timing()
+        return response
+
+    def answer(self, request):
+        try:
+            is_initial = request.data.get("initial", False)
+            if is_initial:
+                # Return initial welcome message
+                return Response({
+                    "reply": "Looking for something specific? Can I help you?",
+                    "products": []
+                    }, status=status.HTTP_200_OK)
+
+            want_audio = str(request.data.get('tts', 'false')).lower() == 'true'
+
+            # Shared pooled client; without a key the DEBUG mock path below still works
+            client = get_llm_client() if llm_configured() else None
+
+            user_message, early_response = self.read_user_message(request, client)
+            if early_response is not None:
+                return early_response
+
+            # Handle anonymous user for public access
+            search_user = request.user if request.user.is_authenticated else None
+
+            if not llm_configured():
                 if settings.DEBUG:
                     logger.debug("OpenAI API key missing, returning mock response")
                     # Mock response for testing when API key is missing
-                    mock_products = search_products(user_message, request.user if request.user.is_authenticated else None)
+                    mock_products = search_products(user_message, search_user)
                     return Response({
                         "reply": f"I'm currently in test mode (no API key). I found {len(mock_products)} products matching '{user_message}'.",
                         "products": mock_products
                     }, status=status.HTTP_200_OK)
-                
+
                 return Response(
                     {"error": "OpenAI API key not configured"},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE,
                 )
 
-            # Define functions for product search and personalized recommendations
-            tools = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "search_products",
-                        "description": "Search for available college tools and supplies in our e-commerce store",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "query": {
-                                    "type": "string",
-                                    "description": "The tool or item to search for (e.g., ruler, calculator, thermometer)",
-                                }
-                            },
-                            "required": ["query"]
-                        }
-                    }
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_personalized_recommendations",
-                        "description": "Get personalized product recommendations based on the user's location, university and faculty",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {}
-                        }
-                    }
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "escalate_to_supervisor",
-                        "description": "Escalate a user issue to a human supervisor when the AI cannot resolve the problem. Use this when: 1) The user is frustrated after multiple attempts to help, 2) The issue requires human intervention (refunds, account issues, disputes), 3) Technical bugs that need developer attention, 4) The user explicitly requests to speak with a human.",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "issue_summary": {
-                                    "type": "string",
-                                    "description": "A brief summary of the user's issue and what has been attempted to resolve it"
-                                },
-                                "issue_type": {
-                                    "type": "string",
-                                    "enum": ["technical_bug", "payment_issue", "account_problem", "product_complaint", "seller_dispute", "feature_request", "other"],
-                                    "description": "Category of the issue"
-                                },
-                                "priority": {
-                                    "type": "string",
-                                    "enum": ["low", "medium", "high"],
-                                    "description": "Priority level based on urgency and user frustration"
-                                }
-                            },
-                            "required": ["issue_summary", "issue_type", "priority"]
-                        }
-                    }
-                }
-            ]
-
-            system_prompt = """
-            You are a helpful AI assistant for a college supplies e-commerce website called Stuplies.
-            You help students find and purchase tools they need for their studies, AND you provide customer support.
-            Only respond to queries related to the website, polietly refuse to answer questions concerning anything unrelating to the website stating that you can only answer questions that relate to te website and it's content.     
-            === PRODUCT SEARCH ===
-            CRITICAL: When a user asks about ANY tools, supplies, or items for sale, ALWAYS use the search_products function first. Do not answer from memory or make up information.
-            
-            Available tools and supplies include: rulers, calculators, thermometers, notebooks, pens, pencils, erasers, geometry sets, laboratory equipment, measuring tools, and many other study supplies.
-
-            When products are found:
-            - Take direct action: Always navigate the user to the product details page automatically
-            - Say something brief like "Found it! Here are the options..." 
-
-            LOCATION-BASED SEARCHES: If a user specifies a location, the search prioritizes products from that location.
-
-            === CUSTOMER SUPPORT ===
-            You also handle customer support, troubleshooting, and complaints. Common issues include:
-            
-            **Technical Issues:**
-            - Login/registration problems → Suggest: clear browser cache, try different browser, check email for verification
-            - Page not loading → Suggest: refresh, check internet connection, try incognito mode
-            - Images not displaying → Suggest: refresh page, check internet speed
-            - Payment failing → Suggest: check card details, try different payment method, ensure sufficient funds
-            - App crashes → Suggest: update browser, clear cache, disable extensions
-            
-            **Account Issues:**
-            - Forgot password → Direct to "Forgot Password" link on login page
-            - Can't verify email → Suggest checking spam folder, request new verification email
-            - Profile not updating → Suggest: log out and back in, clear cache
-            
-            **Product/Order Issues:**
-            - Product not as described → Advise to contact seller first via chat, explain dispute process
-            - Seller not responding → Suggest waiting 24-48 hours, then escalate
-            - Want refund → Explain the platform connects buyers/sellers directly, refunds depend on seller
-            
-            **Platform Navigation:**
-            - How to post ad → Explain: go to "My Ads" → "Add New Product" → fill details → submit
-            - How to contact seller → Explain: click on product → "Chat with Seller" button
-            - How to edit/delete listing → Go to "My Ads" → find listing → edit/delete options
-            
-            **Troubleshooting Approach:**
-            1. Listen carefully and acknowledge the user's frustration
-            2. Ask clarifying questions if needed
-            3. Provide step-by-step solutions
-            4. If first solution doesn't work, try alternatives
-            5. If you cannot resolve after 2-3 attempts OR the user is very frustrated OR it requires human intervention → USE escalate_to_supervisor function
-
-            === ESCALATION RULES ===
-            Use escalate_to_supervisor when:
-            - User explicitly asks for a human/manager/supervisor
-            - Issue involves money/payments that need manual review  
-            - Account is locked or banned (needs admin)
-            - Dispute between buyer and seller
-            - Bug that you cannot help troubleshoot
-            - User remains unsatisfied after your troubleshooting attempts
-            - Any issue you genuinely cannot resolve
-
-            When escalating, be empathetic: "I understand this is frustrating. Let me escalate this to our support team who will personally look into this for you."
-
-            === LANGUAGE ===
-            Respond in the same language the user writes in (Arabic or English).
-            Be friendly, helpful, and professional. Use emojis sparingly for friendliness.
-            """
-
-            # Always enable tools for this assistant
-            chat_completion = client.chat.completions.create(
-                model="gpt-4o",  # Use a widely available model
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                tools=tools,
-                tool_choice="auto",  # Let AI decide when to use tools
-                temperature=0.7,
-                max_tokens=500
-            )
-
-            response_message = chat_completion.choices[0].message
-
-            # Track if we had a search function call
-            searched_products = None
-            search_query = None
-
-            # Check if the model wants to call a function
-            if response_message.tool_calls:
-                # Call the function
-                for tool_call in response_message.tool_calls:
-                    if tool_call.function.name == "search_products":
-                        # Parse the arguments
-                        args = json.loads(tool_call.function.arguments)
-                        search_query = args.get("query", "")
-                        print(f"DEBUG: Searching for: {search_query}")
-
-                        # Search for products (pass user for hierarchical filtering)
-                        # Handle anonymous user for public access
-                        search_user = request.user if request.user.is_authenticated else None
-                        searched_products = search_products(search_query, search_user)
-                        logger.debug(f"Found products: {len(searched_products)}")
-
-                        # Add the function result to the conversation
-                        chat_completion = client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": user_message},
-                                response_message,
-                                {
-                                    "role": "tool",
-                                    "tool_call_id": tool_call.id,
-                                    "content": json.dumps(searched_products)
-                                }
-                            ],
-                            temperature=0.7,
-                            max_tokens=500
-                        )
-
-                        response_message = chat_completion.choices[0].message
-                        logger.debug(f"Final response content: '{response_message.content}'")
-
-                    elif tool_call.function.name == "get_personalized_recommendations":
-                        print("DEBUG: Getting personalized recommendations")
-                        
-                        # Get recommendations
-                        search_user = request.user if request.user.is_authenticated else None
-                        searched_products = get_personalized_recommendations(search_user)
-                        logger.debug(f"Found recommendations: {len(searched_products)}")
-                        
-                        # Add the function result to the conversation
-                        chat_completion = client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": user_message},
-                                response_message,
-                                {
-                                    "role": "tool",
-                                    "tool_call_id": tool_call.id,
-                                    "content": json.dumps(searched_products)
-                                }
-                            ],
-                            temperature=0.7,
-                            max_tokens=500
-                        )
-                        
-                        response_message = chat_completion.choices[0].message
-                        logger.debug(f"Final response content: '{response_message.content}'")
-
-                    elif tool_call.function.name == "escalate_to_supervisor":
-                        logger.debug("Escalating issue to supervisor")
-                        
-                        # Parse escalation details
-                        args = json.loads(tool_call.function.arguments)
-                        issue_summary = args.get("issue_summary", "No summary provided")
-                        issue_type = args.get("issue_type", "other")
-                        priority = args.get("priority", "medium")
-                        
-                        # Get user info if authenticated
-                        user_info = "Anonymous user"
-                        user_email = None
-                        if request.user.is_authenticated:
-                            user_info = f"User: {request.user.username} (ID: {request.user.id})"
-                            user_email = getattr(request.user, 'email', None)
-                        
-                        # Log the escalation (in production, save to database or send to support system)
-                        escalation_data = {
-                            "timestamp": str(json.dumps({"time": "now"})),  # Will be replaced by actual timestamp
-                            "user": user_info,
-                            "user_email": user_email,
-                            "issue_type": issue_type,
-                            "priority": priority,
-                            "summary": issue_summary,
-                            "original_message": user_message
-                        }
-                        
-                        logger.info(f"=== SUPPORT TICKET ESCALATION ===")
-                        logger.info(f"Priority: {priority.upper()}")
-                        logger.info(f"Type: {issue_type}")
-                        logger.info(f"User: {user_info}")
-                        logger.info(f"Summary: {issue_summary}")
-                        logger.info(f"Original message: {user_message}")
-                        logger.info(f"=================================")
-                        
-                        # TODO: In production, save to SupportTicket model or send to external system
-                        # Example: SupportTicket.objects.create(**escalation_data)
-                        
-                        # Return confirmation to AI
-                        escalation_result = {
-                            "status": "escalated",
-                            "ticket_created": True,
-                            "message": "Issue has been escalated to human support. A supervisor will review and respond within 24-48 hours."
-                        }
-                        
-                        # Add the function result to the conversation
-                        chat_completion = client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": user_message},
-                                response_message,
-                                {
-                                    "role": "tool",
-                                    "tool_call_id": tool_call.id,
-                                    "content": json.dumps(escalation_result)
-                                }
-                            ],
-                            temperature=0.7,
-                            max_tokens=500
-                        )
-                        
-                        response_message = chat_completion.choices[0].message
-                        logger.debug(f"Final response content: '{response_message.content}'")
-
-            else:
-                logger.debug("No tool calls made by AI")
-
-            # Extract the final response
-            bot_reply = response_message.content or ""
+            # Fail fast (429/503) if the LLM queue is full; plain searches need no slot
+            if not classify_intent(user_message).fast_path:
+                admit(caller_key(request))
+
+            # Earlier turns of this conversation, trimmed to the history token budget
+            with span("history"):
+                session = get_session(request.data.get('session_id'), search_user)
+                history = build_history(session)
+
+            degraded = False
+            try:
+                bot_reply, searched_products = drain(run_turn(client, user_message, search_user, history=history))
+            except DEGRADE_ON as exc:
+                # LLM down, slow or circuit open: a direct search keeps the chatbot useful
+                logger.warning(f"Chatbot answering without the LLM: {exc!r}")
+                bot_reply, searched_products = fallback_turn(user_message, search_user)
+                degraded = True
+            with span("history"):
+                remember_turn(session, user_message, bot_reply)
+                # Summarizing older turns can take a completion: done in the background
+                if not degraded:
+                    schedule_compaction(session, client)
 
             # Prepare response data
-            response_data = {"reply": bot_reply}
-
-            # Generate Audio Response (TTS)
-            if bot_reply:
-                try:
-                    import base64
-                    
-                    # Limit text length for TTS to avoid excessive usage/latency
-                    tts_text = bot_reply[:1000] 
-                    
-                    speech_response = client.audio.speech.create(
-                        model="tts-1",
-                        voice="alloy",
-                        input=tts_text
-                    )
-                    
-                    # Get binary data
-                    audio_binary = speech_response.content
-                    # Encode to base64
-                    audio_base64 = base64.b64encode(audio_binary).decode('utf-8')
-                    
-                    response_data["audio"] = f"data:audio/mp3;base64,{audio_base64}"
-                    
-                except Exception as e:
-                    logger.error(f"TTS Error: {e}")
-                    # Don't fail the whole request if separate TTS fails
-                    pass
+            response_data = {"reply": bot_reply, "session_id": str(session.key)}
+            if degraded:
+                response_data["degraded"] = True
+
+            # Audio reply (TTS) is opt-in and rendered in the background; the text goes out now
+            # and the client fetches the MP3 from audio_url when it wants to play it
+            if bot_reply and want_audio:
+                audio_url = self.audio_url(request, bot_reply)
+                if audio_url:
+                    response_data["audio_url"] = audio_url
 
             # Always include product data if we searched (even if AI response is empty)
             if searched_products is not None:
@@ -790,6 +273,8 @@ class ChatbotAPIView(APIView):
 
             return Response(response_data, status=status.HTTP_200_OK)
 
+        except LLMBusy as busy:
+            return busy_response(busy)
         except Exception as exc:
             logger.error("CRITICAL ERROR IN CHATBOT VIEW:", exc_info=True)
             return Response(
@@ -800,3 +285,153 @@ class ChatbotAPIView(APIView):
                 },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+
+class ChatbotStreamView(ChatbotAPIView):
+    """
+    Server-sent events variant of the chatbot. Events, in order:
+    session (the session_id to send with the next message), tool_call (per tool
+    the model calls), products (as soon as a search returns), delta (reply text
+    chunks), audio (when tts=true) and finally done.
+    When the LLM is unavailable, products and delta come from a direct search
+    and done carries degraded: true.
+    An error event replaces the rest if something fails mid-stream.
+    """
+
+    def post(self, request):
+        # The trace stays open while the body streams; timings go out in the done event
+        trace = Trace()
+        with activate(trace), caller(caller_key(request)):
+            response = self.start_stream(request, trace)
+        if not response.streaming:
+            finish_trace(trace)
+            response["Server-Timing"] = trace.server_timing()
+        return response
+
+    def start_stream(self, request, trace):
+        try:
+            want_audio = str(request.data.get('tts', 'false')).lower() == 'true'
+            client = get_llm_client() if llm_configured() else None
+
+            user_message, early_response = self.read_user_message(request, client)
+            if early_response is not None:
+                return early_response
+
+            if not llm_configured():
+                return Response(
+                    {"error": "OpenAI API key not configured"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                )
+
+            # Fail fast (429/503) before the stream starts if the LLM queue is full;
+            # plain searches are answered locally and need no slot
+            if not classify_intent(user_message).fast_path:
+                admit(caller_key(request))
+
+            search_user = request.user if request.user.is_authenticated else None
+            with span("history"):
+                session = get_session(request.data.get('session_id'), search_user)
+        except LLMBusy as busy:
+            return busy_response(busy)
+        except Exception as exc:
+            logger.error("CRITICAL ERROR IN CHATBOT STREAM VIEW:", exc_info=True)
+            return Response(
+                {
+                    "error": "internal_server_error",
+                    "detail": str(exc) if settings.DEBUG else "Server error",
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        events = self.stream_events(request, client, user_message, search_user, session, want_audio, trace)
+        return event_stream_response(traced_events(trace, events), request)
+
+    def stream_events(self, request, client, user_message, user, session, want_audio, trace):
+        try:
+            yield sse_event("session", {"session_id": str(session.key)})
+            with span("history"):
+                history = build_history(session)
+            degraded = False
+            try:
+                reply, searched_products = yield from sse_events(
+                    run_turn(client, user_message, user, stream=True, history=history)
+                )
+            except DEGRADE_ON as exc:
+                logger.warning(f"Chatbot stream answering without the LLM: {exc!r}")
+                reply, searched_products = fallback_turn(user_message, user)
+                degraded = True
+                yield sse_event("products", {"products": searched_products})
+                yield sse_event("delta", {"text": reply})
+            with span("history"):
+                remember_turn(session, user_message, reply)
+
+            if reply and want_audio:
+                audio_url = self.audio_url(request, reply)
+                if audio_url:
+                    yield sse_event("audio", {"audio_url": audio_url})
+
+            done = {"reply": reply}
+            if searched_products is not None:
+                done["products"] = searched_products
+            if degraded:
+                done["degraded"] = True
+            done["timings"] = trace.as_list()
+            done["tokens"] = trace.tokens()
+            yield sse_event("done", done)
+
+            # Summarizing older turns can take a completion: done in the background
+            if not degraded:
+                schedule_compaction(session, client)
+
+        except LLMBusy as busy:
+            yield sse_event("error", {"error": "chatbot_busy", "retry_after": busy.retry_after})
+        except Exception as exc:
+            logger.error("CRITICAL ERROR IN CHATBOT STREAM:", exc_info=True)
+            yield sse_event("error", {
+                "error": "internal_server_error",
+                "detail": str(exc) if settings.DEBUG else "Server error",
+            })
+        finally:
+            finish_trace(trace)
+
+
+class ChatbotAudioView(APIView):
+    """Serve the MP3 for a chatbot reply, produced in the background or rendered on demand"""
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request, token):
+        with request_trace() as trace:
+            response = self.audio_response(token)
+        response["Server-Timing"] = trace.server_timing()
+        return response
+
+    def audio_response(self, token):
+        try:
+            audio = get_speech(token)
+        except signing.BadSignature:
+            return Response({"error": "Invalid or expired audio link"}, status=status.HTTP_404_NOT_FOUND)
+        except LLMBusy as busy:
+            return busy_response(busy)
+        except Exception as e:
+            logger.error(f"TTS Error: {e}")
+            return Response({"error": "Failed to generate audio"}, status=status.HTTP_502_BAD_GATEWAY)
+
+        response = HttpResponse(audio, content_type="audio/mpeg")
+        response["Content-Length"] = str(len(audio))
+        response["Cache-Control"] = f"private, max-age={TTS_TOKEN_MAX_AGE}"
+        return response
+
+
+class ChatbotMetricsView(APIView):
+    """Per-stage latency histograms (with token and DB query totals) for this worker process"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            **registry.snapshot(),
+            "tts_cache": tts_cache_stats(),
+            "llm_limiter": llm_limiter.stats(),
+            "llm_breaker": llm_breaker.stats(),
+            "intent": intent_stats(),
+        })
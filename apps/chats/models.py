@@ -16,4 +16,14 @@ class Message(models.Model):
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # When the recipient read it; read receipts are synced by this
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # New messages of a chat: WHERE chat_id = ? AND id > ?
+            models.Index(fields=['chat', 'id'], name='chats_message_chat_id_idx'),
+            # Read receipts for a sender: WHERE sender_id = ? AND read_at > ?
+            models.Index(fields=['sender', 'read_at'], name='chats_message_read_at_idx'),
+        ]
 
@@ -45,3 +45,42 @@ class ChatReadSerializer(serializers.ModelSerializer):
         # Unread messages are those NOT sent by the current user and NOT read
         return obj.messages.filter(is_read=False).exclude(sender=user).count()
 
+
+class ChatUserSerializer(serializers.ModelSerializer):
+    """Just enough of a chat participant to show in the inbox"""
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name')
+
+class ChatProductSerializer(serializers.ModelSerializer):
+    """Product card shown next to a chat"""
+    class Meta:
+        model = Product
+        fields = ('id', 'title', 'price', 'image', 'status')
+
+class ChatInboxSerializer(serializers.ModelSerializer):
+    """
+    One inbox row: participants, product card, last message and unread count.
+    Expects the annotations added by ChatViewSet.inbox_queryset(); the messages
+    themselves come from /api/chats/<id>/messages/.
+    """
+    buyer = ChatUserSerializer(read_only=True)
+    seller = ChatUserSerializer(read_only=True)
+    product = ChatProductSerializer(read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ('id', 'product', 'buyer', 'seller', 'last_message', 'unread_count', 'created_at')
+
+    def get_last_message(self, obj):
+        if obj.last_message_id is None:
+            return None
+        return {
+            'id': obj.last_message_id,
+            'text': obj.last_message_text,
+            'sender': obj.last_message_sender,
+            'timestamp': serializers.DateTimeField().to_representation(obj.last_message_at),
+            'is_read': obj.last_message_is_read,
+        }
@@ -0,0 +1,137 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.products.models import Category, Product
+from apps.realtime import hub
+from .models import Chat, Message
+
+
+class ChatInboxTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create(username="buyer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Calculators")
+        self.chats = []
+        for number in range(5):
+            seller = User.objects.create(username=f"seller{number}")
+            product = Product.objects.create(
+                title=f"Calculator {number}", description="", price=100, condition="used",
+                category=category, seller=seller, status="active",
+            )
+            chat = Chat.objects.create(product=product, buyer=self.user, seller=seller)
+            Message.objects.create(chat=chat, sender=self.user, text="Is it available?")
+            Message.objects.create(chat=chat, sender=seller, text=f"Yes ({number})")
+            self.chats.append(chat)
+
+    def test_inbox_rows_come_from_one_query(self):
+        with self.assertNumQueries(2):  # count + page
+            response = self.client.get(reverse("chat-list"))
+        self.assertEqual(response.status_code, 200)
+        rows = response.data["results"]
+        # Most recently active chat first
+        self.assertEqual([row["id"] for row in rows], [chat.id for chat in reversed(self.chats)])
+        self.assertEqual(rows[0]["last_message"]["text"], "Yes (4)")
+        self.assertEqual(rows[0]["unread_count"], 1)
+        self.assertEqual(rows[0]["product"]["title"], "Calculator 4")
+        self.assertNotIn("messages", rows[0])
+
+    def test_message_history_is_paginated_newest_first(self):
+        chat = self.chats[0]
+        for number in range(12):
+            Message.objects.create(chat=chat, sender=self.user, text=f"message {number}")
+        response = self.client.get(reverse("chat-messages", args=[chat.id]))
+        self.assertEqual(response.data["count"], 14)
+        self.assertEqual(response.data["results"][0]["text"], "message 11")
+        self.assertIsNotNone(response.data["next"])
+
+    def test_other_users_chats_are_not_listed(self):
+        self.client.force_authenticate(get_user_model().objects.create(username="stranger"))
+        self.assertEqual(self.client.get(reverse("chat-list")).data["count"], 0)
+        response = self.client.get(reverse("chat-messages", args=[self.chats[0].id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class MessageSyncTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.buyer = User.objects.create(username="buyer")
+        self.seller = User.objects.create(username="seller")
+        self.chat = Chat.objects.create(buyer=self.buyer, seller=self.seller)
+        self.first = Message.objects.create(chat=self.chat, sender=self.buyer, text="Hi")
+        # Older than the late-commit window, so it is not read again
+        Message.objects.filter(pk=self.first.pk).update(timestamp=timezone.now() - timedelta(minutes=1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_chat_messages_after_a_message_id(self):
+        reply = Message.objects.create(chat=self.chat, sender=self.seller, text="Hello")
+        url = reverse("chat-messages", args=[self.chat.id])
+        response = self.client.get(url, {"after": self.first.id})
+        self.assertEqual([m["id"] for m in response.data["results"]], [reply.id])
+        self.assertIsNone(response.data["read_up_to"])
+
+        self.client.force_authenticate(self.seller)
+        self.client.post(reverse("chat-mark-read", args=[self.chat.id]))
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get(url, {"after": reply.id})
+        self.assertEqual([m["id"] for m in response.data["results"]], [reply.id])  # within the window
+        with mock.patch.object(hub, "LATE_COMMIT_WINDOW", 0):
+            response = self.client.get(url, {"after": reply.id})
+        self.assertEqual(response.data["results"], [])
+        self.assertEqual(response.data["read_up_to"], self.first.id)
+        self.assertEqual(self.client.get(url, {"after": "x"}).status_code, 400)
+
+    def test_sync_returns_new_messages_and_read_receipts_since_the_cursor(self):
+        url = reverse("message-sync")
+        cursor = self.client.get(url).data["cursor"]
+        with mock.patch.object(hub, "LATE_COMMIT_WINDOW", 0), self.assertNumQueries(3):
+            response = self.client.get(url, {"after": cursor})
+        self.assertEqual((response.data["messages"], response.data["read"]), ([], []))
+
+        reply = Message.objects.create(chat=self.chat, sender=self.seller, text="Hello")
+        Message.objects.create(chat=Chat.objects.create(buyer=self.seller, seller=self.seller), sender=self.seller,
+                               text="not for the buyer")
+        self.client.force_authenticate(self.seller)
+        self.client.post(reverse("chat-mark-read", args=[self.chat.id]))
+        self.client.force_authenticate(self.buyer)
+
+        response = self.client.get(url, {"after": cursor})
+        self.assertEqual([m["id"] for m in response.data["messages"]], [reply.id])
+        self.assertEqual(response.data["read"][0]["read_up_to"], self.first.id)
+        # Nothing new after the returned cursor once the late-commit window has passed
+        with mock.patch.object(hub, "LATE_COMMIT_WINDOW", 0):
+            response = self.client.get(url, {"after": response.data["cursor"]})
+        self.assertEqual((response.data["messages"], response.data["read"]), ([], []))
+        self.assertEqual(self.client.get(url, {"after": "bogus"}).status_code, 400)
+
+    def test_sync_picks_up_out_of_order_commits(self):
+        url = reverse("message-sync")
+        cursor = self.client.get(url).data["cursor"]
+        early = Message.objects.create(chat=self.chat, sender=self.seller, text="Slow")
+        late = Message.objects.create(chat=self.chat, sender=self.seller, text="Fast")
+        early_id = early.id
+        early.delete()  # its transaction has not committed yet
+
+        response = self.client.get(url, {"after": cursor})
+        self.assertEqual([m["id"] for m in response.data["messages"]], [late.id])
+        cursor = response.data["cursor"]
+
+        # The slow transaction commits a lower id, and a read receipt stamped
+        # before the cursor's time
+        Message.objects.create(id=early_id, chat=self.chat, sender=self.seller, text="Slow")
+        Message.objects.filter(pk=self.first.pk).update(is_read=True, read_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.get(url, {"after": cursor})
+        self.assertIn(early_id, [m["id"] for m in response.data["messages"]])
+        self.assertEqual(response.data["read"][0]["read_up_to"], self.first.id)
+
+        # Same for one chat's ?after=
+        messages_url = reverse("chat-messages", args=[self.chat.id])
+        self.assertIn(early_id, [m["id"] for m in self.client.get(messages_url, {"after": late.id}).data["results"]])
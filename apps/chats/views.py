@@ -1,30 +1,115 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from .models import Chat, Message
-from .serializers import ChatSerializer, MessageSerializer, ChatReadSerializer
+from .serializers import ChatSerializer, MessageSerializer, ChatReadSerializer, ChatInboxSerializer
 from apps.common.permissions import IsOwnerOrAdmin
+from apps.realtime.events import publish
+from apps.realtime.hub import late_commit_cutoff
+
+# Most messages one sync call returns; clients call again while has_more is true
+SYNC_LIMIT = 200
+
+
+def mark_chat_read(chat, user):
+    """
+    Mark the messages `user` received in `chat` as read and push the read
+    receipt to the other participant; returns how many changed.
+    """
+    read_at = timezone.now()
+    updated = chat.messages.filter(is_read=False).exclude(sender=user).update(is_read=True, read_at=read_at)
+    if updated:
+        read_up_to = chat.messages.exclude(sender=user).filter(is_read=True).aggregate(last=Max('id'))['last']
+        other = chat.seller_id if user.id == chat.buyer_id else chat.buyer_id
+        publish([other], 'read', {'chat': chat.id, 'read_up_to': read_up_to, 'read_at': read_at})
+    return updated
+
+
+def parse_after(value):
+    """A message id cursor from the query string (ValueError if malformed)."""
+    after = int(value)
+    if after < 0:
+        raise ValueError(value)
+    return after
+
+
+def rewind(after):
+    """
+    Where a read "after message id `after`" has to start: a slow transaction can
+    still commit a lower id, so messages of the late-commit window are read again
+    (clients skip ids they already have). Walks back from `after` on the primary key.
+    """
+    final = (
+        Message.objects.filter(id__lte=after, timestamp__lt=late_commit_cutoff())
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+    return final or 0
+
+
+def encode_cursor(message_id, read_at):
+    return f'{message_id}.{int(read_at.timestamp() * 1_000_000)}'
+
+
+def decode_cursor(cursor):
+    """(last message id, last read receipt time) of a sync cursor (ValueError if malformed)."""
+    message_id, read_micros = cursor.split('.')
+    read_at = datetime.fromtimestamp(int(read_micros) / 1_000_000, tz=dt_timezone.utc)
+    return parse_after(message_id), read_at
 
 class ChatViewSet(viewsets.ModelViewSet):
     queryset = Chat.objects.all().select_related('product', 'buyer', 'seller')
     permission_classes = [permissions.IsAuthenticated]
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action == 'list':
+            return ChatInboxSerializer
+        if self.action == 'retrieve':
             return ChatReadSerializer
+        if self.action == 'messages':
+            return MessageSerializer
         return ChatSerializer
 
     def get_queryset(self):
         user = self.request.user
-        return self.queryset.filter(Q(buyer=user) | Q(seller=user))
+        queryset = self.queryset.filter(Q(buyer=user) | Q(seller=user))
+        if self.action == 'list':
+            return self.inbox_queryset(queryset, user)
+        return queryset
+
+    @staticmethod
+    def inbox_queryset(queryset, user):
+        """
+        Chats annotated with their last message and the user's unread count,
+        most recently active first, so the inbox is one query per page.
+        """
+        last_message = Message.objects.filter(chat=OuterRef('pk')).order_by('-id')[:1]
+        unread = (
+            Message.objects
+            .filter(chat=OuterRef('pk'), is_read=False)
+            .exclude(sender=user)
+            .order_by()
+            .values('chat')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return queryset.annotate(
+            last_message_id=Subquery(last_message.values('id')),
+            last_message_text=Subquery(last_message.values('text')),
+            last_message_sender=Subquery(last_message.values('sender_id')),
+            last_message_at=Subquery(last_message.values('timestamp')),
+            last_message_is_read=Subquery(last_message.values('is_read')),
+            unread_count=Coalesce(Subquery(unread), 0),
+        ).order_by(Coalesce('last_message_at', 'created_at').desc(), F('id').desc())
 
     def retrieve(self, request, *args, **kwargs):
         """When retrieving a chat, mark all messages as read for the current user."""
         instance = self.get_object()
-        user = request.user
         # Mark all unread messages NOT sent by current user as read
-        instance.messages.filter(is_read=False).exclude(sender=user).update(is_read=True)
+        mark_chat_read(instance, request.user)
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
@@ -32,11 +117,40 @@ class ChatViewSet(viewsets.ModelViewSet):
     def mark_read(self, request, pk=None):
         """Mark all messages in this chat as read for the current user."""
         chat = self.get_object()
-        user = request.user
         # Mark all unread messages NOT sent by current user as read
-        updated = chat.messages.filter(is_read=False).exclude(sender=user).update(is_read=True)
+        updated = mark_chat_read(chat, request.user)
         return Response({'marked_read': updated})
 
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        Message history of a chat, newest first, one page at a time.
+        With ?after=<message_id>: only the newer messages, oldest first, plus
+        `read_up_to`, the last of the user's own messages the other side has read.
+        Messages of the last few seconds may be repeated (see rewind).
+        """
+        chat = self.get_object()
+        after = request.query_params.get('after')
+        if after is not None:
+            try:
+                after = parse_after(after)
+            except ValueError:
+                return Response({"error": "after must be a message id."}, status=status.HTTP_400_BAD_REQUEST)
+            # One range scan on the (chat, id) index
+            new_messages = list(chat.messages.filter(id__gt=rewind(after)).order_by('id')[:SYNC_LIMIT + 1])
+            read_up_to = (
+                chat.messages.filter(sender=request.user, is_read=True).aggregate(last=Max('id'))['last']
+            )
+            return Response({
+                'results': self.get_serializer(new_messages[:SYNC_LIMIT], many=True).data,
+                'has_more': len(new_messages) > SYNC_LIMIT,
+                'read_up_to': read_up_to,
+            })
+        queryset = chat.messages.order_by('-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['post'], url_path='find-or-create')
     def find_or_create_chat(self, request):
         product_id = request.data.get('product')
@@ -78,5 +192,53 @@ class MessageViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+        message = serializer.save(sender=self.request.user)
+        # Both participants: the recipient, and the sender's other devices
+        publish([message.chat.buyer_id, message.chat.seller_id], 'message', serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Everything new across the user's chats since ?after=<cursor>: messages,
+        and read receipts (per chat, the last of the user's messages now read).
+        Returns the cursor for the next call; without one, only the current cursor.
+        The last few seconds are read again each call, so clients skip known message ids.
+        """
+        user = request.user
+        cursor = request.query_params.get('after')
+        if not cursor:
+            last_id = Message.objects.aggregate(last=Max('id'))['last'] or 0
+            return Response({'messages': [], 'read': [], 'has_more': False,
+                             'cursor': encode_cursor(last_id, timezone.now())})
+        try:
+            after, read_since = decode_cursor(cursor)
+        except ValueError:
+            return Response({"error": "Invalid sync cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        chats = Chat.objects.filter(Q(buyer=user) | Q(seller=user)).values('id')
+        new_messages = list(
+            Message.objects.filter(chat__in=chats, id__gt=rewind(after)).order_by('id')[:SYNC_LIMIT + 1]
+        )
+        new_messages, rest = new_messages[:SYNC_LIMIT], new_messages[SYNC_LIMIT:]
+        # A batch of re-read messages only would not move the cursor: not "more"
+        has_more = bool(rest) and new_messages[-1].id > after
+        # Receipts are idempotent: re-read the late-commit window like the messages
+        receipts = list(
+            Message.objects
+            .filter(sender=user, read_at__gt=min(read_since, late_commit_cutoff()))
+            .values('chat')
+            .annotate(read_up_to=Max('id'), read_at=Max('read_at'))
+            .order_by('chat')
+        )
+        last_id = max(new_messages[-1].id, after) if new_messages else after
+        last_read = max((receipt['read_at'] for receipt in receipts), default=read_since)
+        return Response({
+            'messages': self.get_serializer(new_messages, many=True).data,
+            'read': [
+                {'chat': receipt['chat'], 'read_up_to': receipt['read_up_to'], 'read_at': receipt['read_at']}
+                for receipt in receipts
+            ],
+            'has_more': has_more,
+            'cursor': encode_cursor(last_id, last_read),
+        })
 
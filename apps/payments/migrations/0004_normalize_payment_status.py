@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+VALID_STATUSES = ['pending', 'pending_confirmation', 'completed', 'failed', 'cancelled']
+
+
+def normalize_statuses(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    Payment.objects.update(status=Lower(Trim('status')))
+    # Legacy rows stored 'active' for completed payments (statistics counted them as revenue)
+    Payment.objects.filter(status='active').update(status='completed')
+    # Anything else was never counted as revenue or pending, so 'failed' keeps the aggregates unchanged
+    Payment.objects.exclude(status__in=VALID_STATUSES).update(status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_add_payment_confirmation_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_statuses, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['start_date'], name='payment_completed_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['payment_method'], name='payment_completed_method_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['package'], name='payment_completed_package_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.CheckConstraint(condition=models.Q(('status__in', ['pending', 'pending_confirmation', 'completed', 'failed', 'cancelled'])), name='payment_status_valid'),
+        ),
+    ]
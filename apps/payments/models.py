@@ -13,7 +13,18 @@ class Package(models.Model):
     def __str__(self):
         return self.name
 
+class PaymentQuerySet(models.QuerySet):
+    def completed(self):
+        """Payments that count towards revenue (served by the partial indexes below)."""
+        return self.filter(status=Payment.STATUS_COMPLETED)
+
+    def pending(self):
+        return self.filter(status=Payment.STATUS_PENDING)
+
+
 class Payment(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_COMPLETED = 'completed'
     PAYMENT_METHODS = [('credit','Credit Card'),('paypal','PayPal'),('cash','Cash'),('wallet','Mobile Wallet'),('bank','Bank Transfer')]
     STATUS_CHOICES = [('pending','Pending'),('pending_confirmation','Pending Confirmation'),('completed','Completed'),('failed','Failed'),('cancelled','Cancelled')]
     
@@ -33,6 +44,29 @@ class Payment(models.Model):
     admin_confirmed_at = models.DateTimeField(null=True, blank=True)  # When admin confirmed receiving payment
     admin_notes = models.TextField(blank=True, null=True)  # Optional admin notes
 
+    objects = PaymentQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Statuses are stored lowercase and must be one of STATUS_CHOICES
+            models.CheckConstraint(
+                condition=models.Q(status__in=['pending', 'pending_confirmation', 'completed', 'failed', 'cancelled']),
+                name='payment_status_valid',
+            ),
+        ]
+        indexes = [
+            # Partial indexes for the revenue queries in products.statistics
+            models.Index(fields=['start_date'], condition=models.Q(status='completed'), name='payment_completed_start_idx'),
+            models.Index(fields=['payment_method'], condition=models.Q(status='completed'), name='payment_completed_method_idx'),
+            models.Index(fields=['package'], condition=models.Q(status='completed'), name='payment_completed_package_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Normalize legacy/mixed-case values ('COMPLETED', ' Pending ') before hitting the check constraint
+        if self.status:
+            self.status = self.status.strip().lower()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Payment {self.id} - {self.user.username} - {self.status}"
 
@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .models import Package, Payment
+
+
+class PaymentStatusTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="buyer")
+        self.package = Package.objects.create(name="Basic", price=100, duration_in_days=30, ad_limit=5)
+
+    def _payment(self, status, amount=100):
+        return Payment.objects.create(user=self.user, package=self.package, amount=amount, status=status)
+
+    def test_save_normalizes_status(self):
+        self.assertEqual(self._payment(" COMPLETED ").status, "completed")
+        self.assertEqual(Payment.objects.get(status="completed").status, "completed")
+
+    def test_completed_and_pending_querysets(self):
+        completed = self._payment("Completed")
+        pending = self._payment("pending")
+        self._payment("failed")
+        self.assertEqual(list(Payment.objects.completed()), [completed])
+        self.assertEqual(list(Payment.objects.pending()), [pending])
+
+    def test_dashboard_revenue_counts_completed_payments_only(self):
+        self._payment("completed", amount=150)
+        self._payment("COMPLETED", amount=50)
+        self._payment("pending", amount=999)
+        self._payment("cancelled", amount=999)
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create(username="admin", is_staff=True))
+
+        revenue = client.get(reverse("product-dashboard-stats")).json()["revenue"]
+        self.assertEqual(revenue["total"], 200.0)
+        self.assertEqual(revenue["total_payments"], 2)
+        self.assertEqual(revenue["pending_payments"], 1)
+
+
+class NormalizePaymentStatusMigrationTests(TransactionTestCase):
+    before = [("payments", "0003_add_payment_confirmation_fields")]
+    after = [("payments", "0004_normalize_payment_status")]
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self._migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_legacy_statuses_are_mapped(self):
+        apps = self._migrate(self.before)
+        Package = apps.get_model("payments", "Package")
+        Payment = apps.get_model("payments", "Payment")
+        # Only payments is rolled back: the users table is already at its latest schema
+        user = get_user_model().objects.create(username="legacy")
+        package = Package.objects.create(name="Basic", price=100, duration_in_days=30, ad_limit=5)
+        legacy = {"Active": "completed", " PENDING ": "pending", "completed": "completed", "refunded": "failed"}
+        ids = {
+            Payment.objects.create(user_id=user.pk, package=package, amount=Decimal("10"), status=status).pk: expected
+            for status, expected in legacy.items()
+        }
+
+        Payment = self._migrate(self.after).get_model("payments", "Payment")
+        self.assertEqual(dict(Payment.objects.values_list("pk", "status")), ids)
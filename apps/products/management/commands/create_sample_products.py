@@ -1,5 +1,8 @@
 from django.core.management.base import BaseCommand
 from apps.products.models import Category, Product
+from apps.chatbot.result_cache import invalidate_search_cache
+from apps.chatbot.search import invalidate_campus_recommendations
+from apps.chatbot.semantic import index_products
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -14,7 +17,14 @@ class Command(BaseCommand):
         if options['all']:
             # Approve all pending products
             pending_products = Product.objects.filter(status='pending')
+            campuses = set(pending_products.values_list('university', 'faculty'))
+            pending_ids = list(pending_products.values_list('id', flat=True))
             count = pending_products.update(status='active')
+            # Bulk update skips post_save, so expire the chatbot caches explicitly
+            for university, faculty in campuses:
+                invalidate_campus_recommendations(university, faculty)
+            invalidate_search_cache()
+            index_products(Product.objects.filter(id__in=pending_ids).select_related('category'))
             self.stdout.write(self.style.SUCCESS(f'Approved {count} pending products - they are now active for the AI to find!'))
         else:
             # Show current status
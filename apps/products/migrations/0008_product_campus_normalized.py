@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+def populate_campus_normalized(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(
+        university_normalized=Lower(Trim('university')),
+        faculty_normalized=Lower(Trim('faculty')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_status_price_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='faculty_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='university_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_campus_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['university_normalized', 'status'], name='product_university_norm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['faculty_normalized', 'status'], name='product_faculty_norm_idx'),
+        ),
+    ]
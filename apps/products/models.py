@@ -29,6 +29,9 @@ class Product(models.Model):
     university = models.CharField(max_length=255, blank=True)
     faculty = models.CharField(max_length=255, blank=True)
     governorate = models.CharField(max_length=255, blank=True, default='')
+    # Lowercased/stripped copies of university and faculty, kept in sync by save(), for indexed campus lookups
+    university_normalized = models.CharField(max_length=255, blank=True, default='', editable=False)
+    faculty_normalized = models.CharField(max_length=255, blank=True, default='', editable=False)
     is_featured = models.BooleanField(default=False)
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -37,6 +40,28 @@ class Product(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     expires_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Chatbot search: active products, cheapest first
+            models.Index(fields=['status', 'price'], name='product_status_price_idx'),
+            # Chatbot recommendations: same university OR same faculty
+            models.Index(fields=['university_normalized', 'status'], name='product_university_norm_idx'),
+            models.Index(fields=['faculty_normalized', 'status'], name='product_faculty_norm_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.university_normalized = (self.university or '').strip().lower()
+        self.faculty_normalized = (self.faculty or '').strip().lower()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'university' in update_fields:
+                update_fields.add('university_normalized')
+            if 'faculty' in update_fields:
+                update_fields.add('faculty_normalized')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
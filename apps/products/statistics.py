@@ -45,22 +45,15 @@ class StatisticsMixin:
         users_last_30_days = User.objects.filter(date_joined__gte=thirty_days_ago).count()
         
         # Payment statistics
-        total_revenue = Payment.objects.filter(
-            status__in=['COMPLETED', 'completed', 'active']
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        total_revenue = Payment.objects.completed().aggregate(total=Sum('amount'))['total'] or 0
         
-        revenue_last_30_days = Payment.objects.filter(
-            start_date__gte=thirty_days_ago.date(),
-            status__in=['COMPLETED', 'completed', 'active']
+        revenue_last_30_days = Payment.objects.completed().filter(
+            start_date__gte=thirty_days_ago.date()
         ).aggregate(total=Sum('amount'))['total'] or 0
         
-        total_payments = Payment.objects.filter(
-            status__in=['COMPLETED', 'completed', 'active']
-        ).count()
+        total_payments = Payment.objects.completed().count()
         
-        pending_payments = Payment.objects.filter(
-            status__in=['PENDING', 'pending']
-        ).count()
+        pending_payments = Payment.objects.pending().count()
         
         return Response({
             'products': {
@@ -133,9 +126,8 @@ class StatisticsMixin:
         ).order_by('-count')[:10]
         
         # Revenue timeline (weekly for better visualization)
-        revenue_timeline = Payment.objects.filter(
-            start_date__gte=start_date.date(),
-            status__in=['COMPLETED', 'completed', 'active']
+        revenue_timeline = Payment.objects.completed().filter(
+            start_date__gte=start_date.date()
         ).annotate(
             week=TruncWeek('start_date')
         ).values('week').annotate(
@@ -144,25 +136,19 @@ class StatisticsMixin:
         ).order_by('week')
         
         # Revenue by payment method
-        revenue_by_method = Payment.objects.filter(
-            status__in=['COMPLETED', 'completed', 'active']
-        ).values('payment_method').annotate(
+        revenue_by_method = Payment.objects.completed().values('payment_method').annotate(
             total=Sum('amount'),
             count=Count('id')
         ).order_by('-total')
         
         # Revenue by package
-        revenue_by_package = Payment.objects.filter(
-            status__in=['COMPLETED', 'completed', 'active']
-        ).values('package__name').annotate(
+        revenue_by_package = Payment.objects.completed().values('package__name').annotate(
             total=Sum('amount'),
             count=Count('id')
         ).order_by('-total')
         
         # Average transaction value
-        avg_transaction = Payment.objects.filter(
-            status__in=['COMPLETED', 'completed', 'active']
-        ).aggregate(avg=Avg('amount'))['avg'] or 0
+        avg_transaction = Payment.objects.completed().aggregate(avg=Avg('amount'))['avg'] or 0
         
         # Top selling products (based on being in completed payments)
         # Note: This is a simplified version. In a real scenario, you'd have a sales/orders model
@@ -0,0 +1,110 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .hub import as_message, hub, late_commit_cutoff
+from .models import PushEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds a push event is kept for clients catching up after a reconnect
+REALTIME_RETENTION = getattr(settings, 'REALTIME_RETENTION', 24 * 60 * 60)
+# Most events returned by one catch-up read
+EVENT_BATCH = 500
+# Seconds between expired-event cleanups in one process
+PRUNE_EVERY = 5 * 60
+
+_last_prune = 0.0
+
+
+def publish(user_ids, kind, payload):
+    """
+    Push `payload` to every connected client of `user_ids` once the current
+    transaction commits. Safe to call from any instance, ASGI or WSGI.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+
+    def write():
+        PushEvent.objects.bulk_create([PushEvent(user_id=user_id, kind=kind, payload=payload) for user_id in user_ids])
+        # Local subscribers hear about it now instead of at the next poll
+        hub.wake()
+        prune()
+
+    transaction.on_commit(write)
+
+
+def fetch_events(user_id, after, delivered=()):
+    """Events of one user newer than event id `after` and not in `delivered`, oldest first"""
+    events = PushEvent.objects.filter(user_id=user_id, id__gt=after)
+    if delivered:
+        events = events.exclude(id__in=delivered)
+    return [as_message(event) for event in events.order_by('id').values('id', 'kind', 'payload')[:EVENT_BATCH]]
+
+
+def catch_up_events(user_id, after):
+    """
+    Events of one user newer than `after`, plus the ones of the late-commit window
+    below it (a reconnecting client may have missed those); may repeat events.
+    """
+    events = PushEvent.objects.filter(
+        Q(id__gt=after) | Q(id__lte=after, created_at__gte=late_commit_cutoff()), user_id=user_id,
+    )
+    return [as_message(event) for event in events.order_by('id').values('id', 'kind', 'payload')[:EVENT_BATCH]]
+
+
+def parse_cursor(cursor):
+    """
+    (after, delivered ids) of a long-poll cursor "<after>" or "<after>:<id>,<id>"
+    (ValueError if malformed)
+    """
+    after, _, delivered = str(cursor).partition(':')
+    after = int(after)
+    delivered = frozenset(int(event_id) for event_id in delivered.split(',') if event_id)
+    if after < 0 or any(event_id <= after for event_id in delivered):
+        raise ValueError(cursor)
+    return after, delivered
+
+
+def next_cursor(user_id, after, delivered, events):
+    """
+    Cursor for the next long-poll after `events` were sent. It stays behind events
+    of the late-commit window (a lower id may still commit) and lists the ones of
+    them already delivered, so they are not sent twice.
+    """
+    delivered = set(delivered) | {event['id'] for event in events}
+    final = PushEvent.objects.filter(user_id=user_id, id__gt=after, created_at__lt=late_commit_cutoff())
+    if len(events) == EVENT_BATCH:
+        # A truncated batch: never move past events not sent yet
+        final = final.filter(id__lte=events[-1]['id'])
+    after = max(after, final.aggregate(last=Max('id'))['last'] or 0)
+    delivered = sorted(event_id for event_id in delivered if event_id > after)
+    return f"{after}:{','.join(map(str, delivered))}" if delivered else str(after)
+
+
+def latest_cursor(user_id):
+    """A starting cursor for a client of `user_id` that has seen nothing: the head of the table"""
+    cutoff = late_commit_cutoff()
+    after = PushEvent.objects.filter(created_at__lt=cutoff).aggregate(last=Max('id'))['last'] or 0
+    # Newer events exist already: skip them, but not lower ids that commit later
+    current = PushEvent.objects.filter(user_id=user_id, id__gt=after).values('id')
+    return next_cursor(user_id, after, (), [{'id': event['id']} for event in current])
+
+
+def prune():
+    """Drop expired events, at most every PRUNE_EVERY seconds per process"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_EVERY:
+        return
+    _last_prune = now
+    try:
+        PushEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=REALTIME_RETENTION)).delete()
+    except Exception:
+        logger.exception("Could not prune push events")
@@ -0,0 +1,157 @@
+"""
+In-process pub/sub for push clients.
+
+Every open WebSocket or long-poll request subscribes for its user. While
+anyone is subscribed, one background thread tails the PushEvent table and
+hands each new row to the subscribers of its user, whatever server instance
+published it. A publish in this process wakes the thread at once; events
+from other instances arrive within REALTIME_POLL_INTERVAL. Ids are taken at
+insert but become visible at commit, so a row can appear below ids already
+read; the last LATE_COMMIT_WINDOW seconds are re-read to pick those up.
+"""
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import PushEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reads of the event table when nothing wakes the hub
+REALTIME_POLL_INTERVAL = getattr(settings, 'REALTIME_POLL_INTERVAL', 1.0)
+# Seconds between an event's insert and its commit that readers allow for: a slow
+# transaction can commit a row after rows with higher ids were already read, so
+# the events of this trailing window are read again (and deduplicated by id)
+LATE_COMMIT_WINDOW = getattr(settings, 'REALTIME_LATE_COMMIT_WINDOW', 5.0)
+TAIL_BATCH = 1000
+
+
+def late_commit_cutoff():
+    """Events created before this are final: no lower id can still appear"""
+    return timezone.now() - timedelta(seconds=LATE_COMMIT_WINDOW)
+
+
+def as_message(event):
+    """What a client receives for one event row (a dict from PushEvent values())"""
+    return {'id': event['id'], 'type': event['kind'], 'data': event['payload']}
+
+
+class Subscription:
+    """Events for one user, delivered into an asyncio queue on the subscriber's loop"""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def deliver(self, message):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+
+class Hub:
+    def __init__(self, poll_interval=None):
+        self.poll_interval = poll_interval or REALTIME_POLL_INTERVAL
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_id = None
+        # Ids within the late-commit window that were already dispatched
+        self._seen = set()
+
+    def subscribe(self, user_id):
+        """Start receiving `user_id`'s events; call from a coroutine"""
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+            if self._thread is None:
+                self._start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.user_id]
+
+    def wake(self):
+        """New events were written: read the table now"""
+        self._wake.set()
+
+    def dispatch(self, events):
+        """Hand event rows to the subscribers of their users"""
+        with self._lock:
+            targets = [
+                (subscription, as_message(event))
+                for event in events
+                for subscription in self._subscriptions.get(event['user_id'], ())
+            ]
+        for subscription, message in targets:
+            subscription.deliver(message)
+
+    def _start(self):
+        # Caller holds the lock; the first read (of the table head) happens right away
+        self._wake.set()
+        self._thread = threading.Thread(target=self._run, name='realtime-hub', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                with self._lock:
+                    if not self._subscriptions:
+                        # Nobody listening: stop tailing until the next subscriber
+                        self._thread = None
+                        self._last_id = None
+                        self._seen = set()
+                        return
+                try:
+                    close_old_connections()
+                    self.dispatch(self._tail())
+                except Exception:
+                    logger.exception("Push hub could not read new events")
+        finally:
+            connections.close_all()
+
+    def _tail(self):
+        cutoff = late_commit_cutoff()
+        if self._last_id is None:
+            # Start at the head; subscribers catch up on older events themselves
+            self._last_id = PushEvent.objects.aggregate(last=Max('id'))['last'] or 0
+            self._seen = set(
+                PushEvent.objects.filter(id__lte=self._last_id, created_at__gte=cutoff).values_list('id', flat=True)
+            )
+            return []
+        # Rows below the last id read that committed since: re-read the window's ids
+        recent = set(
+            PushEvent.objects.filter(id__lte=self._last_id, created_at__gte=cutoff).values_list('id', flat=True)
+        )
+        late = recent - self._seen
+        condition = Q(id__gt=self._last_id)
+        if late:
+            condition |= Q(id__in=late)
+        events = list(
+            PushEvent.objects.filter(condition)
+            .order_by('id')
+            .values('id', 'user_id', 'kind', 'payload')[:TAIL_BATCH]
+        )
+        # Ids that left the window drop out of the seen set here
+        self._seen = (recent - late) | {event['id'] for event in events}
+        if events:
+            self._last_id = max(self._last_id, events[-1]['id'])
+            if len(events) == TAIL_BATCH:
+                self.wake()
+        return events
+
+
+hub = Hub()
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class PushEvent(models.Model):
+    """
+    One event for one user (new message, read receipt, notification). Rows are
+    the fan-out between server instances: each one tails this table and pushes
+    new rows to its connected clients. They are pruned after REALTIME_RETENTION.
+    """
+    KIND_CHOICES = [
+        ('message', 'New Message'),
+        ('read', 'Read Receipt'),
+        ('notification', 'Notification'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='push_events')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Catch-up for one client: WHERE user_id = ? AND id > ?
+            models.Index(fields=['user', 'id'], name='realtime_event_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for user {self.user_id}"
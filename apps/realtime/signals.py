@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.notifications.models import Notification
+from apps.notifications.serializers import NotificationSerializer
+from .events import publish
+
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, **kwargs):
+    """Push new notifications to the user's connected clients"""
+    if created:
+        publish([instance.user_id], 'notification', NotificationSerializer(instance).data)
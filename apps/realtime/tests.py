@@ -0,0 +1,161 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.chats.models import Chat
+from apps.notifications.models import Notification
+from . import hub as hub_module
+from .hub import Hub, hub
+from .models import PushEvent
+from .websocket import websocket_application
+
+
+class PushEventTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.buyer = User.objects.create(username="buyer")
+        self.seller = User.objects.create(username="seller")
+        self.chat = Chat.objects.create(buyer=self.buyer, seller=self.seller)
+
+    def test_messages_read_receipts_and_notifications_are_published(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            message = client.post(reverse("message-list"), {"chat": self.chat.id, "text": "Hi"}).data
+        self.assertEqual(
+            sorted(PushEvent.objects.filter(kind="message").values_list("user_id", flat=True)),
+            [self.buyer.id, self.seller.id],
+        )
+
+        client.force_authenticate(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse("chat-mark-read", args=[self.chat.id]))
+        receipt = PushEvent.objects.get(kind="read")
+        self.assertEqual((receipt.user_id, receipt.payload["read_up_to"]), (self.buyer.id, message["id"]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.seller, notification_type="system", title="Hello", message="")
+        self.assertEqual(PushEvent.objects.get(kind="notification").payload["title"], "Hello")
+
+    def test_long_poll_returns_pending_events_at_once(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.buyer)}"}
+        url = reverse("realtime-poll")
+        cursor = self.client.get(url, **auth).json()["cursor"]
+        event = PushEvent.objects.create(user=self.buyer, kind="notification", payload={"title": "Hello"})
+        PushEvent.objects.create(user=self.seller, kind="notification", payload={"title": "Not yours"})
+
+        data = self.client.get(url, {"after": cursor}, **auth).json()
+        self.assertEqual(data["events"], [{"id": event.id, "type": "notification", "data": {"title": "Hello"}}])
+        self.assertEqual(data["cursor"], f"{cursor}:{event.id}")
+        self.assertEqual(self.client.get(url, {"after": cursor}).status_code, 401)
+
+    def _late_commit(self):
+        """Two events whose lower id is not committed yet; returns (early id, restore)"""
+        early = PushEvent.objects.create(user=self.buyer, kind="notification", payload={"title": "Slow"})
+        PushEvent.objects.create(user=self.buyer, kind="notification", payload={"title": "Fast"})
+        early_id = early.id
+        early.delete()
+        return early_id, lambda: PushEvent.objects.create(
+            id=early_id, user=self.buyer, kind="notification", payload={"title": "Slow"},
+        )
+
+    def test_hub_picks_up_an_event_committed_below_ids_already_read(self):
+        tailer = Hub()
+        self.assertEqual(tailer._tail(), [])
+        early_id, commit = self._late_commit()
+        self.assertEqual([event["payload"]["title"] for event in tailer._tail()], ["Fast"])
+        commit()
+        self.assertEqual([event["id"] for event in tailer._tail()], [early_id])
+        self.assertEqual(tailer._tail(), [])
+
+    def test_long_poll_cursor_stays_behind_late_commits(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.buyer)}"}
+        url = reverse("realtime-poll")
+        cursor = self.client.get(url, **auth).json()["cursor"]
+        early_id, commit = self._late_commit()
+        data = self.client.get(url, {"after": cursor}, **auth).json()
+        self.assertEqual([event["data"]["title"] for event in data["events"]], ["Fast"])
+
+        commit()
+        data = self.client.get(url, {"after": data["cursor"]}, **auth).json()
+        self.assertEqual([event["id"] for event in data["events"]], [early_id])
+
+        # Once the window has passed the cursor moves past both, and nothing repeats
+        with mock.patch.object(hub_module, "LATE_COMMIT_WINDOW", 0):
+            data = self.client.get(url, {"after": data["cursor"]}, **auth).json()
+        self.assertEqual(data, {"events": [], "cursor": str(early_id + 1)})
+        self.assertEqual(self.client.get(url, {"after": "5:3"}, **auth).status_code, 400)
+
+    def test_long_poll_does_not_hold_a_wsgi_worker(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.buyer)}"}
+        url = reverse("realtime-poll")
+        cursor = self.client.get(url, **auth).json()["cursor"]
+        with mock.patch.object(hub, "subscribe") as subscribe:
+            data = self.client.get(url, {"after": cursor}, **auth).json()
+        subscribe.assert_not_called()
+        self.assertEqual(data, {"events": [], "cursor": cursor})
+
+    async def test_long_poll_waits_for_an_event_under_asgi(self):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.buyer)}"}
+        url = reverse("realtime-poll")
+        cursor = (await self.async_client.get(url, headers=headers)).json()["cursor"]
+        with mock.patch.object(hub, "_start"):
+            waiting = asyncio.ensure_future(self.async_client.get(url, {"after": cursor}, headers=headers))
+            for _ in range(500):
+                if self.buyer.id in hub._subscriptions:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertFalse(waiting.done())
+            event = await PushEvent.objects.acreate(user=self.buyer, kind="notification", payload={"title": "Hello"})
+            # What the hub thread does once the event is written
+            hub.dispatch([{"id": event.id, "user_id": self.buyer.id, "kind": "notification", "payload": {}}])
+            data = (await waiting).json()
+        self.assertEqual([e["data"]["title"] for e in data["events"]], ["Hello"])
+
+    async def test_websocket_catches_up_then_streams_live_events(self):
+        missed = await PushEvent.objects.acreate(user=self.buyer, kind="notification", payload={"title": "Missed"})
+        query = f"token={AccessToken.for_user(self.buyer)}&after={missed.id - 1}"
+        incoming = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def wait_for_frames(count):
+            for _ in range(500):
+                if len(sent) >= count:
+                    return
+                await asyncio.sleep(0.01)
+            self.fail(f"expected {count} frames, got {sent}")
+
+        scope = {"type": "websocket", "path": "/ws/", "query_string": query.encode()}
+        await incoming.put({"type": "websocket.connect"})
+        with mock.patch.object(hub, "_start"):
+            connection = asyncio.ensure_future(websocket_application(scope, incoming.get, send))
+            await wait_for_frames(2)
+            # What the hub thread does when another instance publishes for this user
+            hub.dispatch([{"id": missed.id + 1, "user_id": self.buyer.id, "kind": "read", "payload": {"chat": 1}}])
+            await wait_for_frames(3)
+            await incoming.put({"type": "websocket.disconnect"})
+            await connection
+        self.assertEqual(sent[0], {"type": "websocket.accept"})
+        self.assertEqual(json.loads(sent[1]["text"])["data"], {"title": "Missed"})
+        self.assertEqual(json.loads(sent[2]["text"])["type"], "read")
+        self.assertEqual(hub._subscriptions, {})
+
+    async def test_websocket_rejects_missing_token(self):
+        incoming = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await incoming.put({"type": "websocket.connect"})
+        await websocket_application({"type": "websocket", "path": "/ws/", "query_string": b""}, incoming.get, send)
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 4401}])
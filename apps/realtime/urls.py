@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import long_poll
+
+urlpatterns = [
+    path('realtime/poll/', long_poll, name='realtime-poll'),
+]
@@ -0,0 +1,65 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .events import fetch_events, latest_cursor, next_cursor, parse_cursor
+from .hub import hub
+
+# Seconds a long-poll request waits for an event before answering empty
+REALTIME_LONG_POLL_TIMEOUT = getattr(settings, 'REALTIME_LONG_POLL_TIMEOUT', 25)
+# The same under WSGI, where a waiting request holds a whole worker: 0 answers at once
+REALTIME_WSGI_LONG_POLL_TIMEOUT = getattr(settings, 'REALTIME_WSGI_LONG_POLL_TIMEOUT', 0)
+
+
+def _authenticate(request):
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@require_GET
+async def long_poll(request):
+    """
+    Long-poll fallback for clients without WebSockets: GET /api/realtime/poll/?after=<cursor>
+    answers as soon as the user has events the cursor has not covered, or empty after
+    REALTIME_LONG_POLL_TIMEOUT seconds. Without `after`, returns a starting cursor at once.
+    Pass the returned cursor as `after` on the next call. Served by WSGI, it waits at
+    most REALTIME_WSGI_LONG_POLL_TIMEOUT (a plain poll by default).
+    """
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid."}, status=401)
+    cursor = request.GET.get('after')
+    if cursor is None:
+        return JsonResponse({'events': [], 'cursor': await sync_to_async(latest_cursor)(user.id)})
+    try:
+        after, delivered = parse_cursor(cursor)
+    except ValueError:
+        return JsonResponse({"error": "after must be a cursor returned by this endpoint."}, status=400)
+
+    timeout = REALTIME_LONG_POLL_TIMEOUT if isinstance(request, ASGIRequest) else REALTIME_WSGI_LONG_POLL_TIMEOUT
+    events = await sync_to_async(fetch_events)(user.id, after, delivered)
+    if not events and timeout > 0:
+        subscription = hub.subscribe(user.id)
+        try:
+            # Check again now that new events will reach us, then wait for one
+            events = await sync_to_async(fetch_events)(user.id, after, delivered)
+            if not events:
+                try:
+                    await asyncio.wait_for(subscription.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    events = await sync_to_async(fetch_events)(user.id, after, delivered)
+        finally:
+            hub.unsubscribe(subscription)
+    cursor = await sync_to_async(next_cursor)(user.id, after, delivered, events)
+    return JsonResponse({'events': events, 'cursor': cursor})
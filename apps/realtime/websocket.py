@@ -0,0 +1,102 @@
+"""
+WebSocket endpoint for push events, as a plain ASGI application (see classifieds/asgi.py).
+
+Clients connect to /ws/?token=<JWT access token>[&after=<event id>] and receive
+one JSON text frame per event: {"id": ..., "type": "message" | "read" |
+"notification", "data": {...}}. With `after`, missed events are sent first;
+these include the last few seconds of events below `after` (one may have
+committed late), so clients skip ids they already have.
+A text frame "ping" is answered with "pong".
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .events import catch_up_events
+from .hub import LATE_COMMIT_WINDOW, hub
+
+WEBSOCKET_PATH = '/ws/'
+# Close codes (4000-4999 are free for applications)
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+# Seconds a sent event id is remembered, to drop the hub's copy of a caught-up event
+SENT_MEMORY = 2 * LATE_COMMIT_WINDOW + 1
+
+
+def user_for_token(token):
+    """The active user a JWT access token belongs to, or None"""
+    if not token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _cursor(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+async def websocket_application(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if scope['path'] != WEBSOCKET_PATH:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    user = await sync_to_async(user_for_token)(params.get('token', [None])[0])
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    await send({'type': 'websocket.accept'})
+
+    async def push(event):
+        await send({'type': 'websocket.send', 'text': json.dumps(event, cls=DjangoJSONEncoder)})
+
+    # Event id -> when it was sent: catch-up and hub can both hand over an event
+    sent = {}
+
+    async def push_once(event):
+        now = time.monotonic()
+        for event_id in [event_id for event_id, at in sent.items() if now - at > SENT_MEMORY]:
+            del sent[event_id]
+        if event['id'] not in sent:
+            sent[event['id']] = now
+            await push(event)
+
+    # Subscribe before catching up so nothing falls in between; skip what was already sent
+    subscription = hub.subscribe(user.id)
+    after = _cursor(params.get('after', [None])[0])
+    receiving = asyncio.ensure_future(receive())
+    getting = asyncio.ensure_future(subscription.queue.get())
+    try:
+        if after is not None:
+            for event in await sync_to_async(catch_up_events)(user.id, after):
+                await push_once(event)
+        while True:
+            done, _ = await asyncio.wait({receiving, getting}, return_when=asyncio.FIRST_COMPLETED)
+            if getting in done:
+                await push_once(getting.result())
+                getting = asyncio.ensure_future(subscription.queue.get())
+            if receiving in done:
+                message = receiving.result()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message.get('text') == 'ping':
+                    await send({'type': 'websocket.send', 'text': 'pong'})
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        hub.unsubscribe(subscription)
+        receiving.cancel()
+        getting.cancel()
@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.payments.models import Package, Payment
+from apps.products.models import Category, Product
+
+
+class ReviewCreationTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.buyer = User.objects.create(username="buyer")
+        seller = User.objects.create(username="seller")
+        self.product = Product.objects.create(
+            title="Casio calculator", description="Scientific", price=250, condition="used",
+            category=Category.objects.create(name="Calculators"), seller=seller, status="active",
+        )
+        self.package = Package.objects.create(name="Basic", price=100, duration_in_days=30, ad_limit=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def _review(self):
+        return self.client.post(reverse("review-list"), {"product": self.product.id, "rating": 5})
+
+    def test_review_requires_a_completed_payment(self):
+        Payment.objects.create(user=self.buyer, package=self.package, amount=100, status="pending")
+        self.assertEqual(self._review().status_code, 403)
+
+        Payment.objects.create(user=self.buyer, package=self.package, amount=100, status="completed")
+        response = self._review()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["seller"], self.product.seller_id)
@@ -1,4 +1,5 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from .models import Review
 from .serializers import ReviewSerializer
@@ -17,12 +18,12 @@ class ReviewViewSet(viewsets.ModelViewSet):
         product = serializer.validated_data.get('product')
 
         # Check purchase: because ERD lacks Order model, we'll treat a "purchase" as existence of a Payment
-        # by the user and status 'active' AND optionally the product seller != user.
+        # by the user with status 'completed' AND optionally the product seller != user.
         # If you want a stricter purchase model, consider adding a Purchase/Order model.
-        has_active_payment = Payment.objects.filter(user=user, status='active').exists()
+        has_active_payment = Payment.objects.filter(user=user).completed().exists()
         if not has_active_payment:
             # Deny creation - user hasn't purchased a package (required by business rule to post reviews)
-            raise permissions.PermissionDenied('You can only review a product after purchasing a package (no active payments found).')
+            raise PermissionDenied('You can only review a product after purchasing a package (no active payments found).')
 
         # Save reviewer and seller
         serializer.save(reviewer=user, seller=product.seller)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ContactMessage
+from .models import ContactMessage, SupportTicket
 
 @admin.register(ContactMessage)
 class ContactMessageAdmin(admin.ModelAdmin):
@@ -7,3 +7,12 @@ class ContactMessageAdmin(admin.ModelAdmin):
     list_filter = ('subject', 'is_resolved', 'created_at')
     search_fields = ('email', 'first_name', 'last_name', 'message')
     readonly_fields = ('created_at',)
+
+@admin.register(SupportTicket)
+class SupportTicketAdmin(admin.ModelAdmin):
+    list_display = ('id', 'priority', 'issue_type', 'status', 'user', 'source', 'created_at')
+    list_filter = ('status', 'priority', 'issue_type', 'source')
+    search_fields = ('summary', 'original_message', 'user__username')
+    list_select_related = ('user',)
+    readonly_fields = ('created_at', 'updated_at')
+    ordering = ('priority', 'created_at')
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupportTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('chatbot', 'Chatbot')], default='chatbot', max_length=20, verbose_name='Source')),
+                ('issue_type', models.CharField(choices=[('technical_bug', 'Technical Bug'), ('payment_issue', 'Payment Issue'), ('account_problem', 'Account Problem'), ('product_complaint', 'Product Complaint'), ('seller_dispute', 'Seller Dispute'), ('feature_request', 'Feature Request'), ('other', 'Other')], default='other', max_length=30, verbose_name='Issue Type')),
+                ('priority', models.PositiveSmallIntegerField(choices=[(1, 'High'), (2, 'Medium'), (3, 'Low')], default=2, verbose_name='Priority')),
+                ('status', models.CharField(choices=[('open', 'Open'), ('in_progress', 'In Progress'), ('resolved', 'Resolved')], default='open', max_length=20, verbose_name='Status')),
+                ('summary', models.TextField(verbose_name='Summary')),
+                ('original_message', models.TextField(blank=True, verbose_name='Original Message')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='support_tickets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Support Ticket',
+                'verbose_name_plural': 'Support Tickets',
+                'ordering': ['priority', 'created_at'],
+                'indexes': [models.Index(fields=['status', 'priority', 'created_at'], name='support_ticket_queue_idx')],
+            },
+        ),
+    ]
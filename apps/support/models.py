@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -24,3 +25,57 @@ class ContactMessage(models.Model):
 
     def __str__(self):
         return f"{self.subject} - {self.email}"
+
+
+class SupportTicket(models.Model):
+    """An issue handed to human support, e.g. escalated by the chatbot"""
+    PRIORITY_HIGH = 1
+    PRIORITY_MEDIUM = 2
+    PRIORITY_LOW = 3
+    # Lower value = more urgent, so the admin queue sorts by (priority, created_at)
+    PRIORITY_CHOICES = [
+        (PRIORITY_HIGH, 'High'),
+        (PRIORITY_MEDIUM, 'Medium'),
+        (PRIORITY_LOW, 'Low'),
+    ]
+    ISSUE_TYPE_CHOICES = [
+        ('technical_bug', 'Technical Bug'),
+        ('payment_issue', 'Payment Issue'),
+        ('account_problem', 'Account Problem'),
+        ('product_complaint', 'Product Complaint'),
+        ('seller_dispute', 'Seller Dispute'),
+        ('feature_request', 'Feature Request'),
+        ('other', 'Other'),
+    ]
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('in_progress', 'In Progress'),
+        ('resolved', 'Resolved'),
+    ]
+    SOURCE_CHOICES = [
+        ('chatbot', 'Chatbot'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='support_tickets'
+    )
+    source = models.CharField(_("Source"), max_length=20, choices=SOURCE_CHOICES, default='chatbot')
+    issue_type = models.CharField(_("Issue Type"), max_length=30, choices=ISSUE_TYPE_CHOICES, default='other')
+    priority = models.PositiveSmallIntegerField(_("Priority"), choices=PRIORITY_CHOICES, default=PRIORITY_MEDIUM)
+    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default='open')
+    summary = models.TextField(_("Summary"))
+    original_message = models.TextField(_("Original Message"), blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Support Ticket")
+        verbose_name_plural = _("Support Tickets")
+        ordering = ['priority', 'created_at']
+        indexes = [
+            # Admin queue: tickets of one status, most urgent and oldest first
+            models.Index(fields=['status', 'priority', 'created_at'], name='support_ticket_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_issue_type_display()} ({self.get_priority_display()})"
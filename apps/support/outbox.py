@@ -0,0 +1,91 @@
+"""
+After-response write path for support tickets.
+
+Callers that must not wait on the database or on notifying the admins (the
+chatbot's escalate_to_supervisor tool) hand the ticket to enqueue_ticket().
+It is written by a small per-process worker pool once the caller's transaction
+commits, and every staff user then gets a notification for it.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+
+from apps.notifications.models import Notification
+from .models import SupportTicket
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKERS = getattr(settings, 'SUPPORT_OUTBOX_WORKERS', 2)
+# Write in the background; False writes inline (tests, management commands)
+OUTBOX_ASYNC = getattr(settings, 'SUPPORT_OUTBOX_ASYNC', True)
+
+PRIORITIES = {
+    'high': SupportTicket.PRIORITY_HIGH,
+    'medium': SupportTicket.PRIORITY_MEDIUM,
+    'low': SupportTicket.PRIORITY_LOW,
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Per-process outbox worker pool (recreated after a fork)"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=OUTBOX_WORKERS, thread_name_prefix='support-outbox')
+                _executor_pid = pid
+    return _executor
+
+
+def create_ticket(fields):
+    """Save a ticket and notify every staff user about it"""
+    ticket = SupportTicket.objects.create(**fields)
+    staff = get_user_model().objects.filter(is_staff=True, is_active=True).values_list('id', flat=True)
+    for staff_id in staff:
+        # One by one (not bulk_create) so each notification is pushed to the admin's clients
+        Notification.objects.create(
+            user_id=staff_id,
+            notification_type='system',
+            title=f'New {ticket.get_priority_display().lower()} priority support ticket',
+            message=f'#{ticket.pk} {ticket.get_issue_type_display()}: {ticket.summary}',
+        )
+    return ticket
+
+
+def _write(fields):
+    try:
+        create_ticket(fields)
+    except Exception:
+        logger.exception(f"Could not save support ticket: {fields}")
+    finally:
+        # Worker threads get their own DB connections; don't leave them open
+        connections.close_all()
+
+
+def enqueue_ticket(user, issue_type, priority, summary, original_message=''):
+    """
+    Queue a support ticket for writing after the current transaction commits.
+    Returns at once; `user` may be None for anonymous visitors.
+    """
+    fields = {
+        'user_id': user.id if user is not None else None,
+        'source': 'chatbot',
+        'issue_type': issue_type if issue_type in dict(SupportTicket.ISSUE_TYPE_CHOICES) else 'other',
+        'priority': PRIORITIES.get(priority, SupportTicket.PRIORITY_MEDIUM),
+        'summary': summary,
+        'original_message': original_message,
+    }
+    if OUTBOX_ASYNC:
+        transaction.on_commit(lambda: _get_executor().submit(_write, fields))
+    else:
+        transaction.on_commit(lambda: create_ticket(fields))
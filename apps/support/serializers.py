@@ -1,8 +1,20 @@
 from rest_framework import serializers
-from .models import ContactMessage
+from .models import ContactMessage, SupportTicket
 
 class ContactMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContactMessage
         fields = ['id', 'first_name', 'last_name', 'email', 'subject', 'message', 'created_at', 'is_resolved']
         read_only_fields = ['id', 'created_at']
+
+class SupportTicketSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+    priority_label = serializers.CharField(source='get_priority_display', read_only=True)
+
+    class Meta:
+        model = SupportTicket
+        fields = [
+            'id', 'user', 'username', 'source', 'issue_type', 'priority', 'priority_label', 'status',
+            'summary', 'original_message', 'created_at', 'updated_at',
+        ]
+        read_only_fields = ['id', 'user', 'source', 'original_message', 'created_at', 'updated_at']
@@ -1,3 +1,63 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.chatbot.client import reset_llm_client
+from apps.notifications.models import Notification
+from . import outbox
+from .models import SupportTicket
+
+
+@override_settings(
+    CHATBOT_LLM_BACKEND="mock",
+    CHATBOT_MOCK_LATENCY={"completion": 0, "chunk": 0, "transcription": 0, "speech": 0},
+)
+class ChatbotEscalationTests(TestCase):
+    def setUp(self):
+        reset_llm_client()
+        self.addCleanup(reset_llm_client)
+        self.admin = get_user_model().objects.create(username="admin", is_staff=True)
+
+    def test_escalation_is_saved_after_the_response(self):
+        with mock.patch.object(outbox, "_get_executor") as executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("chatbot"), {"message": "I want to talk to a supervisor"})
+            self.assertEqual(response.status_code, 200)
+            # Nothing is written while the reply is produced
+            self.assertFalse(SupportTicket.objects.exists())
+        executor.return_value.submit.assert_called_once()
+        write, fields = executor.return_value.submit.call_args.args
+
+        with mock.patch.object(outbox, "connections"):
+            write(fields)
+        ticket = SupportTicket.objects.get()
+        self.assertEqual(ticket.source, "chatbot")
+        self.assertEqual(ticket.original_message, "I want to talk to a supervisor")
+        notification = Notification.objects.get(user=self.admin)
+        self.assertIn(f"#{ticket.pk}", notification.message)
+
+
+class SupportTicketQueueTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create(username="admin", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_queue_is_sorted_by_priority_then_age(self):
+        low = SupportTicket.objects.create(summary="low", priority=SupportTicket.PRIORITY_LOW, user=self.admin)
+        old_high = SupportTicket.objects.create(summary="old high", priority=SupportTicket.PRIORITY_HIGH)
+        new_high = SupportTicket.objects.create(summary="new high", priority=SupportTicket.PRIORITY_HIGH)
+        SupportTicket.objects.create(summary="done", status="resolved")
+
+        with self.assertNumQueries(2):  # count + page, users joined in
+            response = self.client.get(reverse("support-ticket-queue"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t["id"] for t in response.data["results"]], [old_high.id, new_high.id, low.id])
+        self.assertEqual(response.data["results"][2]["username"], "admin")
+
+    def test_queue_is_admin_only(self):
+        self.client.force_authenticate(get_user_model().objects.create(username="student"))
+        self.assertEqual(self.client.get(reverse("support-ticket-queue")).status_code, 403)
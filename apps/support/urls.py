@@ -1,8 +1,13 @@
 from django.urls import path
-from .views import ContactMessageCreateView, ContactMessageAdminView, ContactMessageDetailView
+from .views import (
+    ContactMessageCreateView, ContactMessageAdminView, ContactMessageDetailView,
+    SupportTicketQueueView, SupportTicketDetailView,
+)
 
 urlpatterns = [
     path('contact/', ContactMessageCreateView.as_view(), name='contact-create'),
     path('contact/admin/', ContactMessageAdminView.as_view(), name='contact-list-admin'),
     path('contact/admin/<int:pk>/', ContactMessageDetailView.as_view(), name='contact-detail-admin'),
+    path('support/tickets/admin/', SupportTicketQueueView.as_view(), name='support-ticket-queue'),
+    path('support/tickets/admin/<int:pk>/', SupportTicketDetailView.as_view(), name='support-ticket-detail'),
 ]
@@ -1,7 +1,7 @@
 from rest_framework import generics
 from rest_framework.permissions import AllowAny, IsAdminUser
-from .models import ContactMessage
-from .serializers import ContactMessageSerializer
+from .models import ContactMessage, SupportTicket
+from .serializers import ContactMessageSerializer, SupportTicketSerializer
 
 class ContactMessageCreateView(generics.CreateAPIView):
     queryset = ContactMessage.objects.all()
@@ -30,3 +30,29 @@ class ContactMessageDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = ContactMessage.objects.all()
     serializer_class = ContactMessageSerializer
     permission_classes = [IsAdminUser]
+
+class SupportTicketQueueView(generics.ListAPIView):
+    """
+    Admin-only support queue: tickets of one status (?status=, default open),
+    most urgent first, oldest first within a priority.
+    """
+    serializer_class = SupportTicketSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        status = self.request.query_params.get('status', 'open')
+        # Served by the (status, priority, created_at) index
+        return (
+            SupportTicket.objects
+            .filter(status=status)
+            .select_related('user')
+            .order_by('priority', 'created_at')
+        )
+
+class SupportTicketDetailView(generics.RetrieveUpdateAPIView):
+    """
+    Admin-only view to retrieve or update (assign a status) a support ticket.
+    """
+    queryset = SupportTicket.objects.select_related('user')
+    serializer_class = SupportTicketSerializer
+    permission_classes = [IsAdminUser]
@@ -1,4 +1,15 @@
 import os
 from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'classifieds.settings')
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from apps.realtime.websocket import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Django for HTTP; WebSocket connections go to the push endpoint (/ws/)"""
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'apps.chatbot',
     'apps.wishlist',
     'apps.support.apps.SupportConfig',
+    'apps.realtime',
 ]
 
 # Add storages app when using cloud storage
@@ -155,6 +156,12 @@ GS_BUCKET_NAME = os.environ.get('GS_BUCKET_NAME')
 import os
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Optional override, e.g. a local stand-in server for tests and load testing
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+# "openai", or "mock" for the offline deterministic backend (demos, load tests)
+CHATBOT_LLM_BACKEND = os.getenv("CHATBOT_LLM_BACKEND", "openai")
 
 AUTH_USER_MODEL = 'users.User'
 
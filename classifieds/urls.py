@@ -42,6 +42,7 @@ urlpatterns = [
     path("api/", include("apps.chatbot.urls")),
     path('api/', include('apps.wishlist.urls')),
     path('api/', include('apps.support.urls')),
+    path('api/', include('apps.realtime.urls')),
     # Swagger
     path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),  # ✅
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),